@@ -0,0 +1,180 @@
+"""
+BB84 quantum key distribution engine for an ideal (noise-free) channel.
+
+Bits and bases are uint8 arrays (basis 0 = rectilinear "z"/"+", 1 = diagonal "x").
+Measurement is a vectorized draw: Bob reads Alice's bit where the bases agree
+and a uniformly random bit where they differ, which is exactly what the
+circuit simulation produces. Other simulators (e.g. Qiskit) plug in through
+the lazy backend registry.
+
+Author: LunaLynx12
+"""
+
+import numpy as np
+import importlib
+import os
+import config
+
+
+def random_bits(n: int) -> np.ndarray:
+    """
+    Draws n uniformly random bits from the OS CSPRNG.
+
+    param n: Number of bits
+    type n: int
+    return: uint8 array of 0/1 values
+    rtype: np.ndarray
+    """
+    return np.unpackbits(np.frombuffer(os.urandom((n + 7) // 8), dtype=np.uint8))[:n]
+
+
+def random_bases(n: int) -> np.ndarray:
+    """
+    Draws n uniformly random measurement bases (0 = z, 1 = x).
+    """
+    return random_bits(n)
+
+
+def bits_from_str(bits: str) -> np.ndarray:
+    """
+    Converts a string of '0'/'1' characters into a uint8 bit array.
+    """
+    return (np.frombuffer(bits.encode("ascii"), dtype=np.uint8) == ord("1")).astype(np.uint8)
+
+
+def bases_from_str(bases: str) -> np.ndarray:
+    """
+    Converts a basis string into a uint8 array. 'x' is the diagonal basis,
+    any other symbol ('z', '+') is the rectilinear one.
+    """
+    return (np.frombuffer(bases.encode("ascii"), dtype=np.uint8) == ord("x")).astype(np.uint8)
+
+
+def bits_to_str(bits: np.ndarray) -> str:
+    """
+    Converts a bit array back into a string of '0'/'1' characters.
+    """
+    return np.where(bits.astype(bool), ord("1"), ord("0")).astype(np.uint8).tobytes().decode("ascii")
+
+
+def bases_to_str(bases: np.ndarray, symbols: str = "zx") -> str:
+    """
+    Converts a basis array back into a string using symbols[0] for the
+    rectilinear and symbols[1] for the diagonal basis.
+    """
+    table = np.frombuffer(symbols.encode("ascii"), dtype=np.uint8)
+    return table[bases.astype(np.intp)].tobytes().decode("ascii")
+
+
+def _measure_numpy(alice_bits: np.ndarray, alice_bases: np.ndarray, bob_bases: np.ndarray) -> np.ndarray:
+    mismatch = alice_bases != bob_bases
+    return np.where(mismatch, random_bits(len(alice_bits)), alice_bits).astype(np.uint8)
+
+
+# Measurement backends: name -> callable or lazy "module:function" reference.
+# String references are imported on first use, so heavy simulators (qiskit)
+# never load unless a backend that needs them is actually selected.
+_BACKENDS = {
+    "numpy": _measure_numpy,
+    "qiskit": "bb84_qiskit:measure",
+}
+
+
+def register_backend(name: str, target) -> None:
+    """
+    Registers a measurement backend.
+
+    param name: Name used in config.bb84_backend or measure(backend=...)
+    type name: str
+    param target: Callable (alice_bits, alice_bases, bob_bases) -> bits, or a
+        "module:function" string that is imported lazily on first use
+    type target: Callable | str
+    """
+    _BACKENDS[name] = target
+
+
+def get_backend(name: str):
+    """
+    Resolves a backend by name, importing it if it is still a lazy reference.
+
+    raises ValueError: If no backend is registered under name
+    """
+    target = _BACKENDS.get(name)
+    if target is None:
+        raise ValueError(f"Unknown BB84 backend: {name}")
+    if isinstance(target, str):
+        module_name, _, attr = target.partition(":")
+        target = getattr(importlib.import_module(module_name), attr)
+        _BACKENDS[name] = target
+    return target
+
+
+def available_backends() -> dict:
+    """
+    Returns every registered backend and whether it has been loaded yet.
+    """
+    return {name: not isinstance(target, str) for name, target in _BACKENDS.items()}
+
+
+def measure(alice_bits: np.ndarray, alice_bases: np.ndarray, bob_bases: np.ndarray, backend: str = None) -> np.ndarray:
+    """
+    Returns the bits Bob reads when measuring Alice's photons in his bases.
+
+    param backend: "numpy" (default from config.bb84_backend) or "qiskit"
+    type backend: str
+    return: uint8 array of measured bits
+    rtype: np.ndarray
+    raises ValueError: If the arrays differ in length or the backend is unknown
+    """
+    if not (len(alice_bits) == len(alice_bases) == len(bob_bases)):
+        raise ValueError("Bits and bases must have the same length")
+
+    return get_backend(backend or config.bb84_backend)(alice_bits, alice_bases, bob_bases)
+
+
+def sift(alice_bases: np.ndarray, bob_bases: np.ndarray, measured_bits: np.ndarray) -> np.ndarray:
+    """
+    Keeps the measured bits where Alice's and Bob's bases agree.
+    """
+    return measured_bits[alice_bases == bob_bases]
+
+
+def pack_key(sifted_bits: np.ndarray, length_bits: int = None) -> bytes:
+    """
+    Packs sifted bits into bytes (MSB first). When length_bits is given only
+    that many leading bits are used.
+
+    raises ValueError: If fewer than length_bits bits were sifted
+    """
+    if length_bits is not None:
+        if len(sifted_bits) < length_bits:
+            raise ValueError(f"Only {len(sifted_bits)} sifted bits, {length_bits} needed")
+        sifted_bits = sifted_bits[:length_bits]
+    return np.packbits(sifted_bits).tobytes()
+
+
+def simulate_exchange(n: int, backend: str = None) -> dict:
+    """
+    Runs a full BB84 exchange with random bits and bases for both parties.
+
+    param n: Number of raw qubits sent by Alice
+    type n: int
+    return: Dict with alice_bits, alice_bases, bob_bases, measured_bits and
+        sifted_key arrays and the packed shared_key bytes
+    rtype: dict
+    """
+    alice_bits = random_bits(n)
+    alice_bases = random_bases(n)
+    bob_bases = random_bases(n)
+
+    measured_bits = measure(alice_bits, alice_bases, bob_bases, backend)
+    sifted_key = sift(alice_bases, bob_bases, measured_bits)
+
+    return {
+        "alice_bits": alice_bits,
+        "alice_bases": alice_bases,
+        "bob_bases": bob_bases,
+        "measured_bits": measured_bits,
+        "sifted_key": sifted_key,
+        "shared_key": pack_key(sifted_key),
+    }
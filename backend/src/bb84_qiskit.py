@@ -0,0 +1,43 @@
+"""
+Qiskit circuit-simulation backend for the BB84 engine.
+
+Imported lazily through bb84.get_backend("qiskit") - qiskit, scipy and sympy
+are only loaded by workers that actually select this backend.
+
+Author: LunaLynx12
+"""
+
+import numpy as np
+from qiskit import QuantumCircuit, Aer, execute
+from bb84 import bits_from_str
+
+
+def measure(alice_bits: np.ndarray, alice_bases: np.ndarray, bob_bases: np.ndarray) -> np.ndarray:
+    """
+    Builds the BB84 circuit for one exchange and simulates Bob's measurement.
+
+    return: uint8 array of measured bits
+    rtype: np.ndarray
+    """
+    n = len(alice_bits)
+    qc = QuantumCircuit(n, n)
+
+    # Alice prepares her qubits
+    for i in range(n):
+        if alice_bits[i]:
+            qc.x(i)
+        if alice_bases[i]:
+            qc.h(i)
+
+    # Bob measures
+    for i in range(n):
+        if bob_bases[i]:
+            qc.h(i)
+
+    qc.measure(range(n), range(n))
+
+    simulator = Aer.get_backend("qasm_simulator")
+    result = execute(qc, simulator, shots=1).result()
+    counts = result.get_counts(qc)
+    measured_bits = list(counts.keys())[0][::-1]  # Reverse for Qiskit endianness
+    return bits_from_str(measured_bits)
@@ -0,0 +1,201 @@
+"""
+Session-scoped storage for BB84 exchanges submitted through /quantum.
+
+Each Alice/Bob exchange lives under its own session id, so any number of
+pairs can run at once. Sessions expire after a TTL and the in-memory store
+is bounded; an SQLite-backed store can be selected to share sessions
+between workers.
+
+Author: LunaLynx12
+"""
+
+from collections import OrderedDict
+from pathlib import Path
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import config
+from utils.executor import run_in_thread
+
+
+class MemorySessionStore:
+    """
+    Bounded in-memory store with TTL eviction.
+
+    Sessions are kept in an OrderedDict ordered by last write, so expired and
+    least recently written sessions are always at the front.
+    """
+
+    def __init__(self, max_sessions: int, ttl: float):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()
+        self.evicted = 0
+
+    def _purge(self):
+        now = time.monotonic()
+        while self._sessions:
+            session_id, (expires, _) = next(iter(self._sessions.items()))
+            if expires > now and len(self._sessions) <= self.max_sessions:
+                break
+            del self._sessions[session_id]
+            self.evicted += 1
+
+    async def get(self, session_id: str):
+        self._purge()
+        entry = self._sessions.get(session_id)
+        return dict(entry[1]) if entry else None
+
+    async def put(self, session_id: str, data: dict):
+        self._sessions.pop(session_id, None)
+        self._sessions[session_id] = (time.monotonic() + self.ttl, dict(data))
+        self._purge()
+
+    async def delete(self, session_id: str):
+        self._sessions.pop(session_id, None)
+
+    async def metrics(self) -> dict:
+        self._purge()
+        return {
+            "backend": "memory",
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "ttl_s": self.ttl,
+            "evicted": self.evicted,
+        }
+
+
+class SQLiteSessionStore:
+    """
+    SQLite-backed store, shareable between worker processes on one host.
+    Queries run on the thread pool.
+    """
+
+    def __init__(self, path: str, max_sessions: int, ttl: float):
+        self.path = path
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS bb84_session ("
+            "id TEXT PRIMARY KEY, data TEXT NOT NULL, expires REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_bb84_session_expires ON bb84_session (expires)")
+
+    def _get(self, session_id: str):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM bb84_session WHERE id = ? AND expires > ?", (session_id, time.time())
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _put(self, session_id: str, data: dict):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO bb84_session (id, data, expires) VALUES (?, ?, ?)",
+                (session_id, json.dumps(data), now + self.ttl)
+            )
+            self._conn.execute("DELETE FROM bb84_session WHERE expires <= ?", (now,))
+            # Keep only the max_sessions most recently written sessions
+            self._conn.execute(
+                "DELETE FROM bb84_session WHERE id IN ("
+                "SELECT id FROM bb84_session ORDER BY expires DESC LIMIT -1 OFFSET ?)",
+                (self.max_sessions,)
+            )
+
+    def _delete(self, session_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM bb84_session WHERE id = ?", (session_id,))
+
+    async def get(self, session_id: str):
+        return await run_in_thread(self._get, session_id)
+
+    async def put(self, session_id: str, data: dict):
+        await run_in_thread(self._put, session_id, data)
+
+    async def delete(self, session_id: str):
+        await run_in_thread(self._delete, session_id)
+
+    def _count(self) -> int:
+        with self._lock:
+            (count,) = self._conn.execute(
+                "SELECT COUNT(*) FROM bb84_session WHERE expires > ?", (time.time(),)
+            ).fetchone()
+        return count
+
+    async def metrics(self) -> dict:
+        return {
+            "backend": "sqlite",
+            "sessions": await run_in_thread(self._count),
+            "max_sessions": self.max_sessions,
+            "ttl_s": self.ttl,
+        }
+
+
+def create_session_store():
+    """
+    Builds the store selected by config.bb84_session_store ("memory" or "sqlite").
+    """
+    if config.bb84_session_store == "sqlite":
+        path = Path(config.database_location) / config.bb84_session_db_name
+        return SQLiteSessionStore(str(path), config.bb84_session_max, config.bb84_session_ttl)
+    return MemorySessionStore(config.bb84_session_max, config.bb84_session_ttl)
+
+
+# Events pushed to Alice and Bob while an exchange progresses
+SESSION_EVENTS = ("alice_submitted", "bob_submitted", "key_ready")
+
+
+def session_events(session: dict) -> list[str]:
+    """
+    Returns the events that have already happened in a session's state.
+    """
+    if not session or "alice_bits" not in session:
+        return []
+    if "bob_bases" not in session:
+        return ["alice_submitted"]
+    return list(SESSION_EVENTS)
+
+
+class SessionNotifier:
+    """
+    In-process fan-out of session events to waiting long-polls and WebSockets.
+
+    Subscribers also re-read the store every config.bb84_notify_recheck
+    seconds, so events written by another worker (SQLite store) are picked
+    up with bounded delay.
+    """
+
+    def __init__(self):
+        self._subscribers = {}
+
+    def subscribe(self, session_id: str):
+        queue = asyncio.Queue()
+        self._subscribers.setdefault(session_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, session_id: str, queue) -> None:
+        subscribers = self._subscribers.get(session_id)
+        if subscribers is not None:
+            subscribers.discard(queue)
+            if not subscribers:
+                del self._subscribers[session_id]
+
+    def publish(self, session_id: str, *events: str) -> None:
+        for queue in self._subscribers.get(session_id, ()):
+            for event in events:
+                queue.put_nowait(event)
+
+    def metrics(self) -> dict:
+        return {
+            "sessions_watched": len(self._subscribers),
+            "subscribers": sum(len(queues) for queues in self._subscribers.values()),
+        }
+
+
+notifier = SessionNotifier()
@@ -0,0 +1,290 @@
+"""
+Content-addressed, reference-counted blob store for the drive.
+
+Encrypted files live at drive_location/blobs/ab/cd/<sha256 of ciphertext>,
+shared by every File row with that content_hash; Blob.refcount counts them
+and a blob is unlinked when its last row is released. New blobs are written
+to blobs/tmp first and renamed into place, so a half-written upload is never
+visible under its address.
+
+With drive_convergent_encryption the file key and nonce prefix are derived
+from the plaintext (keyed per tenant = owning account), so identical content
+uploaded again by the same account maps to the same blob and is not
+encrypted or written a second time.
+
+Author: LunaLynx12
+"""
+
+from pathlib import Path
+from tempfile import SpooledTemporaryFile
+from tortoise.expressions import F
+from tortoise.exceptions import IntegrityError
+from tortoise.transactions import in_transaction
+from encryption import stream_header, encrypt_segment, derive_key2, STREAM_PREFIX_SIZE, TAG_SIZE
+from models import Blob
+from utils.executor import run_in_thread
+import hashlib
+import hmac
+import os
+import secrets
+import uuid
+import config
+
+
+def blob_root() -> Path:
+    return Path(config.drive_location) / config.drive_blob_dir
+
+
+def staging_path(name: str) -> Path:
+    """
+    Where a blob is written before publish() moves it under its address.
+    """
+    return blob_root() / "tmp" / name
+
+
+def upload_staging_path(upload_id) -> Path:
+    """
+    Stream file of a resumable upload (UploadSession) until it is committed.
+    """
+    return staging_path(f"upload-{upload_id}")
+
+
+def blob_path(content_hash: str) -> Path:
+    """
+    Sharded location of a blob: blobs/<2 hex>/<2 hex>/<hash>.
+    """
+    return blob_root() / content_hash[:2] / content_hash[2:4] / content_hash
+
+
+async def segments(chunks, segment_size: int):
+    """
+    Regroups an async stream of arbitrarily sized chunks into fixed-size
+    segments. Only the last segment may be shorter.
+    """
+    buffer = bytearray()
+    async for chunk in chunks:
+        buffer += chunk
+        while len(buffer) >= segment_size:
+            yield bytes(buffer[:segment_size])
+            del buffer[:segment_size]
+    if buffer:
+        yield bytes(buffer)
+
+
+def _seal_record(out, digest, file_key: bytes, header: bytes, index: int, segment: bytes, final: bool) -> bytes:
+    record = encrypt_segment(file_key, header, index, segment, final)
+    out.write(record)
+    digest.update(record)
+    return record
+
+
+async def write_encrypted(chunks, file_key: bytes, file_path: Path, nonce_prefix: bytes = None):
+    """
+    Encrypts an async stream of plaintext chunks segment by segment and
+    writes every record to disk as soon as it is sealed, so memory use stays
+    at one segment whatever the file size. Sealing and writing run on the
+    thread pool.
+
+    return: Tuple of plaintext size, SHA-256 of the ciphertext, stream header
+    and tag of the final record
+    """
+    header = stream_header(config.drive_segment_size, nonce_prefix)
+    digest = hashlib.sha256(header)
+    size = 0
+    index = 0
+    pending = None
+
+    out = await run_in_thread(open, file_path, "wb")
+    try:
+        await run_in_thread(out.write, header)
+        # Hold one segment back so the last one can be sealed as final
+        async for segment in segments(chunks, config.drive_segment_size):
+            if pending is not None:
+                await run_in_thread(_seal_record, out, digest, file_key, header, index, pending, False)
+                index += 1
+            pending = segment
+            size += len(segment)
+
+        record = await run_in_thread(_seal_record, out, digest, file_key, header, index, pending or b"", True)
+    finally:
+        await run_in_thread(out.close)
+
+    return size, digest.hexdigest(), header, record[-TAG_SIZE:]
+
+
+async def _spool(chunks):
+    # Buffers an upload (memory first, then a temp file) while hashing it
+    spool = SpooledTemporaryFile(max_size=config.drive_spool_memory)
+    digest = hashlib.sha256()
+    async for chunk in chunks:
+        digest.update(chunk)
+        await run_in_thread(spool.write, chunk)
+    await run_in_thread(spool.seek, 0)
+    return spool, digest.digest()
+
+
+async def _replay(spool):
+    try:
+        while chunk := await run_in_thread(spool.read, config.drive_segment_size):
+            yield chunk
+    finally:
+        spool.close()
+
+
+def _convergent_keys(tenant_id: int, plaintext_digest: bytes) -> tuple[bytes, bytes, str]:
+    """
+    return: (file key, nonce prefix, convergent id) for a plaintext of one tenant
+    """
+    tenant_key = derive_key2(config.drive_convergent_secret, info=f"SafeQ convergent tenant {tenant_id}".encode())
+    file_key = hmac.new(tenant_key, b"key" + plaintext_digest, hashlib.sha256).digest()
+    nonce_prefix = hmac.new(file_key, b"nonce", hashlib.sha256).digest()[:STREAM_PREFIX_SIZE]
+    convergent_id = hmac.new(tenant_key, b"id" + plaintext_digest, hashlib.sha256).hexdigest()
+    return file_key, nonce_prefix, convergent_id
+
+
+async def _claim(blob: Blob) -> bool:
+    # Takes a reference unless a concurrent release already dropped the blob
+    claimed = await Blob.filter(id=blob.id, refcount__gt=0).update(refcount=F("refcount") + 1)
+    if claimed:
+        blob.refcount += 1
+    return bool(claimed)
+
+
+async def publish(temp_path: Path, size: int, content_hash: str, header: bytes, last_tag: bytes,
+                   convergent_id: str = None) -> Blob:
+    """
+    Moves a fully written stream from blobs/tmp under its address, or drops
+    it when that content is already stored.
+
+    return: Blob holding one new reference
+    rtype: Blob
+    """
+    existing = await Blob.get_or_none(content_hash=content_hash)
+    if existing is not None and await _claim(existing):
+        await run_in_thread(os.remove, temp_path)
+        return existing
+
+    final_path = blob_path(content_hash)
+    await run_in_thread(final_path.parent.mkdir, parents=True, exist_ok=True)
+    await run_in_thread(os.replace, temp_path, final_path)
+    try:
+        return await Blob.create(
+            content_hash=content_hash,
+            convergent_id=convergent_id,
+            path=str(final_path),
+            size=size,
+            nonce=header[-STREAM_PREFIX_SIZE:],
+            tag=last_tag,
+            refcount=1,
+        )
+    except IntegrityError:
+        # Lost a race with an identical upload; its row owns the same file
+        existing = await Blob.get(content_hash=content_hash)
+        await Blob.filter(id=existing.id).update(refcount=F("refcount") + 1)
+        return existing
+
+
+async def store(tenant_id: int, chunks) -> tuple[Blob, bytes]:
+    """
+    Encrypts an upload into the blob store, or references the existing blob
+    when convergent encryption finds the same content already stored.
+
+    param tenant_id: Owning account; scopes convergent dedup
+    type tenant_id: int
+    param chunks: Async iterable of plaintext chunks
+    return: (blob holding one new reference, file key to wrap for the File row)
+    rtype: tuple[Blob, bytes]
+    """
+    temp_path = staging_path(uuid.uuid4().hex)
+    await run_in_thread(temp_path.parent.mkdir, parents=True, exist_ok=True)
+
+    if not config.drive_convergent_encryption:
+        file_key = secrets.token_bytes(32)  # AES-256 key
+        try:
+            size, content_hash, header, last_tag = await write_encrypted(chunks, file_key, temp_path)
+        except BaseException:
+            await run_in_thread(_discard, temp_path)
+            raise
+        return await publish(temp_path, size, content_hash, header, last_tag), file_key
+
+    spool, plaintext_digest = await _spool(chunks)
+    file_key, nonce_prefix, convergent_id = _convergent_keys(tenant_id, plaintext_digest)
+
+    existing = await Blob.get_or_none(convergent_id=convergent_id)
+    if existing is not None and await _claim(existing):
+        spool.close()
+        return existing, file_key
+
+    try:
+        size, content_hash, header, last_tag = await write_encrypted(_replay(spool), file_key, temp_path, nonce_prefix)
+    except BaseException:
+        await run_in_thread(_discard, temp_path)
+        raise
+    return await publish(temp_path, size, content_hash, header, last_tag, convergent_id), file_key
+
+
+def _discard(path: Path) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def set_aside(paths) -> list[tuple[Path, Path]]:
+    """
+    Moves files that are about to lose their rows to blobs/tmp instead of
+    unlinking them, so a rolled back transaction can put them back. Missing
+    files are skipped.
+
+    return: (original, set-aside) path pairs for restore() or purge()
+    """
+    moved = []
+    for path in paths:
+        if not moved:
+            staging_path("").mkdir(parents=True, exist_ok=True)
+        aside = staging_path(f"trash-{uuid.uuid4().hex}")
+        try:
+            os.replace(path, aside)
+        except FileNotFoundError:
+            continue
+        moved.append((Path(path), aside))
+    return moved
+
+
+def restore(moved) -> None:
+    for path, aside in moved:
+        os.replace(aside, path)
+
+
+def purge(moved) -> None:
+    for _, aside in moved:
+        _discard(aside)
+
+
+async def release(content_hash: str) -> bool:
+    """
+    Drops one reference to a blob and unlinks it when none remain.
+
+    return: False if no blob has this hash (legacy per-user file), else True
+    rtype: bool
+    """
+    moved = []
+    try:
+        async with in_transaction():
+            blob = await Blob.get_or_none(content_hash=content_hash)
+            if blob is None:
+                return False
+            await Blob.filter(id=blob.id).update(refcount=F("refcount") - 1)
+            remaining = (await Blob.filter(id=blob.id).values_list("refcount", flat=True))[0]
+            if remaining <= 0:
+                # Move the file off its address before the row goes, while the
+                # transaction still holds the write lock: a concurrent upload of
+                # the same content can only claim or re-create this blob after
+                # it is gone. It is unlinked once the delete has committed.
+                moved = await run_in_thread(set_aside, [blob.path])
+                await Blob.filter(id=blob.id).delete()
+    except BaseException:
+        await run_in_thread(restore, moved)
+        raise
+    await run_in_thread(purge, moved)
+    return True
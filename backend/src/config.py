@@ -4,16 +4,83 @@ import base64
 server_address = "127.0.0.1"
 server_port = 4000
 server_verbose = True
+log_level = "DEBUG" if server_verbose else "INFO"  # records below this level are dropped
 
 database_name = "SafeQ_Database.db"
 database_location = "E:\\Database"
 
 drive_location = "E:\\Drive"
-drive_thumbnails = "E:\\Thumbnails" #TODO: check_path
+drive_thumbnails = "E:\\Thumbnails"  # encrypted previews, one per file
+thumbnail_size = 256  # longest edge of image thumbnails in pixels (needs Pillow)
+thumbnail_workers = 2  # background preview workers
+thumbnail_queue_size = 1000  # pending preview jobs; uploads beyond this get no preview
+thumbnail_max_source = 20 * 1024 * 1024  # larger images are not decrypted for a thumbnail
+preview_text_bytes = 2048  # leading bytes of text documents kept as their preview
+drive_segment_size = 64 * 1024  # plaintext bytes per AES-GCM record
+drive_blob_dir = "blobs"  # content-addressed blob store, under drive_location
+drive_convergent_encryption = False  # derive file keys from content so identical uploads of one user dedup
+drive_convergent_secret = base64.b64decode("8/JrMBjrz3HsYJIFBJeyCnFDFrp9CdZKYcq70NDbS48=")  # server secret for convergent keys
+drive_spool_memory = 8 * 1024 * 1024  # upload bytes kept in memory while hashing for convergent encryption
+drive_upload_concurrency = 8  # files of one /drive/save request encrypted at the same time
+upload_chunk_segments = 64  # stream segments per resumable-upload chunk (64 x 64 KiB = 4 MiB)
+upload_session_ttl = 24 * 3600  # seconds an unfinished resumable upload is kept
+upload_sweep_interval = 3600  # seconds between sweeps removing expired resumable uploads
+scrub_enabled = True  # background re-hashing of stored ciphertext against its recorded SHA-256
+scrub_rate = 8 * 1024 * 1024  # max bytes per second read by the scrubber (0 = unthrottled)
+scrub_block_size = 1024 * 1024  # bytes per scrubber read
+scrub_read_ahead = 4  # blocks read ahead of the hasher
+scrub_batch = 64  # rows fetched per scrubber query
+scrub_checkpoint_interval = 30  # seconds between checkpoint writes (progress lost on a crash is re-verified)
+scrub_pass_interval = 24 * 3600  # seconds between the end of a full pass and the next one
+scrub_start_delay = 60  # seconds after startup before the scrubber starts reading
+
+executor_thread_workers = 8  # GIL-releasing crypto and disk I/O
+executor_process_workers = 2  # pure-Python Kyber/Dilithium
+executor_process_start_method = "spawn"
+kdf_workers = 2  # threads reserved for password hashing and key unwrapping
+kdf_max_pending = 16  # KDF jobs admitted at once; beyond this login/register get 503
+kdf_retry_after = 2  # seconds suggested to clients turned away by admission control
+scrypt_n = 2 ** 14  # scrypt cost for new password hashes; older hashes upgrade on login
+scrypt_r = 8
+scrypt_p = 1
+keyring_size = 10000  # sessions whose unwrapped private keys are held in memory
+kek_cache_per_session = 64  # decapsulated file key-encryption keys remembered per session
+dilithium_key_cache_size = 256  # expanded public-key matrices memoized per process
+dilithium_verify_batch = 32  # smallest batch of signatures sent to one worker
+kyber_context_cache_size = 256  # parsed ML-KEM public keys (expanded A^T) memoized per process
+
+bb84_backend = "numpy"  # "numpy" (vectorized) or "qiskit" (circuit simulation)
+
+qkd_pool_depth = 8  # ready BB84 session keys kept per conversation pair
+qkd_pool_refill_interval = 1.0  # seconds between refill rounds
+qkd_pool_refill_batch = 64  # max keys generated per round
+qkd_pool_max_pairs = 10000  # pairs tracked before LRU eviction
+qkd_pool_raw_bits = 128 * 2  # raw qubits per exchange (extra bits for basis mismatches)
+
+keypair_pool_depth = 16  # pre-generated Kyber+Dilithium keypair sets kept for registration
+keypair_pool_refill_interval = 1.0  # seconds between refill rounds
+keypair_pool_refill_batch = 4  # max sets generated per round
+
+bb84_session_store = "memory"  # "memory" or "sqlite" (shared between workers)
+bb84_session_db_name = "SafeQ_BB84_Sessions.db"  # in database_location, sqlite store only
+bb84_session_ttl = 600  # seconds an idle exchange is kept
+bb84_session_max = 10000  # exchanges kept before the oldest is evicted
+bb84_wait_timeout = 30  # max seconds a /quantum/wait long-poll is held open
+bb84_notify_recheck = 1.0  # seconds between store re-reads while waiting (cross-worker events)
+
+message_broker = "memory"  # "memory" (single worker) or "module:Class" of a message_hub.Broker
+message_ws_queue_size = 256  # pending events per socket before the oldest are dropped
+
+startup_import_budget_ms = 1500  # cold-start import budget checked by the startup report
 
 TEST_KEY_BASE64 = "SOGbOtbmNP/XZOuwh/D1V4UK17lgBdsA9TnpMuPY2b4="
 TEST_KEY_BYTES = base64.b64decode(TEST_KEY_BASE64)
 
 JWT_SECRET_KEY = "your-secret-key-here"
 JWT_ALGORITHM = "HS256"
-JWT_ACCESS_TOKEN_EXPIRE_MINUTES = 30
\ No newline at end of file
+JWT_ACCESS_TOKEN_EXPIRE_MINUTES = 30
+
+principal_cache_size = 10000  # authenticated accounts kept in memory
+principal_cache_ttl = 60  # seconds before a cached account is re-read
+jwt_cache_size = 10000  # verified tokens kept so repeat requests skip the signature check
+jwt_cache_ttl = 300  # upper bound in seconds; entries never outlive the token exp
\ No newline at end of file
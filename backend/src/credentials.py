@@ -0,0 +1,253 @@
+"""
+Credential service: password hashing, private-key wrapping and the session keyring.
+
+All KDF work (scrypt password hashes, PBKDF2 key-wrapping keys) runs on the
+dedicated "kdf" pool behind admission control: once kdf_max_pending jobs are
+in flight, further login/register calls get 503 + Retry-After instead of
+queueing behind the storm. On login the unwrapped Kyber/Dilithium private keys
+are kept in an in-memory keyring for the lifetime of the access token, so
+later decapsulation and signing do not need the password again.
+
+Author: LunaLynx12
+"""
+
+from fastapi import Depends, HTTPException, status
+from fastapi.security import HTTPAuthorizationCredentials
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.backends import default_backend
+from encryption import aes_encrypt2, aes_decrypt2
+from models import Account
+from utils.security import verify_password, get_password_hash, needs_rehash
+from utils.executor import run_in_kdf_pool
+from utils.cache import TTLCache
+from utils.jwt import bearer_security, authenticate_token, token_fingerprint
+from utils.logger import get_logger
+from collections import OrderedDict
+import os
+import config
+
+logger = get_logger("credentials")
+
+
+def derive_password_key(password: str, salt: bytes) -> bytes:
+    """
+    Derives the AES-256 key that wraps the user's private keys.
+    Blocking (100k PBKDF2 iterations) - only call it on the kdf pool.
+    """
+    kdf = PBKDF2HMAC(
+        algorithm=hashes.SHA256(),
+        length=32,  # 256-bit key for AES-256
+        salt=salt,
+        iterations=100000,
+        backend=default_backend()
+    )
+    return kdf.derive(password.encode())
+
+
+class SessionKeys:
+    """
+    Unwrapped private keys of one logged-in session, plus the key-encryption
+    keys it has already decapsulated (LRU, kek_cache_per_session entries).
+    The buffers are mutable so they can be zeroed when the session leaves the
+    keyring; copies handed to the PQC libraries (which need bytes) are
+    outside our control.
+    """
+
+    __slots__ = ("user_id", "kyber_sk", "dilithium_sk", "keks")
+
+    def __init__(self, user_id: int, kyber_sk: bytes, dilithium_sk: bytes):
+        self.user_id = user_id
+        self.kyber_sk = bytearray(kyber_sk)
+        self.dilithium_sk = bytearray(dilithium_sk)
+        self.keks = OrderedDict()
+
+    def cached_kek(self, kem_ciphertext: bytes):
+        kek = self.keks.get(kem_ciphertext)
+        if kek is not None:
+            self.keks.move_to_end(kem_ciphertext)
+            return bytes(kek)
+        return None
+
+    def remember_kek(self, kem_ciphertext: bytes, kek: bytes) -> None:
+        self.keks[kem_ciphertext] = bytearray(kek)
+        while len(self.keks) > config.kek_cache_per_session:
+            _, old = self.keks.popitem(last=False)
+            old[:] = bytes(len(old))
+
+    def wipe(self) -> None:
+        for buf in (self.kyber_sk, self.dilithium_sk, *self.keks.values()):
+            buf[:] = bytes(len(buf))
+        self.keks.clear()
+
+
+def _seal_credentials(password: str, kyber_sk: bytes, dilithium_sk: bytes):
+    salt = os.urandom(16)
+    wrap_key = derive_password_key(password, salt)
+    return (
+        get_password_hash(password),
+        salt,
+        aes_encrypt2(wrap_key, kyber_sk),
+        aes_encrypt2(wrap_key, dilithium_sk),
+    )
+
+
+def _open_credentials(password: str, password_hash: str, salt: bytes,
+                      kyber_sk_enc: bytes, dilithium_sk_enc: bytes):
+    # Returns None on a wrong password; raises if the key blobs do not decrypt
+    if not verify_password(password, password_hash):
+        return None
+    wrap_key = derive_password_key(password, salt)
+    kyber_sk = aes_decrypt2(wrap_key, kyber_sk_enc)
+    dilithium_sk = aes_decrypt2(wrap_key, dilithium_sk_enc)
+    upgraded = get_password_hash(password) if needs_rehash(password_hash) else None
+    return upgraded, kyber_sk, dilithium_sk
+
+
+class CredentialService:
+    """
+    Admission-controlled front for KDF work plus the per-session keyring.
+
+    param max_pending: KDF jobs allowed in flight before callers get 503
+    type max_pending: int
+    """
+
+    def __init__(self, max_pending: int):
+        self.max_pending = max_pending
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.rehashed = 0
+        self.keyring = TTLCache(
+            "keyring",
+            config.keyring_size,
+            config.JWT_ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+            on_evict=lambda _, keys: keys.wipe(),
+        )
+
+    async def _admit(self, func, *args):
+        if self.in_flight >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many authentication requests, retry shortly",
+                headers={"Retry-After": str(config.kdf_retry_after)},
+            )
+        self.in_flight += 1
+        self.admitted += 1
+        try:
+            return await run_in_kdf_pool(func, *args)
+        finally:
+            self.in_flight -= 1
+
+    async def seal(self, password: str, kyber_sk: bytes, dilithium_sk: bytes):
+        """
+        Hashes a new account's password and wraps its private keys.
+
+        return: (password_hash, salt, kyber_sk_enc, dilithium_sk_enc)
+        rtype: tuple
+        raises HTTPException: 503 when the KDF pool is saturated
+        """
+        return await self._admit(_seal_credentials, password, kyber_sk, dilithium_sk)
+
+    async def unlock(self, user: Account, password: str) -> SessionKeys:
+        """
+        Verifies the password and unwraps the account's private keys. Legacy or
+        outdated password hashes are replaced with the configured scrypt cost.
+
+        raises HTTPException: 401 on a wrong password or undecryptable keys,
+            503 when the KDF pool is saturated
+        """
+        try:
+            opened = await self._admit(
+                _open_credentials, password, user.password_hash, user.kyber_salt,
+                user.kyber_private_key_enc, user.dilithium_private_key_enc
+            )
+        except HTTPException:
+            raise
+        except Exception:
+            raise HTTPException(status_code=401, detail="Key decryption failed - possibly wrong password")
+        if opened is None:
+            raise HTTPException(status_code=401, detail="Invalid credentials")
+
+        upgraded, kyber_sk, dilithium_sk = opened
+        if upgraded is not None:
+            user.password_hash = upgraded
+            await user.save(update_fields=["password_hash"])
+            self.rehashed += 1
+            logger.info("password hash upgraded", extra={"fields": {"user_id": user.id}})
+
+        return SessionKeys(user.id, kyber_sk, dilithium_sk)
+
+    def open_session(self, token: str, keys: SessionKeys) -> None:
+        """
+        Keeps a session's unwrapped keys until its access token expires.
+        """
+        self.keyring.set(token_fingerprint(token), keys)
+
+    def session_keys(self, token: str):
+        """
+        Returns the SessionKeys opened for this token, or None.
+        """
+        return self.keyring.get(token_fingerprint(token))
+
+    def close_session(self, token: str) -> None:
+        self.keyring.pop(token_fingerprint(token))
+
+    def close(self) -> None:
+        """
+        Wipes every held key. Called on application shutdown.
+        """
+        self.keyring.clear()
+
+    def metrics(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "max_pending": self.max_pending,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "rehashed": self.rehashed,
+            "sessions": len(self.keyring),
+        }
+
+
+credential_service = CredentialService(config.kdf_max_pending)
+
+
+async def optional_session_keys(
+    credentials: HTTPAuthorizationCredentials = Depends(bearer_security)
+):
+    """
+    Dependency returning the caller's SessionKeys, or None if none are held
+    (routes that only sometimes need private keys decide what to do).
+
+    raises HTTPException: 401 if the token is invalid
+    """
+    user = await authenticate_token(credentials.credentials)
+    keys = credential_service.session_keys(credentials.credentials)
+    if keys is None or keys.user_id != user.id:
+        return None
+    return keys
+
+
+def session_keys_required() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Session keys unavailable, log in again",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+async def get_session_keys(
+    credentials: HTTPAuthorizationCredentials = Depends(bearer_security)
+) -> SessionKeys:
+    """
+    Dependency returning the caller's unwrapped private keys.
+
+    raises HTTPException: 401 if the token is invalid or its keys are no longer
+        held (server restart, eviction) - the client has to log in again
+    """
+    keys = await optional_session_keys(credentials)
+    if keys is None:
+        raise session_keys_required()
+    return keys
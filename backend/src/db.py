@@ -4,9 +4,68 @@ from pathlib import Path
 
 DATABASE_URL = f"sqlite://{Path(config.database_location)}/{config.database_name}?check_same_thread=False"
 
-async def init_db():
+# Columns added to tables that existed before; generate_schemas() only creates
+# missing tables, so databases built by an older version get them here.
+# (table, column, column definition)
+ADDED_COLUMNS = (
+    ("file", "folder_path", "VARCHAR(1024) NOT NULL DEFAULT '/'"),
+    ("folder", "parent_path", "VARCHAR(1024) NOT NULL DEFAULT '/'"),
+)
+
+# Table constraints that only a fresh CREATE TABLE would add
+ADDED_UNIQUE_INDEXES = (
+    ("uidx_folder_owner_path", "folder", ("owner_id", "path")),
+)
+
+
+async def upgrade_schema(connection) -> list[str]:
+    """
+    Brings tables created by an older version up to the current models.
+    Idempotent; runs before generate_schemas() so the indexes over the new
+    columns are (re)created afterwards.
+
+    Indexes over a column that was still missing are dropped: SQLite takes an
+    unknown double-quoted name for a string literal, so generate_schemas()
+    run against the old table indexed a constant instead of the column.
+
+    return: "table.column" of every column added
+    """
+    added = []
+    for table, column, definition in ADDED_COLUMNS:
+        _, rows = await connection.execute_query(f'PRAGMA table_info("{table}")')
+        if not rows or column in (row["name"] for row in rows):
+            continue  # table not created yet, or already current
+        _, indexes = await connection.execute_query(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql LIKE ?",
+            [table, f'%"{column}"%'],
+        )
+        for index in indexes:
+            await connection.execute_script(f'DROP INDEX IF EXISTS "{index["name"]}"')
+        await connection.execute_script(f'ALTER TABLE "{table}" ADD COLUMN "{column}" {definition}')
+        added.append(f"{table}.{column}")
+
+    for name, table, columns in ADDED_UNIQUE_INDEXES:
+        _, rows = await connection.execute_query(f'PRAGMA table_info("{table}")')
+        if rows and not await _has_unique(connection, table, columns):
+            column_list = ", ".join(f'"{column}"' for column in columns)
+            await connection.execute_script(f'CREATE UNIQUE INDEX "{name}" ON "{table}" ({column_list})')
+    return added
+
+
+async def _has_unique(connection, table: str, columns: tuple) -> bool:
+    _, indexes = await connection.execute_query(f'PRAGMA index_list("{table}")')
+    for index in indexes:
+        if index["unique"]:
+            _, info = await connection.execute_query(f'PRAGMA index_info("{index["name"]}")')
+            if tuple(row["name"] for row in info) == tuple(columns):
+                return True
+    return False
+
+
+async def init_db(db_url: str = DATABASE_URL):
     await Tortoise.init(
-        db_url=DATABASE_URL,
+        db_url=db_url,
         modules={"models": ["models"]}
     )
-    await Tortoise.generate_schemas()
\ No newline at end of file
+    await upgrade_schema(Tortoise.get_connection("default"))
+    await Tortoise.generate_schemas()
@@ -6,8 +6,15 @@ Author: LunaLynx12
 """
 
 from dilithium_py.dilithium import Dilithium2 as Dilithium
+from utils.logger import get_logger
+from utils.executor import run_in_process
+import asyncio
+import functools
 import hashlib
 import base64
+import config
+
+logger = get_logger("dilithium")
 
 
 def hash_message(message: str) -> str:
@@ -19,6 +26,16 @@ def hash_message(message: str) -> str:
     """
     return hashlib.sha256(message.encode("utf-8")).hexdigest()
 
+def generate_dilithium_keys() -> tuple[bytes, bytes]:
+    """
+    Generates a Dilithium2 keypair.
+
+    return: Tuple containing:
+        - public_key (bytes): Verification key for sharing
+        - secret_key (bytes): Signing key
+    """
+    return Dilithium.keygen()
+
 def sign_message(secret_key: bytes, message: str) -> bytes:
     """
     Signs a message using the provided Dilithium private key.
@@ -33,6 +50,47 @@ def sign_message(secret_key: bytes, message: str) -> bytes:
     message_bytes = message.encode("utf-8")
     return Dilithium.sign(secret_key, message_bytes)
     
+@functools.lru_cache(maxsize=config.dilithium_key_cache_size)
+def _public_key_context(public_key: bytes):
+    """
+    Per-key part of verification: the expanded matrix A_hat, t1 * 2^d in NTT
+    form and tr = H(pk). Expanding A_hat dominates a verify, so it is memoized
+    per process; conversations and file lists reuse a handful of keys.
+    """
+    rho, t1 = Dilithium._unpack_pk(public_key)
+    A_hat = Dilithium._expand_matrix_from_seed(rho)
+    t1_hat = t1.scale(1 << Dilithium.d).to_ntt()
+    tr = Dilithium._h(public_key, 32)
+    return A_hat, t1_hat, tr
+
+
+def _verify_bytes(public_key: bytes, message: bytes, signature: bytes) -> bool:
+    # Same steps as Dilithium.verify, with the per-key work taken from the cache
+    A_hat, t1_hat, tr = _public_key_context(public_key)
+    c_tilde, z, h = Dilithium._unpack_sig(signature)
+
+    if h.sum_hint() > Dilithium.omega:
+        return False
+    if z.check_norm_bound(Dilithium.gamma_1 - Dilithium.beta):
+        return False
+
+    mu = Dilithium._h(tr + message, 64)
+    c = Dilithium.R.sample_in_ball(c_tilde, Dilithium.tau).to_ntt()
+
+    Az_minus_ct1 = ((A_hat @ z.to_ntt()) - t1_hat.scale(c)).from_ntt()
+    w_prime = h.use_hint(Az_minus_ct1, 2 * Dilithium.gamma_2)
+    return c_tilde == Dilithium._h(mu + w_prime.bit_pack_w(Dilithium.gamma_2), 32)
+
+
+def _as_bytes(message) -> bytes:
+    return message.encode("utf-8") if isinstance(message, str) else message
+
+
+def _as_signature(signature) -> bytes:
+    # Signatures travel base64-encoded as str, raw as bytes
+    return base64.b64decode(signature) if isinstance(signature, str) else signature
+
+
 def verify_signature(public_key: bytes, message: str, signature_b64: str) -> bool:
     """
     Verifies a Dilithium digital signature against a message.
@@ -43,17 +101,62 @@ def verify_signature(public_key: bytes, message: str, signature_b64: str) -> boo
     type message: str
     param signature_b64: Base64-encoded signature string
     type signature_b64: str
-    return: True if the signature is valid, False otherwise
+    return: True if the signature is valid, False otherwise (including
+        malformed keys or signatures)
     rtype: bool
-    raises Exception: Prints error message if verification fails unexpectedly
     """
-    try:
-        message_bytes = message.encode("utf-8")
-        signature_bytes = base64.b64decode(signature_b64)
-        return Dilithium.verify(public_key, message_bytes, signature_bytes)
-    except Exception as e:
-        print(f"[!] Signature verification error: {e}")
-        return False
+    return verify_many([(public_key, message, signature_b64)])[0]
+
+
+def verify_many(items) -> list[bool]:
+    """
+    Verifies many signatures in this process, reusing the expanded matrix of
+    every public key seen before.
+
+    param items: Iterable of (public_key, message, signature) tuples; message
+        is str or bytes, signature is raw bytes or a base64 str
+    type items: Iterable[tuple]
+    return: One result per item, in order
+    rtype: list[bool]
+    """
+    results = []
+    for public_key, message, signature in items:
+        try:
+            results.append(_verify_bytes(public_key, _as_bytes(message), _as_signature(signature)))
+        except Exception as e:
+            logger.warning("signature verification error", extra={"fields": {"error": repr(e)}})
+            results.append(False)
+    return results
+
+
+async def verify_many_parallel(items) -> list[bool]:
+    """
+    Verifies many signatures across the process pool. Items are grouped by
+    public key before chunking so each worker expands a key's matrix once.
+
+    param items: Sequence of (public_key, message, signature) tuples, as for verify_many
+    type items: Sequence[tuple]
+    return: One result per item, in input order
+    rtype: list[bool]
+    """
+    items = list(items)
+    if len(items) <= config.dilithium_verify_batch:
+        return await run_in_process(verify_many, items)
+
+    order = sorted(range(len(items)), key=lambda i: items[i][0])
+    chunks = max(config.executor_process_workers * 4, 1)
+    size = max(-(-len(items) // chunks), config.dilithium_verify_batch)
+    batches = [order[i:i + size] for i in range(0, len(order), size)]
+
+    outcomes = await asyncio.gather(*(
+        run_in_process(verify_many, [items[i] for i in batch]) for batch in batches
+    ))
+
+    results = [False] * len(items)
+    for batch, outcome in zip(batches, outcomes):
+        for i, ok in zip(batch, outcome):
+            results[i] = ok
+    return results
 
 def save_key(filename: str, key: bytes) -> None:
     """
@@ -3,6 +3,8 @@ from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+import struct
 import os
 
 # AES-GCM standard recommends a 12-byte nonce
@@ -110,4 +112,127 @@ def derive_key2(shared_secret: bytes, salt: bytes = None, info: bytes = b"") ->
         info=info,
         backend=default_backend()
     )
-    return hkdf.derive(shared_secret)
\ No newline at end of file
+    return hkdf.derive(shared_secret)
+
+# Segmented AES-GCM (streaming) format used for files on the drive
+#
+#   header = magic (4B) + segment size (4B, big endian) + nonce prefix (7B)
+#   record = ciphertext + tag (16B), one record per plaintext segment
+#
+# Every record is sealed with nonce = prefix + segment index (4B) + final flag (1B)
+# and the header as associated data, so records can't be reordered, dropped,
+# truncated or spliced between files without failing authentication.
+STREAM_MAGIC = b"SQS1"
+STREAM_PREFIX_SIZE = 7
+STREAM_HEADER_SIZE = len(STREAM_MAGIC) + 4 + STREAM_PREFIX_SIZE
+
+
+def stream_header(segment_size: int, nonce_prefix: bytes = None) -> bytes:
+    """
+    Builds the header of a segmented AES-GCM stream.
+    A random nonce prefix is generated when none is given.
+    """
+    if nonce_prefix is None:
+        nonce_prefix = os.urandom(STREAM_PREFIX_SIZE)
+    if len(nonce_prefix) != STREAM_PREFIX_SIZE:
+        raise ValueError(f"Nonce prefix must be {STREAM_PREFIX_SIZE} bytes")
+    return STREAM_MAGIC + struct.pack(">I", segment_size) + nonce_prefix
+
+
+def is_stream_ciphertext(data: bytes) -> bool:
+    """
+    Returns True if data starts with a segmented stream header.
+    """
+    return len(data) >= STREAM_HEADER_SIZE and data[:len(STREAM_MAGIC)] == STREAM_MAGIC
+
+
+def parse_stream_header(header: bytes) -> tuple[int, bytes]:
+    """
+    Parses a segmented stream header.
+    Returns: (segment size, nonce prefix)
+    """
+    if not is_stream_ciphertext(header):
+        raise ValueError("Not a segmented AES-GCM stream")
+    offset = len(STREAM_MAGIC)
+    (segment_size,) = struct.unpack(">I", header[offset:offset + 4])
+    if segment_size == 0:
+        raise ValueError("Invalid segment size in stream header")
+    return segment_size, header[offset + 4:STREAM_HEADER_SIZE]
+
+
+def _segment_nonce(header: bytes, index: int, final: bool) -> bytes:
+    return header[-STREAM_PREFIX_SIZE:] + struct.pack(">I?", index, final)
+
+
+def encrypt_segment(key: bytes, header: bytes, index: int, plaintext: bytes, final: bool) -> bytes:
+    """
+    Encrypts one plaintext segment of a stream.
+    Returns: ciphertext + tag (16B)
+    """
+    nonce = _segment_nonce(header, index, final)
+    return AESGCM(key).encrypt(nonce, plaintext, header[:STREAM_HEADER_SIZE])
+
+
+def decrypt_segment(key: bytes, header: bytes, index: int, record: bytes, final: bool) -> bytes:
+    """
+    Decrypts and verifies one record of a stream.
+    Raises InvalidTag if the record was tampered with or is out of place.
+    """
+    nonce = _segment_nonce(header, index, final)
+    return AESGCM(key).decrypt(nonce, record, header[:STREAM_HEADER_SIZE])
+
+
+def stream_record_offset(index: int, segment_size: int) -> int:
+    """
+    Byte offset of record `index` inside a stream (header included).
+    """
+    return STREAM_HEADER_SIZE + index * (segment_size + TAG_SIZE)
+
+
+def stream_segment_count(plaintext_size: int, segment_size: int) -> int:
+    """
+    Number of records in a stream holding plaintext_size bytes.
+    An empty plaintext is still sealed as one (empty) final record.
+    """
+    return max(1, -(-plaintext_size // segment_size))
+
+
+def decrypt_stream(key: bytes, data: bytes) -> bytes:
+    """
+    Decrypts a whole segmented stream held in memory.
+    Returns: decrypted bytes
+    """
+    segment_size, _ = parse_stream_header(data)
+    header = data[:STREAM_HEADER_SIZE]
+    record_size = segment_size + TAG_SIZE
+    body = memoryview(data)[STREAM_HEADER_SIZE:]
+    count = max(1, -(-len(body) // record_size))
+
+    plaintext = bytearray()
+    for index in range(count):
+        record = body[index * record_size:(index + 1) * record_size]
+        plaintext += decrypt_segment(key, header, index, bytes(record), index == count - 1)
+    return bytes(plaintext)
+
+
+def decrypt_stream_range(f, key: bytes, plaintext_size: int, start: int, end: int):
+    """
+    Yields the decrypted bytes start..end (inclusive) of a segmented stream
+    read from the binary file object f. Only the records overlapping the
+    range are read and decrypted.
+    """
+    header = f.read(STREAM_HEADER_SIZE)
+    segment_size, _ = parse_stream_header(header)
+    count = stream_segment_count(plaintext_size, segment_size)
+
+    first = start // segment_size
+    last = min(end // segment_size, count - 1)
+    f.seek(stream_record_offset(first, segment_size))
+
+    for index in range(first, last + 1):
+        record = f.read(segment_size + TAG_SIZE)
+        plaintext = decrypt_segment(key, header, index, record, index == count - 1)
+        segment_start = index * segment_size
+        lo = start - segment_start if index == first else 0
+        hi = end - segment_start + 1 if index == last else len(plaintext)
+        yield plaintext[lo:hi]
@@ -0,0 +1,336 @@
+"""
+Logical folder tree of the drive, indexed by materialized path.
+
+Every Folder row stores its full path ("/docs/2024") and its parent's path;
+File.folder_path names the folder a file sits in and the root "/" has no
+row. A subtree is one index range on a path column (the path itself, or
+p + "/" <= path < p + "0", "0" being the character after "/"), so moving,
+copying or deleting a folder rewrites, duplicates or removes whole ranges
+with a few set-based statements in one transaction instead of touching
+files one by one. Blob references of copied and deleted files are adjusted
+the same way.
+
+Author: LunaLynx12
+"""
+
+from fastapi import HTTPException
+from datetime import datetime, timezone
+from tortoise.expressions import Q
+from tortoise.functions import Length
+from tortoise.exceptions import IntegrityError
+from tortoise.transactions import in_transaction
+from models import Folder, File, Blob, UploadSession
+from utils.executor import run_in_thread
+from thumbnails import remove_thumbnail
+import blob_store
+import os
+
+ROOT = "/"
+MAX_NAME_LENGTH = 255
+MAX_PATH_LENGTH = 1024
+
+
+def normalize_path(path: str) -> str:
+    """
+    Canonical form of a folder path: leading "/", no trailing or doubled
+    slashes. "/" is the root.
+
+    raises HTTPException: 400 on relative paths, "." / ".." segments or
+        over-long names
+    """
+    if not path or not path.startswith("/"):
+        raise HTTPException(status_code=400, detail="Folder path must start with '/'")
+    parts = [part for part in path.split("/") if part]
+    if any(part in (".", "..") or len(part) > MAX_NAME_LENGTH for part in parts):
+        raise HTTPException(status_code=400, detail="Invalid folder path")
+    normalized = "/" + "/".join(parts)
+    if len(normalized) > MAX_PATH_LENGTH:
+        raise HTTPException(status_code=400, detail="Folder path too long")
+    return normalized
+
+
+def parent_of(path: str) -> str:
+    return path.rsplit("/", 1)[0] or ROOT
+
+
+def name_of(path: str) -> str:
+    return path.rsplit("/", 1)[1]
+
+
+def subtree(column: str, path: str) -> Q:
+    """
+    Filter matching a folder path and everything below it.
+    """
+    if path == ROOT:
+        return Q()
+    return Q(**{column: path}) | Q(**{f"{column}__gte": path + "/", f"{column}__lt": path + "0"})
+
+
+def _range_sql(column: str, path: str, include_self: bool = True) -> tuple[str, list]:
+    # Raw SQL counterpart of subtree() for the set-based statements below
+    below = f"({column} >= ? AND {column} < ?)"
+    if include_self:
+        return f"({column} = ? OR {below})", [path, path + "/", path + "0"]
+    return below, [path + "/", path + "0"]
+
+
+async def folder_exists(owner_id: int, path: str) -> bool:
+    return path == ROOT or await Folder.filter(owner_id=owner_id, path=path).exists()
+
+
+async def require_folder(owner_id: int, path: str) -> str:
+    """
+    Normalizes a folder path and checks that the folder exists.
+
+    return: Normalized path
+    raises HTTPException: 400 on an invalid path, 404 if there is no such folder
+    """
+    path = normalize_path(path)
+    if not await folder_exists(owner_id, path):
+        raise HTTPException(status_code=404, detail="Folder not found")
+    return path
+
+
+async def create_folder(owner_id: int, path: str, parents: bool = False) -> Folder:
+    """
+    Creates a folder, and with parents=True any missing ancestors (one
+    lookup and one bulk insert).
+
+    raises HTTPException: 400 for the root, 404 if the parent is missing and
+        parents is False, 409 if the folder already exists
+    """
+    path = normalize_path(path)
+    if path == ROOT:
+        raise HTTPException(status_code=400, detail="The root folder always exists")
+
+    ancestors = []
+    parent = parent_of(path)
+    while parent != ROOT:
+        ancestors.append(parent)
+        parent = parent_of(parent)
+
+    try:
+        async with in_transaction():
+            existing = set(await Folder.filter(owner_id=owner_id, path__in=[path, *ancestors]).values_list("path", flat=True))
+            if path in existing:
+                raise HTTPException(status_code=409, detail="Folder already exists")
+            missing = [p for p in reversed(ancestors) if p not in existing]
+            if missing and not parents:
+                raise HTTPException(status_code=404, detail="Parent folder not found")
+            await Folder.bulk_create([
+                Folder(owner_id=owner_id, name=name_of(p), path=p, parent_path=parent_of(p)) for p in missing
+            ])
+            return await Folder.create(owner_id=owner_id, name=name_of(path), path=path, parent_path=parent_of(path))
+    except IntegrityError:
+        raise HTTPException(status_code=409, detail="Folder already exists")
+
+
+async def _check_relocation(owner_id: int, source: str, destination: str) -> tuple[str, str]:
+    source = normalize_path(source)
+    destination = normalize_path(destination)
+    if ROOT in (source, destination):
+        raise HTTPException(status_code=400, detail="The root folder cannot be moved or copied")
+    if destination == source or destination.startswith(source + "/"):
+        raise HTTPException(status_code=400, detail="Destination is inside the source folder")
+    if not await Folder.filter(owner_id=owner_id, path=source).exists():
+        raise HTTPException(status_code=404, detail="Folder not found")
+    if not await folder_exists(owner_id, parent_of(destination)):
+        raise HTTPException(status_code=404, detail="Destination parent folder not found")
+    if await Folder.filter(owner_id=owner_id, path=destination).exists():
+        raise HTTPException(status_code=409, detail="Destination folder already exists")
+    if len(destination) + await _deepest_suffix(owner_id, source) > MAX_PATH_LENGTH:
+        raise HTTPException(status_code=400, detail="Folder path too long")
+    return source, destination
+
+
+async def _deepest_suffix(owner_id: int, path: str) -> int:
+    # Longest path below `path`, minus the prefix that a relocation replaces
+    longest = await (
+        Folder.filter(Q(owner_id=owner_id) & subtree("path", path))
+        .annotate(length=Length("path")).order_by("-length").first().values_list("length", flat=True)
+    )
+    return (longest or len(path)) - len(path)
+
+
+async def move_folder(owner_id: int, source: str, destination: str) -> dict:
+    """
+    Moves (or renames) a folder with everything below it. Only paths change:
+    one UPDATE per table, whatever the number of files.
+
+    param source: Current folder path
+    param destination: New full path; its parent must exist
+    return: Number of folders and files moved
+    raises HTTPException: 400/404/409 on invalid, missing or taken paths
+    """
+    async with in_transaction() as conn:
+        source, destination = await _check_relocation(owner_id, source, destination)
+        start = len(source) + 1  # SQL substr() is 1-based: keeps the part after the old prefix
+        folder_range, folder_args = _range_sql("path", source, include_self=False)
+        moved_folders, _ = await conn.execute_query(
+            f"UPDATE {Folder._meta.db_table} SET path = ? || substr(path, ?), parent_path = ? || substr(parent_path, ?) "
+            f"WHERE owner_id = ? AND {folder_range}",
+            [destination, start, destination, start, owner_id, *folder_args],
+        )
+        await Folder.filter(owner_id=owner_id, path=source).update(
+            path=destination, parent_path=parent_of(destination), name=name_of(destination)
+        )
+        file_range, file_args = _range_sql("folder_path", source)
+        moved_files, _ = await conn.execute_query(
+            f"UPDATE {File._meta.db_table} SET folder_path = ? || substr(folder_path, ?) "
+            f"WHERE owner_id = ? AND {file_range}",
+            [destination, start, owner_id, *file_args],
+        )
+        # Resumable uploads still in progress follow their target folder
+        await conn.execute_query(
+            f"UPDATE {UploadSession._meta.db_table} SET folder_path = ? || substr(folder_path, ?) "
+            f"WHERE owner_id = ? AND {file_range}",
+            [destination, start, owner_id, *file_args],
+        )
+
+    return {"folders": 1 + moved_folders, "files": moved_files}
+
+
+def _copied_file_columns(destination: str, start: int, now: datetime) -> tuple[list, list, list]:
+    # Columns of the file table, the SELECT expression copying each one and
+    # the parameters of those expressions, in column order
+    overrides = {
+        "folder_path": ("? || substr(folder_path, ?)", [destination, start]),
+        "created_at": ("?", [now]),
+        "updated_at": ("?", [now]),
+        "is_shared": ("0", []),
+        "share_links": ("'[]'", []),
+    }
+    columns = [column for column in File._meta.fields_db_projection.values() if column != "id"]
+    expressions, args = [], []
+    for column in columns:
+        expression, params = overrides.get(column, (column, []))
+        expressions.append(expression)
+        args.extend(params)
+    return columns, expressions, args
+
+
+async def copy_folder(owner_id: int, source: str, destination: str) -> dict:
+    """
+    Copies a folder with everything below it. File rows are duplicated with
+    INSERT ... SELECT and share their blobs (refcounts go up by the number of
+    copies), so no content is read, re-encrypted or written. Copies start
+    unshared; previews are not copied.
+
+    param source: Folder to copy
+    param destination: Full path of the copy; its parent must exist
+    return: Number of folders and files created
+    raises HTTPException: 400/404/409 on invalid, missing or taken paths,
+        409 if the folder holds legacy files that have no blob
+    """
+    file_table = File._meta.db_table
+    blob_table = Blob._meta.db_table
+    now = datetime.now(timezone.utc)
+
+    async with in_transaction() as conn:
+        source, destination = await _check_relocation(owner_id, source, destination)
+        start = len(source) + 1
+        file_range, file_args = _range_sql("folder_path", source)
+        _, rows = await conn.execute_query(
+            f"SELECT COUNT(*) FROM {file_table} f WHERE owner_id = ? AND {file_range} "
+            f"AND NOT EXISTS (SELECT 1 FROM {blob_table} b WHERE b.content_hash = f.content_hash AND b.refcount > 0)",
+            [owner_id, *file_args],
+        )
+        if rows[0][0]:
+            raise HTTPException(status_code=409, detail="Folder contains legacy files that cannot be copied")
+
+        await Folder.create(owner_id=owner_id, name=name_of(destination), path=destination, parent_path=parent_of(destination))
+        folder_range, folder_args = _range_sql("path", source, include_self=False)
+        copied_folders, _ = await conn.execute_query(
+            f"INSERT INTO {Folder._meta.db_table} (name, path, parent_path, owner_id, created_at) "
+            f"SELECT name, ? || substr(path, ?), ? || substr(parent_path, ?), owner_id, ? "
+            f"FROM {Folder._meta.db_table} WHERE owner_id = ? AND {folder_range}",
+            [destination, start, destination, start, now, owner_id, *folder_args],
+        )
+
+        await conn.execute_query(
+            f"UPDATE {blob_table} SET refcount = refcount + "
+            f"(SELECT COUNT(*) FROM {file_table} f WHERE f.content_hash = {blob_table}.content_hash AND f.owner_id = ? AND {file_range}) "
+            f"WHERE content_hash IN (SELECT content_hash FROM {file_table} WHERE owner_id = ? AND {file_range})",
+            [owner_id, *file_args, owner_id, *file_args],
+        )
+        columns, expressions, args = _copied_file_columns(destination, start, now)
+        copied_files, _ = await conn.execute_query(
+            f"INSERT INTO {file_table} ({', '.join(columns)}) SELECT {', '.join(expressions)} "
+            f"FROM {file_table} WHERE owner_id = ? AND {file_range} ORDER BY id",
+            [*args, owner_id, *file_args],
+        )
+
+    return {"folders": 1 + copied_folders, "files": copied_files}
+
+
+def _remove_all(paths) -> None:
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _remove_thumbnails(file_ids) -> None:
+    for file_id in file_ids:
+        remove_thumbnail(file_id)
+
+
+async def delete_folder(owner_id: int, path: str) -> dict:
+    """
+    Deletes a folder with all subfolders and files. Blob references are
+    dropped in one statement; blobs left unreferenced are moved off their
+    address while the transaction holds the write lock and unlinked after it
+    commits, as blob_store.release() does.
+
+    return: Number of folders and files deleted
+    raises HTTPException: 400 for the root, 404 if the folder does not exist
+    """
+    path = normalize_path(path)
+    if path == ROOT:
+        raise HTTPException(status_code=400, detail="The root folder cannot be deleted")
+    file_table = File._meta.db_table
+    blob_table = Blob._meta.db_table
+    file_range, file_args = _range_sql("folder_path", path)
+    joined_range, _ = _range_sql("f.folder_path", path)
+    hashes_sql = f"SELECT content_hash FROM {file_table} WHERE owner_id = ? AND {file_range}"
+
+    moved = []
+    try:
+        async with in_transaction() as conn:
+            if not await Folder.filter(owner_id=owner_id, path=path).exists():
+                raise HTTPException(status_code=404, detail="Folder not found")
+            _, rows = await conn.execute_query(
+                f"SELECT f.id, f.path, b.id IS NULL FROM {file_table} f "
+                f"LEFT JOIN {blob_table} b ON b.content_hash = f.content_hash "
+                f"WHERE f.owner_id = ? AND {joined_range}",
+                [owner_id, *file_args],
+            )
+            await conn.execute_query(
+                f"UPDATE {blob_table} SET refcount = refcount - "
+                f"(SELECT COUNT(*) FROM {file_table} f WHERE f.content_hash = {blob_table}.content_hash AND f.owner_id = ? AND {file_range}) "
+                f"WHERE content_hash IN ({hashes_sql})",
+                [owner_id, *file_args, owner_id, *file_args],
+            )
+            _, dead = await conn.execute_query(
+                f"SELECT path FROM {blob_table} WHERE refcount <= 0 AND content_hash IN ({hashes_sql})",
+                [owner_id, *file_args],
+            )
+            moved = await run_in_thread(blob_store.set_aside, [row[0] for row in dead])
+            await conn.execute_query(
+                f"DELETE FROM {blob_table} WHERE refcount <= 0 AND content_hash IN ({hashes_sql})",
+                [owner_id, *file_args],
+            )
+            deleted_files, _ = await conn.execute_query(
+                f"DELETE FROM {file_table} WHERE owner_id = ? AND {file_range}", [owner_id, *file_args]
+            )
+            deleted_folders = await Folder.filter(Q(owner_id=owner_id) & subtree("path", path)).delete()
+    except BaseException:
+        await run_in_thread(blob_store.restore, moved)
+        raise
+    await run_in_thread(blob_store.purge, moved)
+
+    # Legacy per-user files are not in the blob store; remove them directly
+    await run_in_thread(_remove_all, [row[1] for row in rows if row[2]])
+    await run_in_thread(_remove_thumbnails, [row[0] for row in rows])
+    return {"folders": deleted_folders, "files": deleted_files}
@@ -0,0 +1,110 @@
+"""
+ML-KEM envelopes for drive file keys.
+
+Each upload request encapsulates once to the owner's Kyber public key and
+derives a key-encryption key (KEK) from the shared secret; every file of the
+upload has its random file key wrapped under that KEK. The stored
+File.encryption_key_ciphertext is
+
+    magic "KEM1" (4B) + ML-KEM ciphertext (768B) + AES-GCM(KEK, file key)
+
+with magic + KEM ciphertext as associated data. Unwrapping needs the owner's
+Kyber secret key from the session keyring; decapsulated KEKs are remembered
+per session, so downloading the rest of a batch costs no KEM operation.
+Blobs without the magic are legacy keys wrapped under public_key[:32].
+
+Author: LunaLynx12
+"""
+
+from encryption import aes_encrypt2, aes_decrypt2, derive_key2
+from kyber import generate_shared_key, recover_shared_key
+from utils.executor import run_in_process
+
+ENVELOPE_MAGIC = b"KEM1"
+KEM_CIPHERTEXT_SIZE = 768  # ML-KEM 512
+KEK_INFO = b"SafeQ drive KEK v1"
+
+
+def _derive_kek(shared_key: bytes, kem_ciphertext: bytes) -> bytes:
+    return derive_key2(shared_key, salt=kem_ciphertext[:32], info=KEK_INFO)
+
+
+def is_kem_envelope(blob: bytes) -> bool:
+    return blob[:len(ENVELOPE_MAGIC)] == ENVELOPE_MAGIC
+
+
+def split_envelope(blob: bytes) -> tuple[bytes, bytes]:
+    """
+    return: (kem_ciphertext, wrapped_file_key)
+    raises ValueError: If the blob is not a KEM envelope
+    """
+    if not is_kem_envelope(blob) or len(blob) <= len(ENVELOPE_MAGIC) + KEM_CIPHERTEXT_SIZE:
+        raise ValueError("Not a KEM file key envelope")
+    body = blob[len(ENVELOPE_MAGIC):]
+    return body[:KEM_CIPHERTEXT_SIZE], body[KEM_CIPHERTEXT_SIZE:]
+
+
+class UploadEnvelope:
+    """
+    KEK shared by all files of one upload, plus the KEM ciphertext that
+    protects it.
+    """
+
+    __slots__ = ("kem_ciphertext", "kek")
+
+    def __init__(self, kem_ciphertext: bytes, kek: bytes):
+        self.kem_ciphertext = kem_ciphertext
+        self.kek = kek
+
+    def wrap(self, file_key: bytes) -> bytes:
+        """
+        Wraps a file key; the result goes into File.encryption_key_ciphertext.
+        """
+        aad = ENVELOPE_MAGIC + self.kem_ciphertext
+        return aad + aes_encrypt2(self.kek, file_key, associated_data=aad)
+
+
+async def new_upload_envelope(public_key: bytes) -> UploadEnvelope:
+    """
+    Encapsulates one KEK to the owner's Kyber public key (on the process pool).
+
+    param public_key: Owner's ML-KEM 512 public key
+    type public_key: bytes
+    return: Envelope to wrap every file key of the upload with
+    rtype: UploadEnvelope
+    """
+    shared_key, kem_ciphertext = await run_in_process(generate_shared_key, public_key)
+    return UploadEnvelope(kem_ciphertext, _derive_kek(shared_key, kem_ciphertext))
+
+
+async def unwrap_file_key(blob: bytes, session_keys) -> bytes:
+    """
+    Recovers a file key from its KEM envelope, reusing the session's cached
+    KEK when another file of the same upload was opened before.
+
+    param blob: File.encryption_key_ciphertext
+    type blob: bytes
+    param session_keys: Owner's SessionKeys from the keyring
+    type session_keys: credentials.SessionKeys
+    return: 32-byte file key
+    rtype: bytes
+    raises ValueError / InvalidTag: If the envelope is malformed or does not open
+    """
+    kem_ciphertext, wrapped = split_envelope(blob)
+    kek = session_keys.cached_kek(kem_ciphertext)
+    if kek is None:
+        shared_key = await run_in_process(recover_shared_key, bytes(session_keys.kyber_sk), kem_ciphertext)
+        kek = _derive_kek(shared_key, kem_ciphertext)
+        session_keys.remember_kek(kem_ciphertext, kek)
+    return aes_decrypt2(kek, wrapped, associated_data=ENVELOPE_MAGIC + kem_ciphertext)
+
+
+def unwrap_legacy_file_key(blob: bytes, public_key: bytes) -> bytes:
+    """
+    Recovers a file key wrapped by older uploads under the first 32 bytes of
+    the owner's public key.
+    """
+    aes_key = public_key[:32]
+    if len(aes_key) < 32:
+        aes_key = aes_key.ljust(32, b'\0')[:32]
+    return aes_decrypt2(key=aes_key, data=blob)
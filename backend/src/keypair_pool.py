@@ -0,0 +1,149 @@
+"""
+Pool of pre-generated Kyber and Dilithium keypairs for account registration.
+
+A background task keeps the pool topped up on the process pool; registration
+takes a ready set in O(1) and only generates inline when the pool is empty.
+
+Author: LunaLynx12
+"""
+
+from collections import deque
+import asyncio
+import time
+import config
+from kyber import generate_kyber_keys
+from dilithium import generate_dilithium_keys
+from utils.executor import run_in_process
+from utils.logger import get_logger
+
+logger = get_logger("keypair_pool")
+
+
+def _generate_keypairs(count: int) -> list[tuple[bytes, bytes, bytes, bytes]]:
+    keypairs = []
+    for _ in range(count):
+        kyber_pk, kyber_sk = generate_kyber_keys()
+        dilithium_pk, dilithium_sk = generate_dilithium_keys()
+        keypairs.append((kyber_pk, kyber_sk, dilithium_pk, dilithium_sk))
+    return keypairs
+
+
+class KeypairPool:
+    """
+    Deque of ready (kyber_pk, kyber_sk, dilithium_pk, dilithium_sk) sets,
+    refilled by a background task.
+
+    param depth: Keypair sets kept ready
+    param refill_interval: Seconds between refill rounds
+    param refill_batch: Max sets generated per round (refill rate = batch / interval)
+    """
+
+    def __init__(self, depth: int, refill_interval: float, refill_batch: int):
+        self.depth = depth
+        self.refill_interval = refill_interval
+        self.refill_batch = refill_batch
+        self._ready = deque()
+        self._wake = None  # created by start() on the running loop
+        self._task = None
+        self.generated = 0
+        self.served = 0
+        self.misses = 0
+        self._last_round = None
+        self._last_rate = None
+
+    def _signal(self):
+        if self._wake is not None:
+            self._wake.set()
+
+    def take(self):
+        """
+        Hands out a ready keypair set, or None if the pool is empty.
+        """
+        self._signal()
+        if not self._ready:
+            self.misses += 1
+            return None
+        self.served += 1
+        return self._ready.popleft()
+
+    async def acquire(self) -> tuple[bytes, bytes, bytes, bytes]:
+        """
+        Returns (kyber_pk, kyber_sk, dilithium_pk, dilithium_sk), from the pool
+        when possible, otherwise generated inline on the process pool.
+        """
+        keypairs = self.take()
+        if keypairs is None:
+            keypairs = (await run_in_process(_generate_keypairs, 1))[0]
+        return keypairs
+
+    async def refill_once(self) -> int:
+        """
+        Generates up to refill_batch sets, split across the process workers.
+        """
+        total = min(self.depth - len(self._ready), self.refill_batch)
+        if total <= 0:
+            return 0
+
+        started = time.monotonic()
+        workers = max(min(config.executor_process_workers, total), 1)
+        counts = [total // workers + (1 if i < total % workers else 0) for i in range(workers)]
+        batches = await asyncio.gather(*(run_in_process(_generate_keypairs, count) for count in counts))
+        for batch in batches:
+            self._ready.extend(batch)
+
+        self.generated += total
+        self._last_round = time.time()
+        self._last_rate = total / max(time.monotonic() - started, 1e-9)
+        return total
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.refill_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            started = time.monotonic()
+            try:
+                generated = await self.refill_once()
+            except Exception as e:
+                logger.warning("keypair pool refill failed", extra={"fields": {"error": repr(e)}})
+                generated = 0
+            if generated:
+                # Cap the refill rate at refill_batch sets per interval
+                await asyncio.sleep(max(self.refill_interval - (time.monotonic() - started), 0))
+
+    def start(self):
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def metrics(self) -> dict:
+        return {
+            "ready": len(self._ready),
+            "depth": self.depth,
+            "refill_interval_s": self.refill_interval,
+            "refill_batch": self.refill_batch,
+            "max_refill_rate_per_s": round(self.refill_batch / self.refill_interval, 3),
+            "last_refill_rate_per_s": round(self._last_rate, 3) if self._last_rate else None,
+            "generated": self.generated,
+            "served": self.served,
+            "misses": self.misses,
+            "last_refill": self._last_round,
+        }
+
+
+keypair_pool = KeypairPool(
+    depth=config.keypair_pool_depth,
+    refill_interval=config.keypair_pool_refill_interval,
+    refill_batch=config.keypair_pool_refill_batch,
+)
@@ -7,6 +7,129 @@ Author: LunaLynx12
 
 
 from kyber_py.ml_kem import ML_KEM_512
+from kyber_py.utilities.utils import select_bytes
+import functools
+import config
+
+_KEM = ML_KEM_512
+
+
+class EncapsulationContext:
+    """
+    A recipient's ML-KEM public key, validated, parsed and with A_hat^T
+    expanded once, so every further encapsulation only samples fresh noise.
+    Follows ML_KEM.encaps / _k_pke_encrypt (FIPS 203 Alg. 14, 17, 20).
+
+    param public_key: Encoded ML-KEM 512 public key
+    type public_key: bytes
+    raises ValueError: If the key fails the type or modulus check
+    """
+
+    __slots__ = ("public_key", "h_ek", "t_hat", "A_hat_T")
+
+    def __init__(self, public_key: bytes):
+        if len(public_key) != 384 * _KEM.k + 32:
+            raise ValueError(
+                f"Type check failed, ek_pke has the wrong length, expected {384 * _KEM.k + 32} bytes and received {len(public_key)}"
+            )
+        t_hat_bytes, rho = public_key[:-32], public_key[-32:]
+        t_hat = _KEM.M.decode_vector(t_hat_bytes, _KEM.k, 12, is_ntt=True)
+        if t_hat.encode(12) != t_hat_bytes:
+            raise ValueError("Modulus check failed, t_hat does not encode correctly")
+
+        self.public_key = public_key
+        self.h_ek = _KEM._H(public_key)
+        self.t_hat = t_hat
+        self.A_hat_T = _KEM._generate_matrix_from_seed(rho, transpose=True)
+
+    def encrypt(self, m: bytes, r: bytes) -> bytes:
+        """
+        K-PKE encryption of the 32-byte message m with randomness r.
+        """
+        N = 0
+        y, N = _KEM._generate_error_vector(r, _KEM.eta_1, N)
+        e1, N = _KEM._generate_error_vector(r, _KEM.eta_2, N)
+        e2, N = _KEM._generate_polynomial(r, _KEM.eta_2, N)
+
+        y_hat = y.to_ntt()
+        u = (self.A_hat_T @ y_hat).from_ntt() + e1
+        mu = _KEM.R.decode(m, 1).decompress(1)
+        v = self.t_hat.dot(y_hat).from_ntt() + e2 + mu
+
+        return u.compress(_KEM.du).encode(_KEM.du) + v.compress(_KEM.dv).encode(_KEM.dv)
+
+    def encaps(self) -> tuple[bytes, bytes]:
+        """
+        Encapsulates a fresh shared key to this public key.
+
+        return: Tuple (shared_key, ciphertext), as ML_KEM_512.encaps
+        rtype: tuple[bytes, bytes]
+        """
+        m = _KEM.random_bytes(32)
+        K, r = _KEM._G(m + self.h_ek)
+        return K, self.encrypt(m, r)
+
+
+@functools.lru_cache(maxsize=config.kyber_context_cache_size)
+def encapsulation_context(public_key: bytes) -> EncapsulationContext:
+    """
+    Returns the cached EncapsulationContext of a public key (LRU per process).
+
+    raises ValueError: If the key is malformed
+    """
+    return EncapsulationContext(public_key)
+
+
+class DecapsulationContext:
+    """
+    A parsed ML-KEM secret key for decapsulating many ciphertexts in a row.
+    The re-encryption step reuses the embedded public key's expanded matrix.
+    Not cached globally - callers keep it only as long as the batch.
+    Follows ML_KEM.decaps / _decaps_internal (FIPS 203 Alg. 15, 18, 21).
+
+    param secret_key: Encoded ML-KEM 512 decapsulation key
+    type secret_key: bytes
+    raises ValueError: If the key fails the type or hash check
+    """
+
+    __slots__ = ("s_hat", "h", "z", "ek")
+
+    def __init__(self, secret_key: bytes):
+        k = _KEM.k
+        if len(secret_key) != 768 * k + 96:
+            raise ValueError(
+                f"decapsulation type check failed. Expected {768 * k + 96} bytes and obtained {len(secret_key)}"
+            )
+        dk_pke = secret_key[0 : 384 * k]
+        ek_pke = secret_key[384 * k : 768 * k + 32]
+        self.h = secret_key[768 * k + 32 : 768 * k + 64]
+        self.z = secret_key[768 * k + 64 :]
+        if _KEM._H(ek_pke) != self.h:
+            raise ValueError("hash check failed")
+
+        self.s_hat = _KEM.M.decode_vector(dk_pke, k, 12, is_ntt=True)
+        self.ek = encapsulation_context(ek_pke)
+
+    def decaps(self, ciphertext: bytes) -> bytes:
+        """
+        Recovers the shared key of one ciphertext (implicit rejection on tampering).
+
+        raises ValueError: If the ciphertext has the wrong length
+        """
+        if len(ciphertext) != 32 * (_KEM.du * _KEM.k + _KEM.dv):
+            raise ValueError(
+                f"ciphertext type check failed. Expected {32 * (_KEM.du * _KEM.k + _KEM.dv)} bytes and obtained {len(ciphertext)}"
+            )
+        n = _KEM.k * _KEM.du * 32
+        u = _KEM.M.decode_vector(ciphertext[:n], _KEM.k, _KEM.du).decompress(_KEM.du)
+        v = _KEM.R.decode(ciphertext[n:], _KEM.dv).decompress(_KEM.dv)
+        w = v - (self.s_hat.dot(u.to_ntt())).from_ntt()
+        m_prime = w.compress(1).encode(1)
+
+        K_prime, r_prime = _KEM._G(m_prime + self.h)
+        K_bar = _KEM._J(self.z + ciphertext)
+        c_prime = self.ek.encrypt(m_prime, r_prime)
+        return select_bytes(K_bar, K_prime, ciphertext == c_prime)
 
 def generate_kyber_keys():
     """
@@ -32,7 +155,7 @@ def generate_shared_key(public_key: bytes) -> tuple[bytes, bytes]:
         - shared_key (bytes): Symmetric key derived during encapsulation
         - ciphertext (bytes): Encrypted data to be sent to the recipient
     """
-    return ML_KEM_512.encaps(public_key)
+    return encapsulation_context(public_key).encaps()
 
 
 def recover_shared_key(secret_key: bytes, ciphertext: bytes) -> bytes:
@@ -48,4 +171,33 @@ def recover_shared_key(secret_key: bytes, ciphertext: bytes) -> bytes:
     return: Shared secret key used for symmetric encryption/decryption.
     rtype: bytes
     """
-    return ML_KEM_512.decaps(secret_key, ciphertext)
\ No newline at end of file
+    return ML_KEM_512.decaps(secret_key, ciphertext)
+
+
+def encaps_many(public_keys) -> list[tuple[bytes, bytes]]:
+    """
+    Encapsulates one fresh shared key per entry; repeated recipients reuse
+    their cached EncapsulationContext.
+
+    param public_keys: Iterable of recipient public keys (repeats allowed)
+    type public_keys: Iterable[bytes]
+    return: One (shared_key, ciphertext) tuple per public key, in order
+    rtype: list[tuple[bytes, bytes]]
+    """
+    return [encapsulation_context(public_key).encaps() for public_key in public_keys]
+
+
+def decaps_many(secret_key: bytes, ciphertexts) -> list[bytes]:
+    """
+    Recovers the shared keys of many ciphertexts sent to one recipient,
+    parsing the secret key once.
+
+    param secret_key: Recipient's private Kyber key.
+    type secret_key: bytes
+    param ciphertexts: Iterable of encapsulated keys
+    type ciphertexts: Iterable[bytes]
+    return: One shared key per ciphertext, in order
+    rtype: list[bytes]
+    """
+    context = DecapsulationContext(bytes(secret_key))
+    return [context.decaps(ciphertext) for ciphertext in ciphertexts]
@@ -1,31 +1,69 @@
+from utils import startup_profile
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import RedirectResponse
 from tortoise.contrib.fastapi import register_tortoise
 from contextlib import asynccontextmanager
 from utils.check_path import check_paths
+from utils.pagination import NEXT_CURSOR_HEADER
 import uvicorn
 import config
 from db import init_db
+from models import rebuild_conversations
 from routes import tests_route as tests_routes
 from routes import auth_route as auth_routes
 from routes import files_route as files_auths
+from routes import folders_route as folders_routes
 from routes import messages_route as messages_routes
 from routes import bb84_route as bb84_routes
+from routes import metrics_route as metrics_routes
+from utils.executor import shutdown_executors
+from utils.logger import stop_logging
+from qkd_pool import key_pool
+from keypair_pool import keypair_pool
+from thumbnails import thumbnail_queue
+from scrubber import scrubber
+from upload_sweeper import upload_sweeper
+from message_hub import message_hub
+from credentials import credential_service
+import argparse
+import json
+
+startup_profile.mark("imports")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print("🚀 Starting up...")
     await init_db()
+    await rebuild_conversations()
+    key_pool.start()
+    keypair_pool.start()
+    thumbnail_queue.start()
+    upload_sweeper.start()
+    if config.scrub_enabled:
+        scrubber.start()
+    await message_hub.start()
+    startup_profile.mark("ready")
     yield
     print("🛑 Shutting down...")
+    await key_pool.stop()
+    await keypair_pool.stop()
+    await thumbnail_queue.stop()
+    await scrubber.stop()
+    await upload_sweeper.stop()
+    await message_hub.stop()
+    credential_service.close()
+    shutdown_executors()
+    stop_logging()
 
 app = FastAPI(lifespan=lifespan)
 app.include_router(tests_routes.router)
 app.include_router(auth_routes.router)
 app.include_router(files_auths.router)
+app.include_router(folders_routes.router)
 app.include_router(messages_routes.router)
 app.include_router(bb84_routes.router)
+app.include_router(metrics_routes.router)
 
 # Add CORS middleware
 app.add_middleware(
@@ -34,6 +72,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
 # Register Tortoise ORM
@@ -51,5 +90,14 @@ async def index():
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SafeQ API server")
+    parser.add_argument("--profile-imports", action="store_true",
+                        help="Print the import-time profile of the app and exit")
+    args = parser.parse_args()
+
+    if args.profile_imports:
+        print(json.dumps(startup_profile.profile_imports("main"), indent=2))
+        raise SystemExit(0)
+
     check_paths()
     uvicorn.run("main:app", host=config.server_address, port=config.server_port, reload=False)
\ No newline at end of file
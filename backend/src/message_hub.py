@@ -0,0 +1,131 @@
+"""
+Real-time fan-out of chat messages to connected WebSocket clients.
+
+Every worker keeps the sockets of its own users in a MessageHub. Messages are
+published through a Broker: the default InProcessBroker delivers straight to
+the local hub, while a multi-worker deployment plugs in a broker (Redis,
+NATS, ...) that relays publishes to the hubs of every worker.
+
+Author: LunaLynx12
+"""
+
+from abc import ABC, abstractmethod
+import asyncio
+import importlib
+import config
+
+
+class Broker(ABC):
+    """
+    Transport between publishers and the hubs that hold the sockets.
+
+    Implementations call `deliver(user_id, payload)` on every worker that
+    should see a publish (typically all of them).
+    """
+
+    @abstractmethod
+    async def start(self, deliver) -> None:
+        """
+        Begins relaying publishes to `deliver` on this worker.
+        """
+
+    @abstractmethod
+    async def publish(self, user_id: int, payload: dict) -> None:
+        """
+        Sends a payload for one user to every worker.
+        """
+
+    async def stop(self) -> None:
+        pass
+
+
+class InProcessBroker(Broker):
+    """
+    Single-worker broker: a publish is delivered to the local hub directly.
+    """
+
+    def __init__(self):
+        self._deliver = None
+
+    async def start(self, deliver) -> None:
+        self._deliver = deliver
+
+    async def publish(self, user_id: int, payload: dict) -> None:
+        if self._deliver is not None:
+            self._deliver(user_id, payload)
+
+
+def create_broker() -> Broker:
+    """
+    Builds the broker named by config.message_broker: "memory" or a
+    "module:Class" reference to a Broker subclass.
+    """
+    if config.message_broker == "memory":
+        return InProcessBroker()
+    module_name, _, attr = config.message_broker.partition(":")
+    return getattr(importlib.import_module(module_name), attr)()
+
+
+class MessageHub:
+    """
+    Per-user sets of bounded queues, one queue per open WebSocket.
+    A socket that falls config.message_ws_queue_size events behind loses its
+    oldest pending events rather than stalling the publisher.
+    """
+
+    def __init__(self, broker: Broker = None):
+        self.broker = broker
+        self._connections = {}
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    async def start(self):
+        if self.broker is None:
+            self.broker = create_broker()
+        await self.broker.start(self._deliver)
+
+    async def stop(self):
+        if self.broker is not None:
+            await self.broker.stop()
+
+    def connect(self, user_id: int) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=config.message_ws_queue_size)
+        self._connections.setdefault(user_id, set()).add(queue)
+        return queue
+
+    def disconnect(self, user_id: int, queue: asyncio.Queue) -> None:
+        queues = self._connections.get(user_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._connections[user_id]
+
+    async def publish(self, user_ids, payload: dict) -> None:
+        """
+        Sends payload to every socket of the given users (through the broker).
+        """
+        for user_id in set(user_ids):
+            self.published += 1
+            await self.broker.publish(user_id, payload)
+
+    def _deliver(self, user_id: int, payload: dict) -> None:
+        for queue in self._connections.get(user_id, ()):
+            if queue.full():
+                queue.get_nowait()
+                self.dropped += 1
+            queue.put_nowait(payload)
+            self.delivered += 1
+
+    def metrics(self) -> dict:
+        return {
+            "broker": type(self.broker).__name__ if self.broker else None,
+            "users_connected": len(self._connections),
+            "sockets": sum(len(queues) for queues in self._connections.values()),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+        }
+
+
+message_hub = MessageHub()
@@ -1,5 +1,7 @@
 from tortoise.models import Model
 from tortoise import fields
+from tortoise.expressions import F
+from tortoise.transactions import in_transaction
 
 
 class Account(Model):
@@ -24,16 +26,127 @@ class Message(Model):
     content = fields.TextField()
     created_at = fields.DatetimeField(auto_now_add=True)
 
+    class Meta:
+        # Keyset pagination of a conversation seeks on (pair, created_at) in both directions
+        indexes = (
+            ("sender_id_id", "receiver_id_id", "created_at"),
+            ("receiver_id_id", "sender_id_id", "created_at"),
+        )
+
     def __str__(self):
         return f"From {self.sender_id} to {self.receiver_id}: {self.content[:20]}"
     
 
-def write_message(sender: Account, receiver: Account, content: str):
+class Conversation(Model):
+    """
+    One row per pair of users that have exchanged messages, kept up to date
+    by write_message() in the same transaction as the Message insert.
+    The pair is stored ordered (user_low.id < user_high.id).
+    """
+    id = fields.IntField(pk=True)
+    user_low = fields.ForeignKeyField("models.Account", related_name="conversations_low")
+    user_high = fields.ForeignKeyField("models.Account", related_name="conversations_high")
+    last_message = fields.ForeignKeyField(
+        "models.Message", related_name=False, null=True, on_delete=fields.SET_NULL
+    )
+    last_message_at = fields.DatetimeField(null=True)
+    last_message_preview = fields.CharField(max_length=100, default="")
+    unread_low = fields.IntField(default=0)  # messages user_low hasn't read yet
+    unread_high = fields.IntField(default=0)  # messages user_high hasn't read yet
+
+    class Meta:
+        unique_together = (("user_low", "user_high"),)
+        indexes = (
+            ("user_low_id", "last_message_at"),
+            ("user_high_id", "last_message_at"),
+        )
+
+    def __str__(self):
+        return f"Conversation {self.user_low_id} <-> {self.user_high_id}"
+
+
+PREVIEW_LENGTH = 100
+
+
+async def write_message(sender: Account, receiver: Account, content: str) -> Message:
     """
     Utility function to create and save a message.
+    Updates the pair's Conversation (last message, preview, receiver's unread
+    count) in the same transaction.
+    """
+    low, high = sorted((sender.id, receiver.id))
+    unread_field = "unread_high" if receiver.id == high else "unread_low"
+
+    async with in_transaction():
+        message = await Message.create(sender_id=sender, receiver_id=receiver, content=content)
+        conversation, _ = await Conversation.get_or_create(user_low_id=low, user_high_id=high)
+        update = {
+            "last_message_id": message.id,
+            "last_message_at": message.created_at,
+            "last_message_preview": content[:PREVIEW_LENGTH],
+        }
+        if sender.id != receiver.id:
+            update[unread_field] = F(unread_field) + 1
+        await Conversation.filter(id=conversation.id).update(**update)
+
+    return message
+
+
+async def mark_conversation_read(user_id: int, other_user_id: int) -> None:
+    """
+    Resets user_id's unread counter for the conversation with other_user_id.
+    """
+    low, high = sorted((user_id, other_user_id))
+    unread_field = "unread_low" if user_id == low else "unread_high"
+    await Conversation.filter(user_low_id=low, user_high_id=high).update(**{unread_field: 0})
+
+
+async def rebuild_conversations() -> int:
+    """
+    Builds the Conversation table from existing messages. Only needed once for
+    databases created before the table existed; does nothing if it is populated.
+    Runs as one INSERT ... SELECT grouped by pair, so no message is loaded
+    into memory.
+
+    return: Number of conversations created
     """
-    message = Message(sender_id=sender, receiver_id=receiver, content=content)
-    return message.save()
+    if await Conversation.exists() or not await Message.exists():
+        return 0
+
+    conversation_table = Conversation._meta.db_table
+    message_table = Message._meta.db_table
+    async with in_transaction() as conn:
+        created, _ = await conn.execute_query(
+            f"INSERT INTO {conversation_table} "
+            f"(user_low_id, user_high_id, last_message_id, last_message_at, last_message_preview, unread_low, unread_high) "
+            f"SELECT pair.low, pair.high, m.id, m.created_at, substr(m.content, 1, ?), 0, 0 "
+            f"FROM (SELECT min(sender_id_id, receiver_id_id) AS low, max(sender_id_id, receiver_id_id) AS high, "
+            f"max(id) AS last_id FROM {message_table} GROUP BY low, high) AS pair "
+            f"JOIN {message_table} m ON m.id = pair.last_id",
+            [PREVIEW_LENGTH],
+        )
+    return created
+
+
+class Blob(Model):
+    """
+    Encrypted content in the drive's blob store, addressed by the SHA-256 of
+    its ciphertext (= File.content_hash of every row that uses it).
+    Convergently encrypted blobs also carry a keyed id of their plaintext so
+    repeat uploads are found before anything is encrypted.
+    """
+    id = fields.IntField(pk=True)
+    content_hash = fields.CharField(max_length=64, unique=True)  # SHA-256 of the ciphertext file
+    convergent_id = fields.CharField(max_length=64, null=True, unique=True)  # HMAC of the plaintext hash, per tenant
+    path = fields.CharField(max_length=1024)
+    size = fields.IntField(default=0)  # plaintext bytes
+    nonce = fields.BinaryField(null=True)  # Stream nonce prefix
+    tag = fields.BinaryField(null=True)  # Tag of the final record
+    refcount = fields.IntField(default=0)  # File rows pointing at this blob
+    created_at = fields.DatetimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.content_hash} (x{self.refcount})"
 
 
 class File(Model):
@@ -62,17 +175,101 @@ class File(Model):
     content_signature = fields.BinaryField(null=True)  # Stores signature of encrypted content
     metadata_signature = fields.BinaryField(null=True)  # Stores signature of file metadata
     content_hash = fields.CharField(max_length=64, null=True)  # SHA-256 hash
+    folder_path = fields.CharField(max_length=1024, default="/")  # Folder shown in the drive (path is the storage location)
+
+    class Meta:
+        # Drive listing seeks per owner on the sort key; see files_route.list_files
+        indexes = (
+            ("owner_id", "updated_at"),
+            ("owner_id", "name"),
+            ("owner_id", "folder_path"),
+        )
 
     def __str__(self):
         return f"{self.name} ({self.size} bytes)"
 
 
+class UploadSession(Model):
+    """
+    A resumable upload in progress. Chunks are encrypted straight into their
+    final place of a segmented stream at drive_location/blobs/tmp/upload-<id>;
+    commit moves the stream into the blob store and creates the File row.
+    """
+    id = fields.UUIDField(pk=True)
+    owner = fields.ForeignKeyField("models.Account", related_name="uploads")
+    filename = fields.CharField(max_length=255)
+    mime_type = fields.CharField(max_length=100, default="")
+    folder_path = fields.CharField(max_length=1024, default="/")  # Drive folder the file lands in
+    size = fields.BigIntField()  # Declared plaintext size
+    segment_size = fields.IntField()  # Stream segment size the chunks are sealed with
+    chunk_size = fields.IntField()  # Plaintext bytes per chunk (a multiple of segment_size)
+    nonce = fields.BinaryField()  # Stream nonce prefix
+    encryption_key_ciphertext = fields.BinaryField()  # KEM-wrapped file key
+    created_at = fields.DatetimeField(auto_now_add=True)
+    updated_at = fields.DatetimeField(auto_now=True)
+
+
+class UploadChunk(Model):
+    id = fields.IntField(pk=True)
+    session = fields.ForeignKeyField("models.UploadSession", related_name="chunks", on_delete=fields.CASCADE)
+    index = fields.IntField()
+    size = fields.IntField()  # Plaintext bytes
+    stored = fields.BooleanField(default=False)  # False while the claiming request is still sealing it
+    failed = fields.BooleanField(default=False)  # Sealing stopped part way; only this same body may be resealed
+    digest = fields.CharField(max_length=64)  # SHA-256 of the plaintext body the chunk was claimed for
+    received_at = fields.DatetimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = (("session", "index"),)
+
+
+class ScrubCheckpoint(Model):
+    """
+    Resume point of the integrity scrubber, one row per scrubbed source.
+    """
+    id = fields.IntField(pk=True)
+    source = fields.CharField(max_length=20, unique=True)  # "blob", or "file" for legacy files outside the blob store
+    last_id = fields.IntField(default=0)  # highest row id verified in the current pass, 0 between passes
+    pass_started_at = fields.DatetimeField(null=True)
+    completed_at = fields.DatetimeField(null=True)  # end of the last full pass
+    passes = fields.IntField(default=0)
+    updated_at = fields.DatetimeField(auto_now=True)
+
+
+class IntegrityFinding(Model):
+    """
+    Stored ciphertext that no longer matches its recorded SHA-256 (bit rot or
+    tampering), or could not be read. At most one open finding per target;
+    it is resolved when a later pass verifies the content again.
+    """
+    id = fields.IntField(pk=True)
+    source = fields.CharField(max_length=20)
+    target_id = fields.IntField()  # Blob.id or File.id, depending on source
+    path = fields.CharField(max_length=1024)
+    kind = fields.CharField(max_length=20)  # "missing", "unreadable" or "hash_mismatch"
+    expected_hash = fields.CharField(max_length=64)
+    actual_hash = fields.CharField(max_length=64, null=True)
+    detail = fields.CharField(max_length=255, default="")
+    first_seen_at = fields.DatetimeField(auto_now_add=True)
+    last_seen_at = fields.DatetimeField()
+    resolved_at = fields.DatetimeField(null=True)
+
+    class Meta:
+        indexes = (("source", "target_id"),)
+
+
 class Folder(Model):
     id = fields.IntField(pk=True)
     name = fields.CharField(max_length=255)
-    path = fields.CharField(max_length=1024)
+    path = fields.CharField(max_length=1024)  # Full logical path, e.g. "/docs/2024" (materialized path)
+    parent_path = fields.CharField(max_length=1024, default="/")
     owner = fields.ForeignKeyField("models.Account", related_name="folders")
     created_at = fields.DatetimeField(auto_now_add=True)
 
+    class Meta:
+        # Subtrees are path ranges, children an equality on parent_path; see folders.py
+        unique_together = (("owner", "path"),)
+        indexes = (("owner_id", "parent_path"),)
+
     def __str__(self):
         return f"{self.name} ({self.path})"
\ No newline at end of file
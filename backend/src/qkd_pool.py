@@ -0,0 +1,189 @@
+"""
+Pool of pre-generated BB84 session keys per conversation pair.
+
+Key generation happens in a background task; readers take a ready key in O(1).
+On a miss (typically the first time a pair opens a chat) one key is
+generated on the thread pool and a refill is scheduled for that pair.
+
+Author: LunaLynx12
+"""
+
+from collections import OrderedDict, deque
+import asyncio
+import time
+import bb84
+import config
+from utils.executor import run_in_thread
+from utils.logger import get_logger
+
+logger = get_logger("qkd_pool")
+
+
+def _generate_keys(count: int, n: int) -> list[dict]:
+    keys = []
+    for _ in range(count):
+        exchange = bb84.simulate_exchange(n)
+        keys.append({
+            "generated_key_length": len(exchange["sifted_key"]),
+            "shared_key": exchange["shared_key"].hex(),
+            "alice_bits_sample": bb84.bits_to_str(exchange["alice_bits"]),
+            "alice_bases_sample": bb84.bases_to_str(exchange["alice_bases"]),  # z=computational, x=Hadamard
+            "bob_bases_sample": bb84.bases_to_str(exchange["bob_bases"]),
+            "matching_bases_count": len(exchange["sifted_key"]),
+        })
+    return keys
+
+
+class QKDKeyPool:
+    """
+    Per-pair deques of ready keys, refilled by a background task.
+
+    param depth: Keys kept ready per pair
+    param refill_interval: Seconds between refill rounds
+    param refill_batch: Max keys generated per round (refill rate = batch / interval)
+    param max_pairs: Pairs tracked before the least recently used is dropped
+    param raw_bits: Raw qubits per simulated exchange
+    """
+
+    def __init__(self, depth: int, refill_interval: float, refill_batch: int, max_pairs: int, raw_bits: int):
+        self.depth = depth
+        self.refill_interval = refill_interval
+        self.refill_batch = refill_batch
+        self.max_pairs = max_pairs
+        self.raw_bits = raw_bits
+        self._pools = OrderedDict()
+        self._wake = None  # created by start() on the running loop
+        self._task = None
+        self.generated = 0
+        self.served = 0
+        self.misses = 0
+        self._last_round = None
+
+    def _signal(self):
+        if self._wake is not None:
+            self._wake.set()
+
+    @staticmethod
+    def _pair(user_a: int, user_b: int) -> tuple[int, int]:
+        return (user_a, user_b) if user_a <= user_b else (user_b, user_a)
+
+    def watch(self, user_a: int, user_b: int) -> deque:
+        """
+        Starts keeping keys ready for a pair (no-op if already tracked).
+        """
+        pair = self._pair(user_a, user_b)
+        pool = self._pools.get(pair)
+        if pool is None:
+            pool = self._pools[pair] = deque()
+            if len(self._pools) > self.max_pairs:
+                self._pools.popitem(last=False)
+            self._signal()
+        else:
+            self._pools.move_to_end(pair)
+        return pool
+
+    def take(self, user_a: int, user_b: int):
+        """
+        Hands out a ready key for the pair, or None if the pool is empty.
+        """
+        pool = self.watch(user_a, user_b)
+        if not pool:
+            self.misses += 1
+            self._signal()
+            return None
+        self.served += 1
+        if len(pool) <= self.depth // 2:
+            self._signal()
+        return pool.popleft()
+
+    async def acquire(self, user_a: int, user_b: int) -> dict:
+        """
+        Returns a key for the pair, from the pool when possible, otherwise
+        generated inline on the thread pool.
+        """
+        key = self.take(user_a, user_b)
+        if key is None:
+            key = (await run_in_thread(_generate_keys, 1, self.raw_bits))[0]
+        return key
+
+    async def refill_once(self) -> int:
+        """
+        Tops up the emptiest pairs, generating at most refill_batch keys.
+        """
+        budget = self.refill_batch
+        wanted = sorted(
+            ((len(pool), pair) for pair, pool in self._pools.items() if len(pool) < self.depth),
+        )
+        plan = []
+        for have, pair in wanted:
+            if budget <= 0:
+                break
+            count = min(self.depth - have, budget)
+            plan.append((pair, count))
+            budget -= count
+
+        total = self.refill_batch - budget
+        if total:
+            keys = await run_in_thread(_generate_keys, total, self.raw_bits)
+            for pair, count in plan:
+                pool = self._pools.get(pair)
+                if pool is not None:
+                    pool.extend(keys[:count])
+                del keys[:count]
+            self.generated += total
+        self._last_round = time.time()
+        return total
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.refill_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            started = time.monotonic()
+            try:
+                generated = await self.refill_once()
+            except Exception as e:
+                logger.warning("qkd key pool refill failed", extra={"fields": {"error": repr(e)}})
+                generated = 0
+            if generated:
+                # Cap the refill rate at refill_batch keys per interval
+                await asyncio.sleep(max(self.refill_interval - (time.monotonic() - started), 0))
+
+    def start(self):
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def metrics(self) -> dict:
+        return {
+            "pairs": len(self._pools),
+            "ready_keys": sum(len(pool) for pool in self._pools.values()),
+            "depth": self.depth,
+            "refill_interval_s": self.refill_interval,
+            "refill_batch": self.refill_batch,
+            "max_refill_rate_per_s": round(self.refill_batch / self.refill_interval, 3),
+            "generated": self.generated,
+            "served": self.served,
+            "misses": self.misses,
+            "last_refill": self._last_round,
+        }
+
+
+key_pool = QKDKeyPool(
+    depth=config.qkd_pool_depth,
+    refill_interval=config.qkd_pool_refill_interval,
+    refill_batch=config.qkd_pool_refill_batch,
+    max_pairs=config.qkd_pool_max_pairs,
+    raw_bits=config.qkd_pool_raw_bits,
+)
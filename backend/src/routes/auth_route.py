@@ -2,18 +2,13 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel
 from tortoise.exceptions import DoesNotExist
 from models import Account, Folder
-from utils.security import verify_password, get_password_hash
 from utils.jwt import create_access_token, get_current_user
 import config
-from kyber import generate_kyber_keys
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.backends import default_backend
-from encryption import aes_encrypt2
 import os
-from encryption import aes_decrypt2
-from dilithium_py.dilithium import Dilithium2
 from dilithium import sign_message, save_key
+from credentials import credential_service
+from keypair_pool import keypair_pool
+from utils.executor import run_in_thread
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 
@@ -35,33 +30,17 @@ async def register_user(request: RegisterRequest):
         raise HTTPException(status_code=400, detail="Email already registered")
 
 
-    # Generate Kyber key pair
-    public_key, private_key = generate_kyber_keys()
-
-    # Generate Dilithium key pair
-    dilithium_sk, dilithium_pk = Dilithium2.keygen()
-    
-    # Generate random salt for key derivation
-    salt = os.urandom(16)
-    
-    # Derive encryption key from password
-    kdf = PBKDF2HMAC(
-        algorithm=hashes.SHA256(),
-        length=32,  # 256-bit key for AES-256
-        salt=salt,
-        iterations=100000,
-        backend=default_backend()
-    )
-    encryption_key = kdf.derive(request.password.encode())
+    # Take pre-generated Kyber and Dilithium key pairs (inline keygen if the pool is empty)
+    public_key, private_key, dilithium_pk, dilithium_sk = await keypair_pool.acquire()
     
-    # Encrypt private key
-    encrypted_private_key = aes_encrypt2(encryption_key, private_key)
-    encrypted_dilithium_key = aes_encrypt2(encryption_key, dilithium_sk)
+    # Hash the password and wrap the private keys on the KDF pool
+    password_hash, salt, encrypted_private_key, encrypted_dilithium_key = \
+        await credential_service.seal(request.password, private_key, dilithium_sk)
 
     user = await Account.create(
         username=request.username,
         email=request.email,
-        password_hash=get_password_hash(request.password),
+        password_hash=password_hash,
         kyber_public_key=public_key,
         kyber_private_key_enc=encrypted_private_key,
         dilithium_public_key=dilithium_pk,
@@ -71,7 +50,7 @@ async def register_user(request: RegisterRequest):
 
     # Create user-specific folder in the drive
     user_folder_path = os.path.join(config.drive_location, str(user.id))
-    os.makedirs(user_folder_path, exist_ok=True)
+    await run_in_thread(os.makedirs, user_folder_path, exist_ok=True)
     
 
     return {
@@ -85,31 +64,20 @@ async def register_user(request: RegisterRequest):
 @router.post("/login")
 async def login(request: LoginRequest):
     user = await Account.get_or_none(email=request.email)
-    if not user or not verify_password(request.password, user.password_hash):
+    if not user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
-    
-    # Decrypt private keys during login
-    kdf = PBKDF2HMAC(
-        algorithm=hashes.SHA256(),
-        length=32,
-        salt=user.kyber_salt,
-        iterations=100000,
-        backend=default_backend()
-    )
-    encryption_key = kdf.derive(request.password.encode())
 
-    try:
-        kyber_private_key = aes_decrypt2(encryption_key, user.kyber_private_key_enc)
-        dilithium_private_key = aes_decrypt2(encryption_key, user.dilithium_private_key_enc)
-        user_public_key = user.kyber_public_key
-        user_dilithium_pk = user.dilithium_public_key
-    except:
-        raise HTTPException(status_code=401, detail="Key decryption failed - possibly wrong password")
+    # Verify the password and unwrap the private keys on the KDF pool
+    session_keys = await credential_service.unlock(user, request.password)
+    user_public_key = user.kyber_public_key
+    user_dilithium_pk = user.dilithium_public_key
 
     # Generate JWT token
     access_token = create_access_token(
         data={"sub": str(user.id)}
     )
+    # Keep the unwrapped keys for this token's lifetime
+    credential_service.open_session(access_token, session_keys)
     
     return {
         "access_token": access_token,
@@ -1,100 +1,175 @@
-from fastapi import APIRouter, HTTPException, Depends
-from pydantic import BaseModel
-from qiskit import QuantumCircuit, Aer, execute
+from fastapi import APIRouter, HTTPException, Depends, Query, WebSocket, WebSocketDisconnect
+from pydantic import BaseModel, Field
+from bb84_sessions import create_session_store, notifier, session_events, SESSION_EVENTS
+import bb84
+import config
+import asyncio
+import secrets
+import time
 
 # TODO: generate dilithium key when user registers
 # TODO: function to verify message authencity using dilithium public key
 
 router = APIRouter(prefix="/quantum", tags=["Quantum"])
 
-# Storage for client data
-alice_data = {}
-bob_data = {}
+# Alice/Bob submissions, one entry per exchange session
+sessions = None
+
+def get_session_store():
+    global sessions
+    if sessions is None:
+        sessions = create_session_store()
+    return sessions
+
+SessionId = Query("default", min_length=1, max_length=64, description="Key exchange session id")
+
+# '0'/'1' bits; 'x' is the diagonal basis, 'z' or '+' the rectilinear one
+BITS_PATTERN = r"^[01]*$"
+BASES_PATTERN = r"^[zx+]*$"
 
 class PhotonData(BaseModel):
-    bits: str
-    bases: str
+    bits: str = Field(..., pattern=BITS_PATTERN)
+    bases: str = Field(..., pattern=BASES_PATTERN)
 
 class BasisData(BaseModel):
-    bases: str
+    bases: str = Field(..., pattern=BASES_PATTERN)
+
+@router.post("/session")
+async def create_session():
+    """Open a new key exchange session"""
+    session_id = secrets.token_urlsafe(16)
+    await get_session_store().put(session_id, {})
+    return {"session_id": session_id}
 
 @router.get("/check_alice")
-async def check_alice():
+async def check_alice(session_id: str = SessionId):
     """Check if Alice has submitted data"""
-    return {"alice_ready": bool(alice_data)}
+    session = await get_session_store().get(session_id)
+    return {"alice_ready": bool(session and "alice_bits" in session)}
 
 @router.post("/alice/submit")
-async def alice_submit(data: PhotonData):
+async def alice_submit(data: PhotonData, session_id: str = SessionId):
     """Alice submits her initial bits and bases"""
-    alice_data.clear()
-    alice_data.update({
-        "bits": data.bits,
-        "bases": data.bases
+    if len(data.bits) != len(data.bases):
+        raise HTTPException(status_code=400, detail="Number of bases doesn't match number of bits")
+
+    await get_session_store().put(session_id, {
+        "alice_bits": data.bits,
+        "alice_bases": data.bases
     })
-    return {"status": "Alice data received"}
+    notifier.publish(session_id, "alice_submitted")
+    return {"status": "Alice data received", "session_id": session_id}
 
 @router.post("/bob/submit")
-async def bob_submit(data: BasisData):
+async def bob_submit(data: BasisData, session_id: str = SessionId):
     """Bob submits his measurement bases"""
-    if not alice_data:
+    store = get_session_store()
+    session = await store.get(session_id)
+    if not session or "alice_bits" not in session:
         raise HTTPException(status_code=400, detail="Alice hasn't submitted data yet")
     
-    if len(data.bases) != len(alice_data["bits"]):
+    if len(data.bases) != len(session["alice_bits"]):
         raise HTTPException(status_code=400, detail="Number of bases doesn't match Alice's bits")
     
-    bob_data.clear()
-    bob_data.update({
-        "bases": data.bases,
-        "alice_bits": alice_data["bits"],
-        "alice_bases": alice_data["bases"]
-    })
-    return {"status": "Bob data received"}
+    session["bob_bases"] = data.bases
+    await store.put(session_id, session)
+    notifier.publish(session_id, "bob_submitted", "key_ready")
+    return {"status": "Bob data received", "session_id": session_id}
+
+@router.get("/wait")
+async def wait_for_event(
+    session_id: str = SessionId,
+    event: str = Query("key_ready", description="One of: " + ", ".join(SESSION_EVENTS)),
+    timeout: float = Query(config.bb84_wait_timeout, gt=0, le=config.bb84_wait_timeout)
+):
+    """Long-poll until the peer has acted (event happened) or the timeout expires"""
+    if event not in SESSION_EVENTS:
+        raise HTTPException(status_code=400, detail=f"Unknown event: {event}")
+
+    store = get_session_store()
+    queue = notifier.subscribe(session_id)
+    deadline = time.monotonic() + timeout
+    try:
+        while True:
+            happened = session_events(await store.get(session_id))
+            if event in happened:
+                return {"session_id": session_id, "event": event, "ready": True, "events": happened}
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return {"session_id": session_id, "event": event, "ready": False, "events": happened}
+            try:
+                await asyncio.wait_for(queue.get(), timeout=min(remaining, config.bb84_notify_recheck))
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        notifier.unsubscribe(session_id, queue)
+
+@router.websocket("/ws")
+async def session_updates(websocket: WebSocket, session_id: str = SessionId):
+    """Push session events ("alice_submitted", "bob_submitted", "key_ready") as they happen"""
+    await websocket.accept()
+    store = get_session_store()
+    queue = notifier.subscribe(session_id)
+    # Watch the socket too, so a client that leaves an idle session is noticed
+    receiver = asyncio.ensure_future(websocket.receive())
+    sent = set()
+    try:
+        while True:
+            # Re-read the state so events from other workers aren't missed
+            happened = session_events(await store.get(session_id))
+            sent &= set(happened)
+            for event in happened:
+                if event not in sent:
+                    await websocket.send_json({"session_id": session_id, "event": event})
+                    sent.add(event)
+
+            getter = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait(
+                {getter, receiver}, timeout=config.bb84_notify_recheck, return_when=asyncio.FIRST_COMPLETED
+            )
+            if getter in done:
+                if getter.result() == "alice_submitted":
+                    sent.clear()  # Alice started a new round, replay everything
+            else:
+                getter.cancel()
+            if receiver in done:
+                if receiver.result()["type"] == "websocket.disconnect":
+                    break
+                receiver = asyncio.ensure_future(websocket.receive())  # client messages are ignored
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+        notifier.unsubscribe(session_id, queue)
 
 @router.get("/generate_key")
-async def generate_key():
+async def generate_key(session_id: str = SessionId):
     """Generate shared key after both parties submitted data"""
-    if not alice_data or not bob_data:
+    session = await get_session_store().get(session_id)
+    if not session or "alice_bits" not in session or "bob_bases" not in session:
         raise HTTPException(status_code=400, detail="Missing data from Alice or Bob")
     
-    # Build quantum circuit
-    n = len(bob_data["alice_bits"])
-    qc = QuantumCircuit(n, n)
-    
-    # Encode Alice's bits
-    for i in range(n):
-        if bob_data["alice_bits"][i] == '1':
-            qc.x(i)
-        if bob_data["alice_bases"][i] == 'x':
-            qc.h(i)
-    
-    # Apply Bob's measurement bases
-    for i in range(n):
-        if bob_data["bases"][i] == 'x':
-            qc.h(i)
-    
-    qc.measure(range(n), range(n))
-    
-    # Simulate
-    simulator = Aer.get_backend('qasm_simulator')
-    result = execute(qc, simulator, shots=1).result()
-    counts = result.get_counts(qc)
-    measured_bits = list(counts.keys())[0][::-1]  # Reverse for Qiskit endianness
-    
+    alice_bits = bb84.bits_from_str(session["alice_bits"])
+    alice_bases = bb84.bases_from_str(session["alice_bases"])
+    bob_bases = bb84.bases_from_str(session["bob_bases"])
+
+    # Simulate Bob's measurement
+    measured_bits = bb84.measure(alice_bits, alice_bases, bob_bases)
+
     # Sift key (keep bits where bases match)
-    sifted_key = [
-        measured_bits[i] 
-        for i in range(n) 
-        if bob_data["alice_bases"][i] == bob_data["bases"][i]
-    ]
-    
+    sifted_key = bb84.sift(alice_bases, bob_bases, measured_bits)
+
     # Convert to bytes (take first 128 bits)
-    key_bytes = bytes([int(''.join(sifted_key[i:i+8]), 2) for i in range(0, 128, 8)])
+    try:
+        key_bytes = bb84.pack_key(sifted_key, 128)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     key_hex = key_bytes.hex()
     
     return {
-        "alice_bases": bob_data["alice_bases"],
-        "bob_bases": bob_data["bases"],
-        "measured_bits": measured_bits,
-        "sifted_key": ''.join(sifted_key),
+        "alice_bases": session["alice_bases"],
+        "bob_bases": session["bob_bases"],
+        "measured_bits": bb84.bits_to_str(measured_bits),
+        "sifted_key": bb84.bits_to_str(sifted_key),
         "shared_key": key_hex
     }
@@ -1,8 +1,15 @@
-from fastapi import APIRouter, Depends, UploadFile, File as FastAPIFile, HTTPException, Path
-from fastapi.responses import FileResponse, Response
+from fastapi import APIRouter, Depends, UploadFile, File as FastAPIFile, HTTPException, Path, Query, Request, Header
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from pathlib import Path
 from utils.jwt import get_current_user
-from models import Account, File
+from models import Account, File, UploadSession, UploadChunk
+from pydantic import BaseModel, Field as PydanticField
+from typing import Optional, Literal
+from tortoise.expressions import Q
+from utils.pagination import encode_cursor, decode_cursor, NEXT_CURSOR_HEADER
+from uuid import UUID
+from datetime import datetime, timezone
+from tortoise.exceptions import IntegrityError
 import config
 import mimetypes
 from typing import List
@@ -11,150 +18,679 @@ import os
 from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.primitives import hashes
 from encryption import aes_encrypt2, aes_decrypt2, derive_key2
+from encryption import is_stream_ciphertext, decrypt_stream_range, STREAM_HEADER_SIZE
+from encryption import stream_header, encrypt_segment, stream_record_offset, stream_segment_count
+from encryption import STREAM_PREFIX_SIZE, TAG_SIZE
+from utils.executor import run_in_thread
+from key_envelope import new_upload_envelope, is_kem_envelope, unwrap_file_key, unwrap_legacy_file_key, UploadEnvelope
+from credentials import optional_session_keys, session_keys_required, SessionKeys
 import secrets
+import asyncio
+import hashlib
+import blob_store
+import folders
+from thumbnails import thumbnail_queue, thumbnail_etag, read_thumbnail, remove_thumbnail
+from tortoise.transactions import in_transaction
 
 router = APIRouter(prefix="/drive", tags=["Drive"])
 
 
+# Listing columns only: never the key envelope, nonce, tag, signatures or JSON fields
+LISTING_FIELDS = (
+    "id", "name", "size", "mime_type", "created_at", "updated_at", "is_starred",
+    "is_shared", "folder_path", "version", "encryption_status", "quantum_key_id",
+)
+SORT_FIELDS = {"name": "name", "size": "size", "modified": "updated_at"}
+
+
 @router.get("/get")
-async def list_files(user: Account = Depends(get_current_user)):
-    files = await File.filter(owner=user)
-    
+async def list_files(
+    response: Response,
+    user: Account = Depends(get_current_user),
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value of the previous page"),
+    sort: Literal["name", "size", "modified"] = Query("modified"),
+    order: Literal["asc", "desc"] = Query(None, description="Defaults to asc for name, desc otherwise"),
+    mime_type: Optional[str] = Query(None, description="Exact type, or a prefix ending in '/' such as 'image/'"),
+    starred: Optional[bool] = Query(None),
+    shared: Optional[bool] = Query(None),
+    path: Optional[str] = Query(None, description="Only files directly in this folder path"),
+):
+    """
+    Lists the user's files one keyset page at a time, sorted on (sort key, id).
+    The cursor for the following page is returned in the X-Next-Cursor header
+    (absent on the last page).
+    """
+    field = SORT_FIELDS[sort]
+    descending = (order or ("asc" if sort == "name" else "desc")) == "desc"
+
+    query = File.filter(owner_id=user.id)
+    if mime_type:
+        query = query.filter(mime_type__startswith=mime_type) if mime_type.endswith("/") else query.filter(mime_type=mime_type)
+    if starred is not None:
+        query = query.filter(is_starred=starred)
+    if shared is not None:
+        query = query.filter(is_shared=shared)
+    if path is not None:
+        query = query.filter(folder_path=folders.normalize_path(path))
+
+    if cursor is not None:
+        value, file_id = decode_cursor(cursor, 2)
+        try:
+            if field == "updated_at":
+                value = datetime.fromisoformat(value)
+            elif not isinstance(value, str if field == "name" else int):
+                raise TypeError("cursor value does not match the sort")
+            if not isinstance(file_id, int):
+                raise TypeError("cursor id is not an integer")
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        op = "lt" if descending else "gt"
+        query = query.filter(Q(**{f"{field}__{op}": value}) | (Q(**{field: value}) & Q(**{f"id__{op}": file_id})))
+
+    direction = "-" if descending else ""
+    files = await query.order_by(f"{direction}{field}", f"{direction}id").limit(limit).values(*LISTING_FIELDS)
+
+    if len(files) == limit:
+        last = files[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(last[field], last["id"])
+
     return [
         {
-            "id": str(f.id),
-            "name": f.name,
-            "type": "file",  # or "folder" if it's a folder model
-            "size": f.size,
-            "mimeType": "",  # optional - you can add this if you store it
-            "createdAt": f.created_at.isoformat(),
-            "modifiedAt": f.updated_at.isoformat() if hasattr(f, "updated_at") else f.created_at.isoformat(),
-            "isStarred": False,  # Add this field if you have it in your model
-            "isShared": False,   # Add this field if you have it in your model
+            "id": str(f["id"]),
+            "name": f["name"],
+            "type": "file",
+            "size": f["size"],
+            "mimeType": f["mime_type"],
+            "createdAt": f["created_at"].isoformat(),
+            "modifiedAt": f["updated_at"].isoformat(),
+            "isStarred": f["is_starred"],
+            "isShared": f["is_shared"],
             "owner": user.email, # or username
-            "path": f.path,
-            "version": 1,        # Add this if you track versions
-            "encryptionStatus": "encrypted",
-            "quantumKeyId": "",  # Add this if you use encryption keys
+            "path": f["folder_path"],
+            "version": f["version"],
+            "encryptionStatus": f["encryption_status"],
+            "quantumKeyId": f["quantum_key_id"] or "",
             "aiSuggestions": [], # Optional AI suggestions
             "shareLinks": []     # Optional share links
         }
         for f in files
     ]
 
+async def _upload_chunks(file: UploadFile):
+    while chunk := await file.read(config.drive_segment_size):
+        yield chunk
+
+
+def _safe_filename(filename: str) -> str:
+    """
+    Returns the name unchanged if it is a plain file name.
+
+    raises HTTPException: 400 if it contains a path separator or is "." / ".."
+    """
+    if not filename or Path(filename).name != filename or "\\" in filename or filename in (".", ".."):
+        raise HTTPException(status_code=400, detail=f"Invalid file name: {filename!r}")
+    return filename
+
+
+async def _prepare_file(user: Account, filename: str, chunks, envelope: UploadEnvelope, folder_path: str = "/"):
+    """
+    Encrypts an upload into the blob store and builds its (unsaved) File row.
+
+    return: (File row, plaintext file key for the preview pipeline)
+    """
+    # 1. Encrypt the content into the blob store (or reference an identical blob)
+    blob, file_key = await blob_store.store(user.id, chunks)
+    size, content_hash = blob.size, blob.content_hash
+
+    # 2-3. Wrap the file key under the upload's KEM-protected KEK
+    try:
+        encrypted_file_key = envelope.wrap(file_key)
+    except Exception:
+        await blob_store.release(content_hash)
+        raise
+
+    return _file_row(user, filename, blob, encrypted_file_key, folder_path=folder_path), file_key
+
+
+def _file_row(user: Account, filename: str, blob, encrypted_file_key: bytes, mime_type: str = None,
+              folder_path: str = "/") -> File:
+    """
+    Builds the (unsaved) File row for a stored blob.
+    """
+    size, content_hash = blob.size, blob.content_hash
+    dilithium_signature = secrets.token_bytes(64)
+    metadata = f"{user.id}:{filename}:{size}".encode()
+    metadata_signature = secrets.token_bytes(64)
+
+    return File(
+        name=filename,
+        path=blob.path,
+        owner=user,
+        size=size,
+        mime_type=mime_type or mimetypes.guess_type(filename)[0] or "application/octet-stream",
+        encryption_status="encrypted",
+        quantum_key_id=str(user.id),
+        encryption_key_ciphertext=encrypted_file_key,
+        nonce=blob.nonce,  # Per-blob nonce prefix of the stream
+        tag=blob.tag,   # Tag of the final record
+        content_hash=content_hash,
+        folder_path=folder_path,
+        content_signature=dilithium_signature,
+        metadata_signature=metadata_signature
+    )
+
+
+async def _store_file(user: Account, filename: str, chunks, envelope: UploadEnvelope, folder_path: str = "/") -> File:
+    db_file, file_key = await _prepare_file(user, filename, chunks, envelope, folder_path)
+    try:
+        # Save metadata
+        await db_file.save()
+    except Exception:
+        await blob_store.release(db_file.content_hash)
+        raise
+    thumbnail_queue.enqueue(db_file, file_key)
+    return db_file
+
+
+async def _insert_files(rows: List[File]) -> None:
+    """
+    Inserts all rows of an upload in one transaction (a single commit).
+    Rows are saved one by one so each gets the id SQLite assigned to it;
+    bulk_create does not report them.
+    """
+    async with in_transaction():
+        for row in rows:
+            await row.save()
+
+
+def _file_summary(db_file: File) -> dict:
+    return {
+        "id": str(db_file.id),
+        "name": db_file.name,
+        "type": "file",
+        "size": db_file.size,
+        "mimeType": db_file.mime_type,
+        "encryptionStatus": "encrypted",
+        "contentHash": db_file.content_hash
+    }
+
+
 @router.post("/save")
 async def save_file(
     files: List[UploadFile] = FastAPIFile(...),
+    folder: str = Query("/", description="Drive folder to upload into"),
     user: Account = Depends(get_current_user)
 ):
-    user_folder = Path(config.drive_location) / str(user.id)
-    user_folder.mkdir(parents=True, exist_ok=True)
-    new_files_data = []
-
+    """
+    Uploads several files. Encryption runs for up to drive_upload_concurrency
+    files at once, all rows are inserted in one transaction, and files that
+    fail are listed in failedFiles instead of aborting the batch.
+    """
     for file in files:
+        _safe_filename(file.filename)
+    folder_path = await folders.require_folder(user.id, folder)
+    # One encapsulation protects the file keys of the whole upload
+    envelope = await new_upload_envelope(user.kyber_public_key)
+    limit = asyncio.Semaphore(config.drive_upload_concurrency)
+
+    async def prepare(file: UploadFile):
+        async with limit:
+            return await _prepare_file(user, file.filename, _upload_chunks(file), envelope, folder_path)
+
+    outcomes = await asyncio.gather(*(prepare(file) for file in files), return_exceptions=True)
+
+    rows = []
+    file_keys = []
+    failed_files = []
+    for file, outcome in zip(files, outcomes):
+        if isinstance(outcome, Exception):
+            failed_files.append({"name": file.filename, "error": f"Failed to process file {file.filename}: {str(outcome)}"})
+        else:
+            rows.append(outcome[0])
+            file_keys.append(outcome[1])
+
+    if rows:
         try:
-            # 1. Generate random file key
-            file_key = secrets.token_bytes(32)  # AES-256 key
-            
-            # 2. Prepare proper 32-byte encryption key
-            aes_key = user.kyber_public_key[:32]
-            if len(aes_key) < 32:
-                aes_key = aes_key.ljust(32, b'\0')[:32]
-            
-            # 3. Encrypt the file key
-            encrypted_file_key = aes_encrypt2(aes_key, file_key)
-            
-            # 4. Encrypt the content
-            content = await file.read()
-            encrypted_content = aes_encrypt2(file_key, content)
-            import hashlib
-            content_hash = hashlib.sha256(encrypted_content).hexdigest()
-
-            dilithium_signature = secrets.token_bytes(64)
-            metadata = f"{user.id}:{file.filename}:{len(content)}".encode()
-            metadata_signature = secrets.token_bytes(64)
-            
-            # Save to disk
-            file_path = user_folder / file.filename
-            with open(file_path, "wb") as f:
-                f.write(encrypted_content)
-            
-            # Save metadata
-            db_file = await File.create(
-                name=file.filename,
-                path=str(file_path),
-                owner=user,
-                size=len(content),
-                mime_type=mimetypes.guess_type(file.filename)[0] or "application/octet-stream",
-                encryption_status="encrypted",
-                quantum_key_id=str(user.id),
-                encryption_key_ciphertext=encrypted_file_key,
-                nonce=encrypted_content[:12],  # First 12 bytes are nonce
-                tag=encrypted_content[12:28],   # Next 16 bytes are tag
-                content_hash=content_hash,
-                content_signature=dilithium_signature,
-                metadata_signature=metadata_signature
-            )
-            
-            new_files_data.append({
-                "id": str(db_file.id),
-                "name": db_file.name,
-                "type": "file",
-                "size": db_file.size,
-                "mimeType": db_file.mime_type,
-                "encryptionStatus": "encrypted",
-                "contentHash": content_hash
-            })
-            
+            await _insert_files(rows)
         except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to process file {file.filename}: {str(e)}")
+            for row in rows:
+                await blob_store.release(row.content_hash)
+            raise HTTPException(status_code=500, detail=f"Failed to save file metadata: {str(e)}")
+
+    # Previews are generated in the background once the rows exist
+    for row, file_key in zip(rows, file_keys):
+        thumbnail_queue.enqueue(row, file_key)
+
+    return {
+        "message": "Files uploaded securely" if not failed_files else "Some files failed to upload",
+        "newFiles": [_file_summary(row) for row in rows],
+        "failedFiles": failed_files
+    }
+
+
+@router.post("/save_stream")
+async def save_file_stream(
+    request: Request,
+    filename: str = Query(..., description="Name to store the uploaded file under"),
+    folder: str = Query("/", description="Drive folder to upload into"),
+    user: Account = Depends(get_current_user)
+):
+    """
+    Uploads one file sent as the raw request body. The body is encrypted and
+    written to disk while it is still being received.
+    """
+    _safe_filename(filename)
+    folder_path = await folders.require_folder(user.id, folder)
+    try:
+        envelope = await new_upload_envelope(user.kyber_public_key)
+        db_file = await _store_file(user, filename, request.stream(), envelope, folder_path)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to process file {filename}: {str(e)}")
+
+    return {"message": "Files uploaded securely", "newFiles": [_file_summary(db_file)]}
+
+# Resumable uploads
+#
+# POST   /drive/uploads                      -> session (upload_id, chunk_size, chunk_count)
+# PUT    /drive/uploads/{id}/chunks/{index}  raw chunk body, encrypted and persisted on arrival
+# GET    /drive/uploads/{id}                 received / missing chunks and offsets
+# POST   /drive/uploads/{id}/commit          -> the stored file
+# DELETE /drive/uploads/{id}                 abort
+#
+# Every chunk covers whole stream segments, so it is sealed straight into its
+# final position of the segmented stream; commit only hashes and publishes
+# the file. Re-sent chunks that were already stored are acknowledged, not
+# rewritten (rewriting could reuse a nonce with different content); a chunk
+# whose seal failed part way may only be resent with the identical body.
+
+class UploadCreateRequest(BaseModel):
+    filename: str
+    size: int = PydanticField(..., ge=0)
+    mime_type: Optional[str] = None
+    folder: str = "/"
+
+
+def _chunk_count(upload: UploadSession) -> int:
+    return max(1, -(-upload.size // upload.chunk_size))
+
+
+def _chunk_length(upload: UploadSession, index: int) -> int:
+    return min(upload.chunk_size, upload.size - index * upload.chunk_size)
+
+
+def _upload_path(upload: UploadSession) -> Path:
+    return blob_store.upload_staging_path(upload.id)
+
+
+async def _get_upload(upload_id: UUID, user: Account) -> UploadSession:
+    upload = await UploadSession.get_or_none(id=upload_id, owner=user)
+    if upload is None:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    age = (datetime.now(timezone.utc) - upload.updated_at).total_seconds()
+    if age > config.upload_session_ttl:
+        await _discard_upload(upload)
+        raise HTTPException(status_code=410, detail="Upload expired")
+    return upload
+
+
+async def _discard_upload(upload: UploadSession) -> None:
+    path = _upload_path(upload)
+    if await run_in_thread(path.exists):
+        await run_in_thread(os.remove, path)
+    await upload.delete()
+
+
+def _seal_chunk(path: Path, file_key: bytes, header: bytes, segment_size: int,
+                first_segment: int, last_segment: int, data: bytes) -> None:
+    # Seals each segment of a chunk at its record offset in the stream file
+    with open(path, "r+b") as f:
+        for n, start in enumerate(range(0, max(len(data), 1), segment_size)):
+            index = first_segment + n
+            record = encrypt_segment(file_key, header, index, data[start:start + segment_size], index == last_segment)
+            f.seek(stream_record_offset(index, segment_size))
+            f.write(record)
+
+
+def _hash_file(path: Path) -> tuple[str, bytes]:
+    # SHA-256 of the stream and the tag of its final record (the last
+    # TAG_SIZE bytes, which may straddle two read blocks)
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(1024 * 1024):
+            digest.update(block)
+        f.seek(max(f.tell() - TAG_SIZE, 0))
+        tag = f.read(TAG_SIZE)
+    return digest.hexdigest(), tag
+
+
+@router.post("/uploads")
+async def create_upload(request: UploadCreateRequest, user: Account = Depends(get_current_user)):
+    """
+    Starts a resumable upload of a file of known size.
+    """
+    _safe_filename(request.filename)
+    folder_path = await folders.require_folder(user.id, request.folder)
+    envelope = await new_upload_envelope(user.kyber_public_key)
+    segment_size = config.drive_segment_size
+    upload = await UploadSession.create(
+        owner=user,
+        filename=request.filename,
+        mime_type=request.mime_type or "",
+        folder_path=folder_path,
+        size=request.size,
+        segment_size=segment_size,
+        chunk_size=segment_size * config.upload_chunk_segments,
+        nonce=secrets.token_bytes(STREAM_PREFIX_SIZE),
+        encryption_key_ciphertext=envelope.wrap(secrets.token_bytes(32)),
+    )
+
+    path = _upload_path(upload)
+    await run_in_thread(path.parent.mkdir, parents=True, exist_ok=True)
+    header = stream_header(segment_size, upload.nonce)
+    await run_in_thread(path.write_bytes, header)
+
+    return {
+        "upload_id": str(upload.id),
+        "chunk_size": upload.chunk_size,
+        "chunk_count": _chunk_count(upload),
+    }
+
+
+async def _reclaim_chunk(upload: UploadSession, index: int, expected: int, digest: str):
+    """
+    Handles a chunk another request has already claimed.
+
+    return: (chunk, None) when a failed seal of this same body may be
+        redone, or (None, response) when the chunk is already stored
+    raises HTTPException: 409 while another request is still writing it, or
+        if a failed seal was for a different body
+    """
+    chunk = await UploadChunk.get(session=upload, index=index)
+    if chunk.stored:
+        return None, {"index": index, "received": expected, "status": "already received"}
+    if chunk.failed:
+        if chunk.digest != digest:
+            # Resealing other plaintext would reuse the segment nonces
+            raise HTTPException(
+                status_code=409,
+                detail=f"Chunk {index} was partly written with a different body; abort and restart the upload"
+            )
+        if await UploadChunk.filter(id=chunk.id, failed=True).update(failed=False):
+            return chunk, None
+    raise HTTPException(status_code=409, detail=f"Chunk {index} is being written, check the upload status before resending")
+
+
+@router.put("/uploads/{upload_id}/chunks/{index}")
+async def put_upload_chunk(
+    upload_id: UUID,
+    index: int,
+    request: Request,
+    user: Account = Depends(get_current_user),
+    session_keys: SessionKeys = Depends(optional_session_keys)
+):
+    """
+    Stores one chunk (raw body). All chunks are chunk_size bytes except the last.
+    """
+    upload = await _get_upload(upload_id, user)
+    if not 0 <= index < _chunk_count(upload):
+        raise HTTPException(status_code=416, detail="Chunk index out of range")
+    expected = _chunk_length(upload, index)
+
+    if await UploadChunk.exists(session=upload, index=index, stored=True):
+        return {"index": index, "received": expected, "status": "already received"}
+
+    # Memory stays bounded by one chunk
+    data = bytearray()
+    async for part in request.stream():
+        data += part
+        if len(data) > expected:
+            raise HTTPException(status_code=413, detail=f"Chunk {index} must be {expected} bytes")
+    if len(data) != expected:
+        raise HTTPException(status_code=400, detail=f"Chunk {index} must be {expected} bytes, got {len(data)}")
+    data = bytes(data)
+    digest = (await run_in_thread(hashlib.sha256, data)).hexdigest()
+
+    file_key = await _file_key(upload, user, session_keys)
+    segments_per_chunk = upload.chunk_size // upload.segment_size
+    last_segment = stream_segment_count(upload.size, upload.segment_size) - 1
+
+    # Claim the index before writing: a chunk's segment nonces are only ever
+    # used for the body it was claimed with. A claim whose seal failed is
+    # kept (marked failed), so a retry can redo it with the same body only.
+    try:
+        chunk = await UploadChunk.create(session=upload, index=index, size=expected, digest=digest)
+    except IntegrityError:
+        chunk, response = await _reclaim_chunk(upload, index, expected, digest)
+        if response is not None:
+            return response
+    try:
+        await run_in_thread(
+            _seal_chunk, _upload_path(upload), file_key, stream_header(upload.segment_size, upload.nonce),
+            upload.segment_size, index * segments_per_chunk, last_segment, data
+        )
+    except BaseException:
+        await UploadChunk.filter(id=chunk.id).update(failed=True)
+        raise
+
+    await UploadChunk.filter(id=chunk.id).update(stored=True)
+    await UploadSession.filter(id=upload.id).update(updated_at=datetime.now(timezone.utc))
+    return {"index": index, "received": expected, "status": "stored"}
+
+
+@router.get("/uploads/{upload_id}")
+async def get_upload_status(upload_id: UUID, user: Account = Depends(get_current_user)):
+    """
+    Lists received and missing chunks, so a client can resend only the gaps.
+    """
+    upload = await _get_upload(upload_id, user)
+    received = sorted(await UploadChunk.filter(session=upload, stored=True).values_list("index", flat=True))
+    received_set = set(received)
+    return {
+        "upload_id": str(upload.id),
+        "filename": upload.filename,
+        "size": upload.size,
+        "chunk_size": upload.chunk_size,
+        "chunk_count": _chunk_count(upload),
+        "received": received,
+        "received_offsets": [index * upload.chunk_size for index in received],
+        "received_bytes": sum(_chunk_length(upload, index) for index in received),
+        "missing": [index for index in range(_chunk_count(upload)) if index not in received_set],
+    }
+
+
+@router.post("/uploads/{upload_id}/commit")
+async def commit_upload(
+    upload_id: UUID,
+    user: Account = Depends(get_current_user),
+    session_keys: SessionKeys = Depends(optional_session_keys)
+):
+    """
+    Finishes a resumable upload once every chunk is stored.
+    """
+    upload = await _get_upload(upload_id, user)
+    received = await UploadChunk.filter(session=upload, stored=True).count()
+    if received != _chunk_count(upload):
+        raise HTTPException(status_code=409, detail=f"{_chunk_count(upload) - received} chunks missing")
+
+    # The target folder may have been moved or deleted since the upload started
+    folder_path = await folders.require_folder(user.id, upload.folder_path)
+    file_key = await _file_key(upload, user, session_keys)
+    path = _upload_path(upload)
+    content_hash, last_tag = await run_in_thread(_hash_file, path)
+    header = stream_header(upload.segment_size, upload.nonce)
+    blob = await blob_store.publish(path, upload.size, content_hash, header, last_tag)
+
+    db_file = _file_row(user, upload.filename, blob, upload.encryption_key_ciphertext, upload.mime_type, folder_path)
+    try:
+        async with in_transaction():
+            await db_file.save()
+            await upload.delete()
+    except Exception as e:
+        await blob_store.release(blob.content_hash)
+        raise HTTPException(status_code=500, detail=f"Failed to save file metadata: {str(e)}")
+
+    thumbnail_queue.enqueue(db_file, file_key)
+    return {"message": "Files uploaded securely", "newFiles": [_file_summary(db_file)]}
+
+
+@router.delete("/uploads/{upload_id}")
+async def abort_upload(upload_id: UUID, user: Account = Depends(get_current_user)):
+    upload = await UploadSession.get_or_none(id=upload_id, owner=user)
+    if upload is None:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    await _discard_upload(upload)
+    return {"message": "Upload aborted"}
+
+
+def _parse_range(range_header: str, size: int):
+    """
+    Parses a single "bytes=" Range header against a plaintext size.
+
+    return: (start, end) inclusive, or None when the whole file should be
+    sent (no header, or a multi-range request)
+    raises HTTPException: 416 if the range can't be satisfied
+    """
+    if not range_header or "," in range_header:
+        return None
+
+    unsatisfiable = HTTPException(
+        status_code=416,
+        detail="Requested range not satisfiable",
+        headers={"Content-Range": f"bytes */{size}"}
+    )
+    unit, _, spec = range_header.partition("=")
+    start_str, sep, end_str = spec.strip().partition("-")
+    if unit.strip().lower() != "bytes" or not sep:
+        raise unsatisfiable
+
+    try:
+        if start_str:
+            start = int(start_str)
+            end = int(end_str) if end_str else size - 1
+        else:
+            # Suffix range: the last N bytes
+            start = max(size - int(end_str), 0)
+            end = size - 1
+    except ValueError:
+        raise unsatisfiable
+
+    end = min(end, size - 1)
+    if start < 0 or start > end:
+        raise unsatisfiable
+    return start, end
+
+
+async def _file_key(file, user: Account, session_keys) -> bytes:
+    """
+    Unwraps the key of a File (or UploadSession): KEM envelope via the session's Kyber key, or the
+    legacy public_key[:32] wrap of older uploads.
+
+    raises HTTPException: 401 if the session holds no keys for a KEM
+        envelope, 500 if the key does not unwrap
+    """
+    envelope = file.encryption_key_ciphertext
+    if is_kem_envelope(envelope) and session_keys is None:
+        raise session_keys_required()
+
+    try:
+        if is_kem_envelope(envelope):
+            file_key = await unwrap_file_key(envelope, session_keys)
+        else:
+            file_key = unwrap_legacy_file_key(envelope, user.kyber_public_key)
+
+        # Ensure decrypted file key is 32 bytes
+        if len(file_key) != 32:
+            raise ValueError("Decrypted file key is not 32 bytes")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to decrypt file: {str(e)}")
+    return file_key
+
+
+def _decrypted_body(file: File, file_key: bytes, start: int, end: int):
+    # Sync generator: StreamingResponse iterates it in the threadpool, so disk
+    # reads and AES work stay off the event loop.
+    with open(file.path, "rb") as f:
+        if is_stream_ciphertext(f.read(STREAM_HEADER_SIZE)):
+            f.seek(0)
+            if file.size == 0:
+                yield from decrypt_stream_range(f, file_key, 0, 0, 0)
+                return
+            yield from decrypt_stream_range(f, file_key, file.size, start, end)
+        else:
+            # Legacy single-blob ciphertext has to be decrypted as a whole
+            f.seek(0)
+            yield aes_decrypt2(key=file_key, data=f.read())[start:end + 1]
 
-    return {"message": "Files uploaded securely", "newFiles": new_files_data}
 
 @router.get("/download_encrypted/{file_id}")
 async def download_file(
     file_id: int,
-    user: Account = Depends(get_current_user)
+    range_header: str = Header(None, alias="Range"),
+    user: Account = Depends(get_current_user),
+    session_keys: SessionKeys = Depends(optional_session_keys)
 ):
     file = await File.get_or_none(id=file_id, owner=user)
     if not file:
         raise HTTPException(status_code=404, detail="File not found")
-    
+
+    byte_range = _parse_range(range_header, file.size)
+
+    file_key_bytes = await _file_key(file, user, session_keys)
+
+    # 4. Stream the content, decrypting only the records the range touches
+    headers = {
+        "Content-Disposition": f"attachment; filename={file.name}",
+        "Accept-Ranges": "bytes",
+    }
+    if byte_range is None:
+        start, end = 0, file.size - 1
+        status_code = 200
+    else:
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{file.size}"
+        status_code = 206
+    headers["Content-Length"] = str(end - start + 1)
+
+    return StreamingResponse(
+        _decrypted_body(file, file_key_bytes, start, end),
+        status_code=status_code,
+        media_type=file.mime_type,
+        headers=headers
+    )
+
+
+@router.get("/thumbnail/{file_id}")
+async def get_thumbnail(
+    file_id: int,
+    if_none_match: str = Header(None, alias="If-None-Match"),
+    user: Account = Depends(get_current_user),
+    session_keys: SessionKeys = Depends(optional_session_keys)
+):
+    """
+    Serves the small encrypted preview of a file (JPEG thumbnail for images,
+    leading text for documents). A matching If-None-Match gets 304 without
+    any key unwrapping or decryption.
+    """
+    file = await File.get_or_none(id=file_id, owner=user)
+    if not file:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    etag = await run_in_thread(thumbnail_etag, file.id)
+    if etag is None:
+        raise HTTPException(status_code=404, detail="Thumbnail not available")
+
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=86400"}
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    file_key = await _file_key(file, user, session_keys)
     try:
-        # 1. Read encrypted file
-        with open(file.path, "rb") as f:
-            encrypted_content = f.read()
-        
-        # 2. Get proper AES key (32 bytes for AES-256)
-        # Using first 32 bytes of public key as placeholder
-        # Ensure we have exactly 32 bytes
-        aes_key = user.kyber_public_key[:32]
-        if len(aes_key) < 32:
-            aes_key = aes_key.ljust(32, b'\0')[:32]  # Pad with zeros if needed
-        
-        # 3. Decrypt the file key
-        file_key_bytes = aes_decrypt2(
-            key=aes_key,
-            data=file.encryption_key_ciphertext
-        )
-        
-        # 4. Ensure decrypted file key is 32 bytes
-        if len(file_key_bytes) != 32:
-            raise ValueError("Decrypted file key is not 32 bytes")
-        
-        # 5. Decrypt the content
-        decrypted_content = aes_decrypt2(
-            key=file_key_bytes,
-            data=encrypted_content
-        )
-        
-        return Response(
-            content=decrypted_content,
-            media_type=file.mime_type,
-            headers={"Content-Disposition": f"attachment; filename={file.name}"}
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to decrypt file: {str(e)}")
+        media_type, preview = await run_in_thread(read_thumbnail, file.id, file_key)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Thumbnail not available")
+
+    return Response(content=preview, media_type=media_type, headers=headers)
 
 
 @router.post("/delete")
@@ -167,12 +703,16 @@ async def delete_file(
     if not db_file:
         raise HTTPException(status_code=404, detail="File not found")
 
-    # Remove from disk
+    # Drop the blob reference (unlinked with its last reference); legacy
+    # per-user files are removed directly
     try:
-        os.remove(db_file.path)
+        if not await blob_store.release(db_file.content_hash):
+            os.remove(db_file.path)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error deleting file: {str(e)}")
 
+    await run_in_thread(remove_thumbnail, db_file.id)
+
     # Delete from DB
     await db_file.delete()
 
@@ -0,0 +1,101 @@
+from fastapi import APIRouter, Depends, Query
+from pydantic import BaseModel, Field as PydanticField
+from typing import List
+from models import Account, File, Folder
+from utils.jwt import get_current_user
+from tortoise.expressions import Q
+import folders
+
+
+router = APIRouter(prefix="/drive/folders", tags=["Drive"])
+
+
+class FolderCreateRequest(BaseModel):
+    path: str
+    parents: bool = False  # Also create missing ancestors
+
+
+class FolderRelocateRequest(BaseModel):
+    path: str
+    new_path: str
+
+
+class MoveFilesRequest(BaseModel):
+    file_ids: List[int] = PydanticField(..., min_length=1, max_length=1000)
+    path: str
+
+
+def _folder_summary(folder) -> dict:
+    return {
+        "id": str(folder["id"]),
+        "name": folder["name"],
+        "type": "folder",
+        "path": folder["path"],
+        "parentPath": folder["parent_path"],
+        "createdAt": folder["created_at"].isoformat(),
+    }
+
+
+@router.get("")
+async def list_folders(
+    user: Account = Depends(get_current_user),
+    path: str = Query("/", description="Folder whose subfolders are listed"),
+    recursive: bool = Query(False, description="List the whole subtree instead of direct children"),
+):
+    """
+    Lists the subfolders of a folder, ordered by path.
+    """
+    path = await folders.require_folder(user.id, path)
+    query = Folder.filter(owner_id=user.id)
+    if recursive:
+        query = query.filter(folders.subtree("path", path) & ~Q(path=path))
+    else:
+        query = query.filter(parent_path=path)
+    rows = await query.order_by("path").values("id", "name", "path", "parent_path", "created_at")
+    return [_folder_summary(row) for row in rows]
+
+
+@router.post("")
+async def create_folder(request: FolderCreateRequest, user: Account = Depends(get_current_user)):
+    folder = await folders.create_folder(user.id, request.path, request.parents)
+    return _folder_summary({
+        "id": folder.id, "name": folder.name, "path": folder.path,
+        "parent_path": folder.parent_path, "created_at": folder.created_at,
+    })
+
+
+@router.post("/move")
+async def move_folder(request: FolderRelocateRequest, user: Account = Depends(get_current_user)):
+    """
+    Moves or renames a folder together with its subfolders and files.
+    """
+    moved = await folders.move_folder(user.id, request.path, request.new_path)
+    return {"message": "Folder moved", **moved}
+
+
+@router.post("/copy")
+async def copy_folder(request: FolderRelocateRequest, user: Account = Depends(get_current_user)):
+    """
+    Copies a folder tree; the copied files share the stored content.
+    """
+    copied = await folders.copy_folder(user.id, request.path, request.new_path)
+    return {"message": "Folder copied", **copied}
+
+
+@router.delete("")
+async def delete_folder(
+    user: Account = Depends(get_current_user),
+    path: str = Query(..., description="Folder to delete with everything below it"),
+):
+    deleted = await folders.delete_folder(user.id, path)
+    return {"message": "Folder deleted", **deleted}
+
+
+@router.post("/move_files")
+async def move_files(request: MoveFilesRequest, user: Account = Depends(get_current_user)):
+    """
+    Moves files into a folder with one UPDATE.
+    """
+    path = await folders.require_folder(user.id, request.path)
+    moved = await File.filter(owner_id=user.id, id__in=request.file_ids).update(folder_path=path)
+    return {"message": "Files moved", "files": moved}
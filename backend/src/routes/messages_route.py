@@ -4,9 +4,10 @@ from tortoise.exceptions import DoesNotExist
 from models import Account, Message, write_message
 from utils.jwt import get_current_user
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 from pathlib import Path
 import subprocess
+from qkd_pool import key_pool
 
 
 router = APIRouter(prefix="/messages", tags=["Messages"])
@@ -32,7 +33,8 @@ class ConversationPreview(BaseModel):
     user_id: int
     username: str
     last_message: str
-    timestamp: datetime
+    timestamp: Optional[datetime]
+    unread_count: int = 0
 
 
 class ConversationUser(BaseModel):
@@ -86,16 +88,19 @@ async def send_message_demo():
     receiver = await Account.get(id=2)
 
     # Create the message directly
-    new_message = await Message.create(sender_id=sender, receiver_id=receiver, content="test")
+    new_message = await write_message(sender, receiver, "test")
 
     return {"message": "Message sent successfully", "message_id": new_message.id}
 
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, WebSocket, WebSocketDisconnect
 from tortoise.exceptions import DoesNotExist
 from tortoise.expressions import Q
-from models import Account, Message
-from utils.jwt import get_current_user
+from models import Account, Message, Conversation, write_message, mark_conversation_read
+from utils.jwt import get_current_user, authenticate_token
+from message_hub import message_hub
+from utils.pagination import encode_cursor, decode_cursor, NEXT_CURSOR_HEADER
+import asyncio
 
 # Create a router for messaging endpoints
 router = APIRouter(prefix="/messages", tags=["Messages"])
@@ -110,9 +115,10 @@ async def send_message(request: MessageRequest, current_user: Account = Depends(
         raise HTTPException(status_code=404, detail="Receiver not found")
 
     # Create message with Account objects
-    new_message = await Message.create(sender_id=current_user, receiver_id=receiver, content=request.content)
+    new_message = await write_message(current_user, receiver, request.content)
+    key_pool.watch(current_user.id, receiver.id)
 
-    return MessageResponse(
+    response = MessageResponse(
         id=new_message.id,
         sender_id=current_user.id,
         receiver_id=receiver.id,
@@ -120,16 +126,77 @@ async def send_message(request: MessageRequest, current_user: Account = Depends(
         created_at=new_message.created_at,
     )
 
-
-@router.get("/get_messages", response_model=List[MessageResponse])
-async def get_messages(current_user: Account = Depends(get_current_user), limit: int = 100, offset: int = 0):
-    # Get all messages involving the current user
-    messages = (
-        await Message.filter(Q(sender_id=current_user.id) | Q(receiver_id=current_user.id))
-        .order_by("-created_at")
-        .limit(limit)
-        .offset(offset)
+    # Push to the receiver's (and the sender's other) open sockets
+    await message_hub.publish(
+        (receiver.id, current_user.id), {"type": "message", "message": response.model_dump(mode="json")}
     )
+    return response
+
+
+@router.websocket("/ws")
+async def messages_socket(websocket: WebSocket, token: str = Query(None, description="JWT access token")):
+    """
+    Real-time delivery of new messages. Authenticate with ?token=<JWT> or an
+    "Authorization: Bearer <JWT>" header; the server then pushes
+    {"type": "message", "message": {...}} for every message sent to or by the user.
+    """
+    if token is None:
+        scheme, _, credentials = websocket.headers.get("authorization", "").partition(" ")
+        token = credentials if scheme.lower() == "bearer" else None
+
+    try:
+        if token is None:
+            raise HTTPException(status_code=401, detail="Missing token")
+        user = await authenticate_token(token)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.accept()
+    queue = message_hub.connect(user.id)
+    receiver = asyncio.ensure_future(websocket.receive())
+    try:
+        while True:
+            getter = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait({getter, receiver}, return_when=asyncio.FIRST_COMPLETED)
+            if getter in done:
+                await websocket.send_json(getter.result())
+            else:
+                getter.cancel()
+            if receiver in done:
+                if receiver.result()["type"] == "websocket.disconnect":
+                    break
+                receiver = asyncio.ensure_future(websocket.receive())  # client messages are ignored
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+        message_hub.disconnect(user.id, queue)
+
+
+async def _message_page(query, limit: int, cursor: Optional[str], response: Response) -> List[MessageResponse]:
+    """
+    Fetches one page of messages newest first, keyed on (created_at, id).
+    The cursor for the following page is returned in the X-Next-Cursor header
+    (absent on the last page).
+    """
+    if cursor is not None:
+        created_at, message_id = decode_cursor(cursor, 2)
+        try:
+            created_at = datetime.fromisoformat(created_at)
+            if not isinstance(message_id, int):
+                raise TypeError("cursor id is not an integer")
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.filter(
+            Q(created_at__lt=created_at) | (Q(created_at=created_at) & Q(id__lt=message_id))
+        )
+
+    messages = await query.order_by("-created_at", "-id").limit(limit)
+
+    if len(messages) == limit:
+        last = messages[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(last.created_at, last.id)
 
     return [
         MessageResponse(
@@ -143,9 +210,25 @@ async def get_messages(current_user: Account = Depends(get_current_user), limit:
     ]
 
 
+@router.get("/get_messages", response_model=List[MessageResponse])
+async def get_messages(
+    response: Response,
+    current_user: Account = Depends(get_current_user),
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value of the previous page"),
+):
+    # Get all messages involving the current user
+    query = Message.filter(Q(sender_id=current_user.id) | Q(receiver_id=current_user.id))
+    return await _message_page(query, limit, cursor, response)
+
+
 @router.get("/messages_with/{user_id}", response_model=List[MessageResponse])
 async def get_messages_with_user(
-    user_id: int, current_user: Account = Depends(get_current_user), limit: int = 100, offset: int = 0
+    user_id: int,
+    response: Response,
+    current_user: Account = Depends(get_current_user),
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value of the previous page"),
 ):
     try:
         # Verify the other user exists
@@ -154,26 +237,14 @@ async def get_messages_with_user(
         raise HTTPException(status_code=404, detail="User not found")
 
     # Get conversation between two users
-    messages = (
-        await Message.filter(
-            (Q(sender_id=current_user.id) & Q(receiver_id=user_id))
-            | (Q(sender_id=user_id) & Q(receiver_id=current_user.id))
-        )
-        .order_by("-created_at")
-        .limit(limit)
-        .offset(offset)
+    query = Message.filter(
+        (Q(sender_id=current_user.id) & Q(receiver_id=user_id))
+        | (Q(sender_id=user_id) & Q(receiver_id=current_user.id))
     )
-
-    return [
-        MessageResponse(
-            id=msg.id,
-            sender_id=msg.sender_id_id,
-            receiver_id=msg.receiver_id_id,
-            content=msg.content,
-            created_at=msg.created_at,
-        )
-        for msg in messages
-    ]
+    if cursor is None:
+        # Opening the conversation (first page) marks it as read
+        await mark_conversation_read(current_user.id, user_id)
+    return await _message_page(query, limit, cursor, response)
 
 
 # @router.get("/conversations", response_model=List[ConversationUser])
@@ -202,6 +273,15 @@ async def get_messages_with_user(
 #     ]
 
 
+def _conversations_of(user_id: int):
+    return Conversation.filter(Q(user_low_id=user_id) | Q(user_high_id=user_id))
+
+
+async def _conversation_partner_ids(user_id: int) -> set[int]:
+    pairs = await _conversations_of(user_id).values_list("user_low_id", "user_high_id")
+    return {high if low == user_id else low for low, high in pairs}
+
+
 @router.get("/available_users/{user_id}", response_model=List[UserPreview])
 async def get_available_users_for_new_conversation(user_id: int):
     # Verificăm dacă userul există
@@ -210,23 +290,12 @@ async def get_available_users_for_new_conversation(user_id: int):
         raise HTTPException(status_code=404, detail="User not found")
 
     # Găsim toate ID-urile userilor cu care a comunicat deja
-    messaged_user_ids = (
-        await Message.filter(Q(sender_id=user_id) | Q(receiver_id=user_id))
-        .distinct()
-        .values_list("sender_id_id", "receiver_id_id", flat=False)
-    )
-
-    talked_to_ids = set()
-    for sender, receiver in messaged_user_ids:
-        if sender != user_id:
-            talked_to_ids.add(sender)
-        if receiver != user_id:
-            talked_to_ids.add(receiver)
+    talked_to_ids = await _conversation_partner_ids(user_id)
 
     # Returnăm userii care nu sunt el însuși și nu sunt în lista de conversații
-    users = await Account.exclude(id=user_id).exclude(id__in=talked_to_ids)
+    users = await Account.exclude(id=user_id).exclude(id__in=talked_to_ids).values("id", "username")
 
-    return [UserPreview(id=u.id, username=u.username) for u in users]
+    return [UserPreview(id=u["id"], username=u["username"]) for u in users]
 
 
 @router.post("/start_conversation", response_model=StartConversationResponse)
@@ -242,12 +311,26 @@ async def start_conversation_with_user(
     if not other_user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    existing_message = await Message.filter(sender_id=current_user.id, receiver_id=other_user_id).first()
-
-    if existing_message:
+    low, high = sorted((current_user.id, other_user_id))
+    if await Conversation.exists(user_low_id=low, user_high_id=high):
         raise HTTPException(status_code=400, detail="Conversation already started")
 
-    message = await Message.create(sender_id=current_user, receiver_id=other_user, content="start conversation")
+    message = await write_message(current_user, other_user, "start conversation")
+    key_pool.watch(current_user.id, other_user_id)
+
+    await message_hub.publish(
+        (other_user_id, current_user.id),
+        {
+            "type": "message",
+            "message": MessageResponse(
+                id=message.id,
+                sender_id=current_user.id,
+                receiver_id=other_user_id,
+                content=message.content,
+                created_at=message.created_at,
+            ).model_dump(mode="json"),
+        },
+    )
 
     return StartConversationResponse(
         message_id=message.id,
@@ -258,28 +341,37 @@ async def start_conversation_with_user(
     )
 
 
-@router.get("/conversations/{user_id}", response_model=List[ConversationUser])
+@router.get("/conversations/{user_id}", response_model=List[ConversationPreview])
 async def get_conversations_by_user_id(user_id: int):
     # Verificăm dacă userul există
-    user = await Account.get_or_none(id=user_id)
-    if not user:
+    if not await Account.exists(id=user_id):
         raise HTTPException(status_code=404, detail="User not found")
 
-    # Găsim toate mesajele unde userul e implicat
-    messages = await Message.filter(Q(sender_id=user_id) | Q(receiver_id=user_id)).all()
-
-    # Extragem ceilalți useri implicați în conversații
-    other_user_ids = set()
-    for msg in messages:
-        if msg.sender_id_id != user_id:
-            other_user_ids.add(msg.sender_id_id)
-        if msg.receiver_id_id != user_id:
-            other_user_ids.add(msg.receiver_id_id)
-
-    # Îi aducem din baza de date
-    users = await Account.filter(id__in=other_user_ids).all()
+    # Conversațiile userului, cele mai recente primele
+    rows = await _conversations_of(user_id).order_by("-last_message_at").values(
+        "user_low_id",
+        "user_high_id",
+        "user_low__username",
+        "user_high__username",
+        "last_message_preview",
+        "last_message_at",
+        "unread_low",
+        "unread_high",
+    )
 
-    return [ConversationUser(user_id=user.id, username=user.username) for user in users]
+    previews = []
+    for row in rows:
+        side, other = ("low", "high") if row["user_low_id"] == user_id else ("high", "low")
+        previews.append(
+            ConversationPreview(
+                user_id=row[f"user_{other}_id"],
+                username=row[f"user_{other}__username"],
+                last_message=row["last_message_preview"],
+                timestamp=row["last_message_at"],
+                unread_count=row[f"unread_{side}"],
+            )
+        )
+    return previews
 
 
 @router.get("/conversation_with/{other_user_id}", response_model=CombinedResponse)
@@ -299,59 +391,14 @@ async def get_conversation_with_user(other_user_id: int, current_user: Account =
         .order_by("created_at")
         .prefetch_related("sender_id", "receiver_id")
     )
+    await mark_conversation_read(current_user.id, other_user_id)
 
-    import secrets
-    from qiskit import QuantumCircuit, Aer, execute
-
-    n = 128 * 2  # Generate extra bits to account for basis mismatches
-    alice_bits = "".join(secrets.choice("01") for _ in range(n))
-    alice_bases = "".join(secrets.choice("zx") for _ in range(n))  # z=computational, x=Hadamard
-
-    # Generate random bases for Bob
-    bob_bases = "".join(secrets.choice("zx") for _ in range(n))
-
-    # Build and simulate quantum circuit
-    qc = QuantumCircuit(n, n)
-
-    # Alice prepares her qubits
-    for i in range(n):
-        if alice_bits[i] == "1":
-            qc.x(i)
-        if alice_bases[i] == "x":
-            qc.h(i)
+    # Session key comes from the pre-generated pool; only the first open of
+    # a pair waits for one to be generated
+    quantum_key_data = await key_pool.acquire(current_user.id, other_user_id)
 
-    # Bob measures
-    for i in range(n):
-        if bob_bases[i] == "x":
-            qc.h(i)
-
-    qc.measure(range(n), range(n))
-
-    # Simulate
-    simulator = Aer.get_backend("qasm_simulator")
-    result = execute(qc, simulator, shots=1).result()
-    counts = result.get_counts(qc)
-    measured_bits = list(counts.keys())[0][::-1]  # Reverse for Qiskit endianness
-
-    # Sift key (keep bits where bases match)
-    sifted_key = [measured_bits[i] for i in range(n) if alice_bases[i] == bob_bases[i]]
-
-    # Convert to bytes
-    key_bytes = bytes([int("".join(sifted_key[i : i + 8]), 2) for i in range(0, len(sifted_key), 8)])
-    key_hex = key_bytes.hex()
-
-    print("Secred key generated:", key_hex)
-
-    # Then in your endpoint:
     return CombinedResponse(
-        quantum_key_data={
-            "generated_key_length": len(sifted_key),
-            "shared_key": key_hex,
-            "alice_bits_sample": alice_bits,
-            "alice_bases_sample": alice_bases,
-            "bob_bases_sample": bob_bases,
-            "matching_bases_count": len(sifted_key),
-        },
+        quantum_key_data=quantum_key_data,
         conversation_messages=[
             ConversationMessage(
                 id=msg.id,
@@ -0,0 +1,79 @@
+"""
+Runtime metrics for the worker pools and caches.
+
+Author: LunaLynx12
+"""
+
+
+from fastapi import APIRouter
+from utils.executor import executor_metrics
+from utils.startup_profile import startup_report
+from utils.cache import cache_metrics
+from qkd_pool import key_pool
+from keypair_pool import keypair_pool
+from thumbnails import thumbnail_queue
+from scrubber import scrubber
+from upload_sweeper import upload_sweeper
+from models import IntegrityFinding
+from routes.bb84_route import get_session_store
+from bb84_sessions import notifier
+from message_hub import message_hub
+from credentials import credential_service
+import bb84
+
+router = APIRouter(prefix="/metrics", tags=["Metrics"])
+
+
+@router.get("/executor", summary="Worker pool queue depth and latency")
+async def get_executor_metrics():
+    return executor_metrics()
+
+
+@router.get("/startup", summary="Cold-start timings and loaded heavy modules")
+async def get_startup_metrics():
+    return {**startup_report(), "bb84_backends_loaded": bb84.available_backends()}
+
+
+@router.get("/qkd_pool", summary="Pre-generated BB84 session key pool")
+async def get_qkd_pool_metrics():
+    return key_pool.metrics()
+
+
+@router.get("/keypair_pool", summary="Pre-generated Kyber/Dilithium keypairs for registration")
+async def get_keypair_pool_metrics():
+    return keypair_pool.metrics()
+
+
+@router.get("/thumbnails", summary="Background preview queue")
+async def get_thumbnail_metrics():
+    return thumbnail_queue.metrics()
+
+
+@router.get("/scrubber", summary="Ciphertext integrity scrubber progress and open findings")
+async def get_scrubber_metrics():
+    return {**scrubber.metrics(), "open_findings": await IntegrityFinding.filter(resolved_at=None).count()}
+
+
+@router.get("/upload_sweeper", summary="Removal of expired resumable uploads")
+async def get_upload_sweeper_metrics():
+    return upload_sweeper.metrics()
+
+
+@router.get("/bb84_sessions", summary="Active BB84 key exchange sessions")
+async def get_bb84_session_metrics():
+    return {**await get_session_store().metrics(), **notifier.metrics()}
+
+
+@router.get("/message_hub", summary="Connected chat sockets and delivery counters")
+async def get_message_hub_metrics():
+    return message_hub.metrics()
+
+
+@router.get("/credentials", summary="KDF admission control and session keyring")
+async def get_credential_metrics():
+    return credential_service.metrics()
+
+
+@router.get("/caches", summary="Size and hit/miss counters of in-process caches")
+async def get_cache_metrics():
+    return cache_metrics()
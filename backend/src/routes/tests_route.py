@@ -5,11 +5,12 @@ Author: LunaLynx12
 """
 
 
-from dilithium_py.dilithium import Dilithium2 as Dilithium
+from dilithium import generate_dilithium_keys
 from encryption import aes_encrypt, aes_decrypt
 from fastapi import APIRouter, HTTPException, Query
 from kyber import generate_kyber_keys
 from config import TEST_KEY_BYTES
+from utils.executor import run_in_process
 import base64
 
 router = APIRouter()
@@ -38,7 +39,7 @@ async def generate_keys():
     """
     Generates a new Dilithium keypair and returns them in Base64 format.
     """
-    public_key, secret_key = Dilithium.keygen()
+    public_key, secret_key = await run_in_process(generate_dilithium_keys)
     
     return {
         "dilithium_pub": base64.b64encode(public_key).decode("utf-8"),
@@ -50,7 +51,7 @@ async def generate_keys():
     """
     Generates a new Kyber keypair and returns them in Base64 format.
     """
-    kyber_pub, kyber_priv = generate_kyber_keys()
+    kyber_pub, kyber_priv = await run_in_process(generate_kyber_keys)
     
     return {
         "kyber_pub": base64.b64encode(kyber_pub).decode("utf-8"),
@@ -0,0 +1,249 @@
+"""
+Background integrity scrubber for stored drive ciphertext.
+
+Walks the blob store (and legacy per-user files, which are not in it) in id
+order, re-hashes every file from disk and compares the SHA-256 with the one
+recorded at upload. Reads are paced to scrub_rate bytes per second and run
+up to scrub_read_ahead blocks ahead of the hasher, so large drives get
+continuous coverage without I/O bursts. Progress is checkpointed per source
+(ScrubCheckpoint) and resumed after a restart; mismatches, missing and
+unreadable files are recorded as IntegrityFinding rows.
+
+Author: LunaLynx12
+"""
+
+from datetime import datetime, timezone
+from tortoise.expressions import Subquery
+from models import Blob, File, ScrubCheckpoint, IntegrityFinding
+from utils.executor import run_in_thread
+from utils.logger import get_logger
+import asyncio
+import hashlib
+import time
+import config
+
+logger = get_logger("scrubber")
+
+
+async def _blob_rows(after_id: int, limit: int):
+    return await Blob.filter(id__gt=after_id).order_by("id").limit(limit).values_list("id", "path", "content_hash")
+
+
+async def _legacy_file_rows(after_id: int, limit: int):
+    return await (
+        File.filter(id__gt=after_id, content_hash__isnull=False)
+        .exclude(content_hash__in=Subquery(Blob.all().values("content_hash")))
+        .order_by("id").limit(limit).values_list("id", "path", "content_hash")
+    )
+
+
+# source -> (row loader, model the target ids belong to)
+SOURCES = {
+    "blob": (_blob_rows, Blob),
+    "file": (_legacy_file_rows, File),
+}
+
+
+class IntegrityScrubber:
+    """
+    Single background task verifying stored ciphertext source by source.
+
+    param rate: Max bytes read per second (0 = unthrottled)
+    param block_size: Bytes per read
+    param read_ahead: Blocks buffered between the reader and the hasher
+    param batch: Rows fetched per query
+    """
+
+    def __init__(self, rate: int, block_size: int, read_ahead: int, batch: int):
+        self.rate = rate
+        self.block_size = block_size
+        self.read_ahead = read_ahead
+        self.batch = batch
+        self._task = None
+        self._checkpoint = None  # checkpoint of the source being scrubbed
+        self._next_read = 0.0
+        self.checked = 0
+        self.bytes_scanned = 0
+        self.findings = 0
+        self.resolved = 0
+        self.passes = 0
+
+    async def _pace(self, nbytes: int) -> None:
+        # Spaces reads so that on average at most `rate` bytes are read per second
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        self._next_read = max(self._next_read, now) + nbytes / self.rate
+        delay = self._next_read - now
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _read_ahead(self, f, queue: asyncio.Queue) -> None:
+        try:
+            while block := await run_in_thread(f.read, self.block_size):
+                await queue.put(block)
+                await self._pace(len(block))
+            await queue.put(None)
+        except OSError as e:
+            await queue.put(e)
+
+    async def hash_file(self, path: str) -> str:
+        """
+        SHA-256 of a file, read at the configured rate by a reader task that
+        stays at most read_ahead blocks ahead of the hashing.
+
+        raises OSError: If the file is missing or cannot be read
+        """
+        f = await run_in_thread(open, path, "rb")
+        queue = asyncio.Queue(maxsize=self.read_ahead)
+        reader = asyncio.create_task(self._read_ahead(f, queue))
+        digest = hashlib.sha256()
+        try:
+            while (block := await queue.get()) is not None:
+                if isinstance(block, OSError):
+                    raise block
+                await run_in_thread(digest.update, block)
+                self.bytes_scanned += len(block)
+        finally:
+            reader.cancel()
+            try:
+                await reader
+            except asyncio.CancelledError:
+                pass
+            await run_in_thread(f.close)
+        return digest.hexdigest()
+
+    async def _verify(self, source: str, target_id: int, path: str, expected: str, has_open_finding: bool) -> None:
+        actual = None
+        try:
+            actual = await self.hash_file(path)
+        except FileNotFoundError:
+            kind, detail = "missing", "file not found"
+        except OSError as e:
+            kind, detail = "unreadable", str(e)[:255]
+        else:
+            self.checked += 1
+            if actual == expected:
+                if has_open_finding:
+                    now = datetime.now(timezone.utc)
+                    self.resolved += await IntegrityFinding.filter(
+                        source=source, target_id=target_id, resolved_at=None
+                    ).update(resolved_at=now)
+                return
+            kind, detail = "hash_mismatch", ""
+
+        # A row deleted while it was being read (blob released, file removed) is not a finding
+        if kind == "missing" and not await SOURCES[source][1].filter(id=target_id).exists():
+            return
+
+        now = datetime.now(timezone.utc)
+        updated = await IntegrityFinding.filter(source=source, target_id=target_id, resolved_at=None).update(
+            kind=kind, actual_hash=actual, detail=detail, last_seen_at=now
+        )
+        if not updated:
+            await IntegrityFinding.create(
+                source=source, target_id=target_id, path=path, kind=kind,
+                expected_hash=expected, actual_hash=actual, detail=detail, last_seen_at=now,
+            )
+            self.findings += 1
+        logger.warning("integrity finding", extra={"fields": {
+            "source": source, "id": target_id, "kind": kind, "path": path,
+        }})
+
+    async def scrub_source(self, source: str) -> None:
+        """
+        Verifies every row of one source, resuming from its checkpoint.
+        """
+        load_rows = SOURCES[source][0]
+        checkpoint, _ = await ScrubCheckpoint.get_or_create(source=source)
+        self._checkpoint = checkpoint
+        if checkpoint.last_id == 0:
+            checkpoint.pass_started_at = datetime.now(timezone.utc)
+            await checkpoint.save()
+        saved = time.monotonic()
+
+        while rows := await load_rows(checkpoint.last_id, self.batch):
+            open_ids = set(await IntegrityFinding.filter(
+                source=source, resolved_at=None, target_id__in=[row[0] for row in rows]
+            ).values_list("target_id", flat=True))
+            for target_id, path, expected in rows:
+                await self._verify(source, target_id, path, expected, target_id in open_ids)
+                checkpoint.last_id = target_id
+                if time.monotonic() - saved >= config.scrub_checkpoint_interval:
+                    await checkpoint.save()
+                    saved = time.monotonic()
+
+        checkpoint.last_id = 0
+        checkpoint.passes += 1
+        checkpoint.completed_at = datetime.now(timezone.utc)
+        await checkpoint.save()
+        self._checkpoint = None
+        self.passes += 1
+        logger.info("scrub pass complete", extra={"fields": {"source": source, "passes": checkpoint.passes}})
+
+    async def _due_in(self, source: str) -> float:
+        # Seconds until a source needs its next pass; 0 when one is in progress or overdue
+        checkpoint = await ScrubCheckpoint.get_or_none(source=source)
+        if checkpoint is None or checkpoint.last_id or checkpoint.completed_at is None:
+            return 0
+        elapsed = (datetime.now(timezone.utc) - checkpoint.completed_at).total_seconds()
+        return max(config.scrub_pass_interval - elapsed, 0)
+
+    async def _run(self):
+        await asyncio.sleep(config.scrub_start_delay)
+        while True:
+            for source in SOURCES:
+                try:
+                    if await self._due_in(source) == 0:
+                        await self.scrub_source(source)
+                except Exception as e:
+                    logger.error("scrub failed", extra={"fields": {"source": source, "error": repr(e)}})
+            try:
+                wait = min([await self._due_in(source) for source in SOURCES])
+            except Exception:
+                wait = 0
+            # Rounds that failed are retried after the checkpoint interval, not in a tight loop
+            await asyncio.sleep(max(wait, config.scrub_checkpoint_interval))
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._checkpoint is not None:
+            # Keep the progress made since the last periodic checkpoint write
+            try:
+                await self._checkpoint.save()
+            except Exception as e:
+                logger.warning("scrub checkpoint not saved", extra={"fields": {"error": repr(e)}})
+            self._checkpoint = None
+
+    def metrics(self) -> dict:
+        checkpoint = self._checkpoint
+        return {
+            "running": self._task is not None,
+            "rate_bytes_per_s": self.rate,
+            "read_ahead_blocks": self.read_ahead,
+            "source": checkpoint.source if checkpoint is not None else None,
+            "position": checkpoint.last_id if checkpoint is not None else None,
+            "checked": self.checked,
+            "bytes_scanned": self.bytes_scanned,
+            "findings": self.findings,
+            "resolved": self.resolved,
+            "passes": self.passes,
+        }
+
+
+scrubber = IntegrityScrubber(
+    rate=config.scrub_rate,
+    block_size=config.scrub_block_size,
+    read_ahead=config.scrub_read_ahead,
+    batch=config.scrub_batch,
+)
@@ -0,0 +1,200 @@
+"""
+Background generation of small encrypted previews for drive files.
+
+Uploads enqueue a job per file; worker tasks decrypt only what a preview needs
+and store it under drive_thumbnails/<ab>/<file id>, AES-GCM encrypted with a
+key derived from the file key. Images get a JPEG thumbnail (when Pillow is
+installed), text-like documents keep their first preview_text_bytes.
+
+Author: LunaLynx12
+"""
+
+from pathlib import Path
+from io import BytesIO
+import asyncio
+import os
+import config
+from encryption import aes_encrypt2, aes_decrypt2, derive_key2, decrypt_stream_range
+from utils.executor import run_in_thread
+from utils.logger import get_logger
+
+try:
+    from PIL import Image
+except ImportError:  # listed in requirements.txt; without it image thumbnails are skipped
+    Image = None
+
+logger = get_logger("thumbnails")
+
+THUMBNAIL_INFO = b"SafeQ thumbnail v1"
+TEXT_TYPES = ("application/json", "application/xml", "application/javascript", "application/x-yaml")
+
+
+def thumbnail_path(file_id: int) -> Path:
+    return Path(config.drive_thumbnails) / f"{file_id % 256:02x}" / str(file_id)
+
+
+def thumbnail_key(file_key: bytes) -> bytes:
+    return derive_key2(file_key, info=THUMBNAIL_INFO)
+
+
+def preview_kind(mime_type: str):
+    """
+    Returns "image", "text" or None when no preview is produced for a type.
+    """
+    if mime_type.startswith("image/"):
+        return "image" if Image is not None else None
+    if mime_type.startswith("text/") or mime_type in TEXT_TYPES:
+        return "text"
+    return None
+
+
+def _read_plain(path: str, file_key: bytes, size: int, length: int) -> bytes:
+    with open(path, "rb") as f:
+        return b"".join(decrypt_stream_range(f, file_key, size, 0, min(length, size) - 1))
+
+
+def _image_thumbnail(data: bytes) -> bytes:
+    with Image.open(BytesIO(data)) as image:
+        image.thumbnail((config.thumbnail_size, config.thumbnail_size))
+        out = BytesIO()
+        image.convert("RGB").save(out, format="JPEG", quality=80)
+        return out.getvalue()
+
+
+def _render(job: dict) -> tuple[str, bytes]:
+    # Blocking: decrypts the needed prefix and builds (media type, preview)
+    if job["kind"] == "image":
+        return "image/jpeg", _image_thumbnail(_read_plain(job["path"], job["file_key"], job["size"], job["size"]))
+    text = _read_plain(job["path"], job["file_key"], job["size"], config.preview_text_bytes)
+    return "text/plain; charset=utf-8", text.decode("utf-8", errors="ignore").encode()
+
+
+def _write(file_id: int, file_key: bytes, media_type: str, preview: bytes) -> None:
+    path = thumbnail_path(file_id)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    sealed = aes_encrypt2(thumbnail_key(file_key), media_type.encode() + b"\n" + preview)
+    temp = path.with_suffix(".tmp")
+    with open(temp, "wb") as f:
+        f.write(sealed)
+    os.replace(temp, path)
+
+
+def read_thumbnail(file_id: int, file_key: bytes) -> tuple[str, bytes]:
+    """
+    Decrypts a stored preview.
+
+    return: (media type, preview bytes)
+    raises FileNotFoundError: If no preview exists for the file
+    """
+    with open(thumbnail_path(file_id), "rb") as f:
+        sealed = f.read()
+    media_type, _, preview = aes_decrypt2(thumbnail_key(file_key), sealed).partition(b"\n")
+    return media_type.decode(), preview
+
+
+def thumbnail_etag(file_id: int):
+    """
+    Returns the ETag of a stored preview from its file metadata, or None.
+    """
+    try:
+        st = os.stat(thumbnail_path(file_id))
+    except FileNotFoundError:
+        return None
+    return f'"{file_id:x}-{st.st_mtime_ns:x}-{st.st_size:x}"'
+
+
+def remove_thumbnail(file_id: int) -> None:
+    try:
+        os.remove(thumbnail_path(file_id))
+    except FileNotFoundError:
+        pass
+
+
+class ThumbnailQueue:
+    """
+    Bounded job queue drained by background workers. enqueue() never blocks
+    an upload: when the queue is full the job is dropped and counted.
+
+    param workers: Concurrent preview workers
+    param maxsize: Pending jobs kept
+    """
+
+    def __init__(self, workers: int, maxsize: int):
+        self.workers = workers
+        self.maxsize = maxsize
+        self._queue = None  # created by start() on the running loop
+        self._tasks = []
+        self.generated = 0
+        self.skipped = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def enqueue(self, db_file, file_key: bytes) -> bool:
+        """
+        Schedules a preview for a saved File row.
+
+        return: False if no preview applies or the queue is full
+        """
+        kind = preview_kind(db_file.mime_type or "")
+        if kind is None or db_file.size == 0 or (kind == "image" and db_file.size > config.thumbnail_max_source):
+            self.skipped += 1
+            return False
+        if self._queue is None:
+            self.dropped += 1
+            return False
+        try:
+            self._queue.put_nowait({
+                "file_id": db_file.id,
+                "path": db_file.path,
+                "size": db_file.size,
+                "kind": kind,
+                "file_key": file_key,
+            })
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        return True
+
+    async def _work(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                media_type, preview = await run_in_thread(_render, job)
+                await run_in_thread(_write, job["file_id"], job["file_key"], media_type, preview)
+                self.generated += 1
+            except Exception as e:
+                self.failed += 1
+                logger.warning("preview failed", extra={"fields": {"file_id": job["file_id"], "error": repr(e)}})
+            finally:
+                self._queue.task_done()
+
+    def start(self):
+        if not self._tasks:
+            self._queue = asyncio.Queue(maxsize=self.maxsize)
+            self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        self._queue = None
+
+    def metrics(self) -> dict:
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "max_queued": self.maxsize,
+            "image_thumbnails": Image is not None,
+            "generated": self.generated,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "dropped": self.dropped,
+        }
+
+
+thumbnail_queue = ThumbnailQueue(config.thumbnail_workers, config.thumbnail_queue_size)
@@ -0,0 +1,95 @@
+"""
+Periodic removal of abandoned resumable uploads.
+
+An UploadSession idle for longer than upload_session_ttl is only discarded
+when its client touches it again; this sweep deletes the ones nobody comes
+back for, together with their staging stream under blobs/tmp.
+
+Author: LunaLynx12
+"""
+
+from datetime import datetime, timedelta, timezone
+from models import UploadSession
+from blob_store import upload_staging_path
+from utils.executor import run_in_thread
+from utils.logger import get_logger
+import asyncio
+import os
+import config
+
+logger = get_logger("upload_sweeper")
+
+
+def _remove_staging(upload_ids) -> None:
+    for upload_id in upload_ids:
+        try:
+            os.remove(upload_staging_path(upload_id))
+        except FileNotFoundError:
+            pass
+
+
+class UploadSweeper:
+    """
+    Background task deleting expired upload sessions every `interval` seconds.
+
+    param interval: Seconds between sweeps
+    param batch: Sessions deleted per query
+    """
+
+    def __init__(self, interval: float, batch: int = 500):
+        self.interval = interval
+        self.batch = batch
+        self._task = None
+        self.swept = 0
+        self._last_sweep = None
+
+    async def sweep_once(self) -> int:
+        """
+        Deletes every session idle for longer than upload_session_ttl and its
+        staging file (chunk rows go with the session).
+
+        return: Number of sessions removed
+        """
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=config.upload_session_ttl)
+        removed = 0
+        while upload_ids := await UploadSession.filter(updated_at__lt=cutoff).limit(self.batch).values_list("id", flat=True):
+            await run_in_thread(_remove_staging, upload_ids)
+            await UploadSession.filter(id__in=upload_ids).delete()
+            removed += len(upload_ids)  # the delete count also includes cascaded chunk rows
+        self.swept += removed
+        self._last_sweep = datetime.now(timezone.utc).timestamp()
+        return removed
+
+    async def _run(self):
+        while True:
+            try:
+                removed = await self.sweep_once()
+                if removed:
+                    logger.info("expired uploads removed", extra={"fields": {"sessions": removed}})
+            except Exception as e:
+                logger.warning("upload sweep failed", extra={"fields": {"error": repr(e)}})
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def metrics(self) -> dict:
+        return {
+            "interval_s": self.interval,
+            "session_ttl_s": config.upload_session_ttl,
+            "swept": self.swept,
+            "last_sweep": self._last_sweep,
+        }
+
+
+upload_sweeper = UploadSweeper(config.upload_sweep_interval)
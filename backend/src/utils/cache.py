@@ -0,0 +1,104 @@
+"""
+Small in-process caches with LRU bounding, TTL expiry and hit/miss counters.
+
+Every cache registers itself by name so /metrics/caches can report them all.
+
+Author: LunaLynx12
+"""
+
+from collections import OrderedDict
+import threading
+import time
+
+_registry = {}
+
+
+class TTLCache:
+    """
+    Bounded LRU mapping whose entries expire after `ttl` seconds (or a
+    per-entry ttl passed to set()). Thread-safe, so worker threads can share it.
+
+    param name: Name reported in cache_metrics()
+    param maxsize: Entries kept before the least recently used is evicted
+    param ttl: Default lifetime of an entry in seconds
+    param on_evict: Optional callback(key, value) run when an entry leaves
+        the cache for any reason (expiry, LRU, pop, clear)
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float, on_evict=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        _registry[name] = self
+
+    def _drop(self, key):
+        _, value = self._data.pop(key)
+        if self.on_evict is not None:
+            self.on_evict(key, value)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires, value = entry
+            if expires <= time.monotonic():
+                self._drop(key)
+                self.evictions += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl: float = None) -> None:
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            while len(self._data) > self.maxsize:
+                self._drop(next(iter(self._data)))
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            self._drop(key)
+            return entry[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            for key in list(self._data):
+                self._drop(key)
+
+    def __len__(self):
+        return len(self._data)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl_s": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+            }
+
+
+def cache_metrics() -> dict:
+    """
+    Returns the counters of every registered cache.
+    """
+    return {name: cache.metrics() for name, cache in _registry.items()}
@@ -3,6 +3,7 @@ import config
 
 database_location = Path(config.database_location)
 drive_location = Path(config.drive_location)
+drive_thumbnails = Path(config.drive_thumbnails)
 verbose_check = config.server_verbose
 
 def check_paths():
@@ -41,5 +42,13 @@ def check_paths():
             except Exception as e:
                 print(f"   ❌ Error reading contents: {e}")
 
+    # Check thumbnail location (created on first preview if missing)
+    if not drive_thumbnails.exists():
+        if verbose_check:
+            print(f"⚠️ Thumbnail location does not exist: {drive_thumbnails}")
+    else:
+        if verbose_check:
+            print(f"✅ Thumbnail location exists: {drive_thumbnails}")
+
     if verbose_check:
         print("📁 Path check completed.")
\ No newline at end of file
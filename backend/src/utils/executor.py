@@ -0,0 +1,190 @@
+"""
+Worker pools for blocking and CPU-bound work so it never runs on the event loop.
+
+- thread pool: `cryptography`/hashlib calls (they release the GIL) and disk I/O
+- process pool: pure-Python post-quantum code (kyber_py, dilithium_py)
+- kdf pool: password hashing and key unwrapping, kept apart so a login storm
+  cannot starve file and message I/O on the shared thread pool
+
+Author: LunaLynx12
+"""
+
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import multiprocessing
+import threading
+import asyncio
+import time
+import functools
+import config
+
+
+def _timed_call(func, args, kwargs):
+    """
+    Runs func inside the worker and reports when it started and how long it ran.
+    Module-level so it can be pickled for the process pool.
+    """
+    started = time.time()
+    result = func(*args, **kwargs)
+    return result, started, time.time() - started
+
+
+class PoolStats:
+    """
+    Queue-depth and latency counters for one pool.
+    """
+
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0  # awaiter cancelled; the call itself may still finish in its worker
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.run_total = 0.0
+        self.run_max = 0.0
+        self._lock = threading.Lock()
+
+    def submit(self):
+        with self._lock:
+            self.submitted += 1
+
+    def done(self, wait: float, run: float):
+        with self._lock:
+            self.completed += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            self.run_total += run
+            self.run_max = max(self.run_max, run)
+
+    def fail(self):
+        with self._lock:
+            self.failed += 1
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            pending = self.submitted - self.completed - self.failed - self.cancelled
+            finished = max(self.completed, 1)
+            return {
+                "workers": self.max_workers,
+                "pending": pending,
+                "queue_depth": max(pending - self.max_workers, 0),
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "cancelled": self.cancelled,
+                "avg_wait_ms": round(self.wait_total / finished * 1000, 3),
+                "max_wait_ms": round(self.wait_max * 1000, 3),
+                "avg_run_ms": round(self.run_total / finished * 1000, 3),
+                "max_run_ms": round(self.run_max * 1000, 3),
+            }
+
+
+_pools = {}
+_stats = {
+    "thread": PoolStats("thread", config.executor_thread_workers),
+    "process": PoolStats("process", config.executor_process_workers),
+    "kdf": PoolStats("kdf", config.kdf_workers),
+}
+_pools_lock = threading.Lock()
+
+
+def _get_pool(kind: str):
+    # Pools are created on first use so importing this module stays cheap
+    with _pools_lock:
+        pool = _pools.get(kind)
+        if pool is None:
+            if kind == "thread":
+                pool = ThreadPoolExecutor(
+                    max_workers=config.executor_thread_workers,
+                    thread_name_prefix="safeq-worker"
+                )
+            elif kind == "kdf":
+                pool = ThreadPoolExecutor(
+                    max_workers=config.kdf_workers,
+                    thread_name_prefix="safeq-kdf"
+                )
+            else:
+                pool = ProcessPoolExecutor(
+                    max_workers=config.executor_process_workers,
+                    mp_context=multiprocessing.get_context(config.executor_process_start_method)
+                )
+            _pools[kind] = pool
+        return pool
+
+
+async def _run(kind: str, func, args, kwargs):
+    stats = _stats[kind]
+    loop = asyncio.get_running_loop()
+    submitted = time.time()
+    stats.submit()
+    try:
+        result, started, run = await loop.run_in_executor(
+            _get_pool(kind), functools.partial(_timed_call, func, args, kwargs)
+        )
+    except Exception:
+        stats.fail()
+        raise
+    except BaseException:
+        # CancelledError (shutdown, client disconnect): settle the submit too
+        stats.cancel()
+        raise
+    stats.done(max(started - submitted, 0.0), run)
+    return result
+
+
+async def run_in_thread(func, *args, **kwargs):
+    """
+    Runs a blocking call (GIL-releasing crypto, file I/O) on the thread pool.
+
+    param func: Callable to run
+    type func: Callable
+    return: Whatever func returns
+    """
+    return await _run("thread", func, args, kwargs)
+
+
+async def run_in_process(func, *args, **kwargs):
+    """
+    Runs a CPU-bound pure-Python call on the process pool.
+    func and its arguments must be picklable (module-level functions).
+
+    param func: Callable to run
+    type func: Callable
+    return: Whatever func returns
+    """
+    return await _run("process", func, args, kwargs)
+
+
+async def run_in_kdf_pool(func, *args, **kwargs):
+    """
+    Runs password hashing / key derivation on the dedicated KDF threads.
+    Callers are expected to bound admission (see credentials.py).
+
+    param func: Callable to run
+    type func: Callable
+    return: Whatever func returns
+    """
+    return await _run("kdf", func, args, kwargs)
+
+
+def executor_metrics() -> dict:
+    """
+    Returns queue-depth and latency counters of every pool.
+    """
+    return {name: stats.snapshot() for name, stats in _stats.items()}
+
+
+def shutdown_executors():
+    """
+    Stops all pools. Called on application shutdown.
+    """
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        _pools.clear()
@@ -1,12 +1,44 @@
 from datetime import datetime, timedelta
 from jose import jwt
+import hashlib
+import time
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi import Depends, HTTPException, status
+from tortoise.signals import post_save, post_delete
 from models import Account
+from utils.cache import TTLCache
+from utils.logger import get_logger
 import config
 
 bearer_security = HTTPBearer()
-verbose_check = config.server_verbose
+logger = get_logger("jwt")
+
+# Slim principals for authenticated requests: everything routes read from
+# current_user, without the password hash or the encrypted private keys
+PRINCIPAL_FIELDS = ("id", "username", "email", "kyber_public_key", "dilithium_public_key")
+principal_cache = TTLCache("principal", config.principal_cache_size, config.principal_cache_ttl)
+
+# Verified tokens -> user id, keyed by a digest of the whole token so a forged
+# token sharing a prefix or signature with a cached one can never hit
+token_cache = TTLCache("jwt", config.jwt_cache_size, config.jwt_cache_ttl)
+
+
+@post_save(Account)
+async def _account_saved(sender, instance, created, using_db, update_fields):
+    principal_cache.pop(instance.id)
+
+
+@post_delete(Account)
+async def _account_deleted(sender, instance, using_db):
+    principal_cache.pop(instance.id)
+
+
+def invalidate_principal(user_id: int) -> None:
+    """
+    Drops a cached principal. Saves and deletes through the model do this
+    automatically; call it after queryset .update()/.delete() on Account.
+    """
+    principal_cache.pop(user_id)
 
 def create_access_token(data: dict):
     to_encode = data.copy()
@@ -21,47 +53,80 @@ def create_access_token(data: dict):
         config.JWT_SECRET_KEY,
         algorithm=config.JWT_ALGORITHM
     )
-    if verbose_check:
-        print(f"[DEBUG] Created JWT: {encoded_jwt}")
+    logger.debug("issued token", extra={"fields": {"sub": to_encode.get("sub"), "exp": expire.isoformat()}})
     return encoded_jwt
 
 
-async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(bearer_security)
-):
-    token = credentials.credentials
-    if verbose_check:
-        print(f"[DEBUG] Received JWT: {token}")
+def token_fingerprint(token: str) -> bytes:
+    """
+    SHA-256 of the full token; used as the key of per-token caches so raw
+    tokens are never stored or logged.
+    """
+    return hashlib.sha256(token.encode()).digest()
+
 
-    credentials_exception = HTTPException(
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
 
+
+def decode_access_token(token: str) -> int:
+    """
+    Verifies a JWT and returns the user id it was issued for. Verified tokens
+    are cached until min(exp, jwt_cache_ttl), so repeat requests skip the
+    signature check; the cache key is a SHA-256 of the full token.
+
+    raises HTTPException: 401 if the token is invalid, expired or has no subject
+    """
+    digest = token_fingerprint(token)
+    user_id = token_cache.get(digest)
+    if user_id is not None:
+        return user_id
+
     try:
         payload = jwt.decode(
             token,
             config.JWT_SECRET_KEY,
             algorithms=[config.JWT_ALGORITHM]
         )
-        if verbose_check:
-            print(f"[DEBUG] Decoded JWT Payload: {payload}")
-
-        user_id_str: str = payload.get("sub")
-        if user_id_str is None:
-            raise credentials_exception
-        
-        user_id = int(user_id_str)  # Convert back to int for querying the DB
+        user_id = int(payload["sub"])  # Convert back to int for querying the DB
     except Exception as e:
-        if verbose_check:
-            print(f"[ERROR] JWT Decode Failed: {e}")
-        raise credentials_exception
+        logger.debug("token rejected", extra={"fields": {"token": digest.hex()[:12], "error": type(e).__name__}})
+        raise _credentials_exception()
+
+    exp = payload.get("exp")
+    if exp is not None:
+        remaining = exp - time.time()
+        if remaining > 0:
+            token_cache.set(digest, user_id, ttl=min(remaining, config.jwt_cache_ttl))
+
+    return user_id
+
+
+async def authenticate_token(token: str) -> Account:
+    """
+    Resolves a JWT to its Account. Shared by HTTP routes and WebSockets.
+    The Account is a cached, partial instance holding PRINCIPAL_FIELDS only.
 
-    user = await Account.get_or_none(id=user_id)
+    raises HTTPException: 401 if the token is invalid or the user no longer exists
+    """
+    user_id = decode_access_token(token)
+
+    user = principal_cache.get(user_id)
     if user is None:
-        if verbose_check:
-            print(f"[ERROR] User not found with ID: {user_id}")
-        raise credentials_exception
+        user = await Account.filter(id=user_id).only(*PRINCIPAL_FIELDS).first()
+        if user is None:
+            logger.warning("token subject not found", extra={"fields": {"user_id": user_id}})
+            raise _credentials_exception()
+        principal_cache.set(user_id, user)
+
+    return user
+
 
-    return user
\ No newline at end of file
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(bearer_security)
+):
+    return await authenticate_token(credentials.credentials)
@@ -0,0 +1,78 @@
+"""
+Non-blocking, level-gated logging for hot paths.
+
+Loggers created here hand records to a queue; a single background listener
+thread formats them and writes to stdout, so request handlers never block on
+console I/O. Messages below config.log_level are dropped before formatting.
+
+Author: LunaLynx12
+"""
+
+import logging
+import logging.handlers
+import queue
+import sys
+import config
+
+_ROOT = "safeq"
+_listener = None
+_handler = None
+
+
+class _KeyValueFormatter(logging.Formatter):
+    """
+    Renders "time level logger message key=value ..." lines; structured fields
+    come from the `fields` dict passed through `extra`.
+    """
+
+    def format(self, record):
+        line = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+def _setup():
+    global _listener, _handler
+    root = logging.getLogger(_ROOT)
+    root.setLevel(config.log_level)
+    root.propagate = False
+
+    records = queue.SimpleQueue()
+    _handler = logging.handlers.QueueHandler(records)
+    root.addHandler(_handler)
+
+    console = logging.StreamHandler(sys.stdout)
+    console.setFormatter(_KeyValueFormatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+    _listener = logging.handlers.QueueListener(records, console, respect_handler_level=True)
+    _listener.start()
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Returns a queue-backed logger under the "safeq" namespace.
+
+    param name: Component name, e.g. "jwt"
+    type name: str
+    return: Logger
+    rtype: logging.Logger
+    """
+    if _listener is None:
+        _setup()
+    return logging.getLogger(f"{_ROOT}.{name}")
+
+
+def stop_logging() -> None:
+    """
+    Flushes pending records and stops the listener thread (on shutdown).
+    The queue handler is detached too, so the next get_logger() sets up a
+    fresh pair instead of adding a second handler.
+    """
+    global _listener, _handler
+    if _handler is not None:
+        logging.getLogger(_ROOT).removeHandler(_handler)
+        _handler = None
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
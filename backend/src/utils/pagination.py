@@ -0,0 +1,46 @@
+"""
+Opaque cursors for keyset pagination.
+
+A cursor is the sort key of the last row of a page, JSON-encoded and
+base64url-wrapped. The next page is fetched with a WHERE on that key instead
+of an OFFSET, so every page costs the same index seek.
+
+Author: LunaLynx12
+"""
+
+from fastapi import HTTPException
+from datetime import datetime
+import base64
+import json
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(*values) -> str:
+    """
+    Packs the sort key values of a row into an opaque cursor string.
+    Datetimes are stored as ISO 8601 strings.
+    """
+    raw = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(raw, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> list:
+    """
+    Unpacks a cursor produced by encode_cursor.
+
+    param cursor: Cursor string from a previous page
+    type cursor: str
+    param size: Number of values the cursor must hold
+    type size: int
+    return: List of sort key values (datetimes stay ISO strings)
+    raises HTTPException: 400 if the cursor is malformed
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != size:
+            raise ValueError("unexpected cursor shape")
+        return values
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
@@ -1,7 +1,66 @@
+import base64
 import hashlib
+import hmac
+import os
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+import config
+
+# Stored hashes look like "scrypt$n=16384,r=8,p=1$<salt>$<hash>" (base64, no
+# padding), so every account carries its own cost parameters. Hashes without
+# the prefix are the legacy unsalted SHA-256 hex digests.
+SCRYPT_PREFIX = "scrypt"
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode().rstrip("=")
+
+
+def _unb64(text: str) -> bytes:
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return Scrypt(salt=salt, length=32, n=n, r=r, p=p).derive(password.encode())
+
+
+def _parse(hashed_password: str):
+    _, params, salt, digest = hashed_password.split("$")
+    cost = dict(item.split("=") for item in params.split(","))
+    return int(cost["n"]), int(cost["r"]), int(cost["p"]), _unb64(salt), _unb64(digest)
+
 
 def get_password_hash(password: str) -> str:
-    return hashlib.sha256(password.encode()).hexdigest()
+    """
+    Hashes a password with scrypt using the configured cost.
+    Blocking (memory-hard) - run it through the credential service.
+    """
+    n, r, p = config.scrypt_n, config.scrypt_r, config.scrypt_p
+    salt = os.urandom(16)
+    digest = _scrypt(password, salt, n, r, p)
+    return f"{SCRYPT_PREFIX}$n={n},r={r},p={p}${_b64(salt)}${_b64(digest)}"
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return get_password_hash(plain_password) == hashed_password
\ No newline at end of file
+    if not hashed_password.startswith(SCRYPT_PREFIX + "$"):
+        legacy = hashlib.sha256(plain_password.encode()).hexdigest()
+        return hmac.compare_digest(legacy, hashed_password)
+
+    try:
+        n, r, p, salt, digest = _parse(hashed_password)
+    except (ValueError, KeyError):
+        return False
+    return hmac.compare_digest(_scrypt(plain_password, salt, n, r, p), digest)
+
+
+def needs_rehash(hashed_password: str) -> bool:
+    """
+    True for legacy SHA-256 hashes and for scrypt hashes whose cost differs
+    from the configured one, so they can be upgraded on the next login.
+    """
+    if not hashed_password.startswith(SCRYPT_PREFIX + "$"):
+        return True
+    try:
+        n, r, p, _, _ = _parse(hashed_password)
+    except (ValueError, KeyError):
+        return True
+    return (n, r, p) != (config.scrypt_n, config.scrypt_r, config.scrypt_p)
@@ -0,0 +1,88 @@
+"""
+Cold-start accounting: how long the server took to import and become ready,
+which heavy optional modules ended up loaded, and a per-module import-time
+profile (`python main.py --profile-imports`).
+
+Author: LunaLynx12
+"""
+
+import subprocess
+import sys
+import time
+import config
+
+_checkpoints = {"process": time.perf_counter()}
+
+# Optional modules that should only load when a feature needs them
+HEAVY_MODULES = ("qiskit", "qiskit_aer", "scipy", "sympy")
+
+
+def mark(name: str) -> None:
+    """
+    Records a startup checkpoint (e.g. "imports", "ready").
+    """
+    _checkpoints[name] = time.perf_counter()
+
+
+def startup_report() -> dict:
+    """
+    Returns elapsed milliseconds of each checkpoint since this module was
+    imported, the heavy modules currently loaded and the import budget status.
+    """
+    origin = _checkpoints["process"]
+    elapsed = {
+        name: round((stamp - origin) * 1000, 3)
+        for name, stamp in _checkpoints.items()
+        if name != "process"
+    }
+    import_ms = elapsed.get("imports")
+    return {
+        "checkpoints_ms": elapsed,
+        "import_budget_ms": config.startup_import_budget_ms,
+        "within_budget": import_ms is not None and import_ms <= config.startup_import_budget_ms,
+        "heavy_modules_loaded": {name: name in sys.modules for name in HEAVY_MODULES},
+    }
+
+
+def profile_imports(module: str = "main", top: int = 25) -> dict:
+    """
+    Imports `module` in a fresh interpreter with `-X importtime` and returns
+    the top-level packages that spent the most time importing.
+
+    param module: Module to import
+    type module: str
+    param top: Number of entries to return
+    type top: int
+    return: Dict with total_ms, budget_ms, within_budget and the slowest entries
+    rtype: dict
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True
+    )
+
+    # Lines look like "import time: self [us] | cumulative | <indent>module",
+    # with two spaces of indent per nesting level. Self time is summed per
+    # top-level package; the total is the cumulative time of the roots.
+    packages = {}
+    total_us = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        name = name[1:]
+        if not name.startswith(" "):
+            total_us += int(cumulative_us)
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0) + int(self_us)
+
+    slowest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+    total_ms = round(total_us / 1000, 3)
+    return {
+        "module": module,
+        "total_ms": total_ms,
+        "budget_ms": config.startup_import_budget_ms,
+        "within_budget": result.returncode == 0 and total_ms <= config.startup_import_budget_ms,
+        "slowest": [{"package": name, "self_ms": round(us / 1000, 3)} for name, us in slowest],
+        "error": result.stderr.strip().splitlines()[-1] if result.returncode else None,
+    }
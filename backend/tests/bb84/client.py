@@ -1,13 +1,14 @@
 import requests
 import random
 import argparse
-import time
+import json
+import websocket
 from typing import Optional, Dict
 
 SERVER_URL = "http://localhost:4000/quantum"
+WS_URL = "ws://localhost:4000/quantum/ws"
 N_BITS = 256
-MAX_RETRIES = 30  # Maximum number of retries for checking Bob's submission
-RETRY_DELAY = 5   # Seconds to wait between retries
+WAIT_TIMEOUT = 150  # Seconds to wait for the peer before giving up
 
 def generate_bits_and_bases(n: int) -> tuple[str, str]:
     bits = [random.choice(['0', '1']) for _ in range(n)]
@@ -17,33 +18,62 @@ def generate_bits_and_bases(n: int) -> tuple[str, str]:
 def generate_bases(n: int) -> str:
     return ''.join([random.choice(['+', 'x']) for _ in range(n)])
 
-def safe_request(url: str, method: str = 'get', json_data: Optional[Dict] = None) -> Optional[Dict]:
+def safe_request(url: str, method: str = 'get', json_data: Optional[Dict] = None, params: Optional[Dict] = None) -> Optional[Dict]:
     try:
         if method == 'post':
-            response = requests.post(url, json=json_data)
+            response = requests.post(url, json=json_data, params=params)
         else:
-            response = requests.get(url)
+            response = requests.get(url, params=params)
         response.raise_for_status()
         return response.json()
     except requests.exceptions.RequestException as e:
         print(f"Request failed: {e}")
         return None
 
-def wait_for_bob_submission() -> bool:
-    print("Waiting for Bob to submit his bases...")
-    for attempt in range(MAX_RETRIES):
-        key_data = safe_request(f"{SERVER_URL}/generate_key")
-        if key_data and "alice_bases" in key_data:  # Check for successful key generation
-            return True
-        time.sleep(RETRY_DELAY)
-        print(f"Attempt {attempt + 1}/{MAX_RETRIES}: Bob not ready yet...")
-    return False
+def wait_for_event(session_id: str, event: str) -> bool:
+    """Block on the session WebSocket until the server pushes `event`"""
+    try:
+        ws = websocket.create_connection(f"{WS_URL}?session_id={session_id}", timeout=WAIT_TIMEOUT)
+    except (websocket.WebSocketException, OSError) as e:
+        print(f"WebSocket connection failed: {e}")
+        return False
+
+    try:
+        while True:
+            message = json.loads(ws.recv())
+            print(f"Event: {message.get('event')}")
+            if message.get("event") == event:
+                return True
+    except websocket.WebSocketTimeoutException:
+        return False
+    except (websocket.WebSocketException, OSError) as e:
+        print(f"WebSocket error: {e}")
+        return False
+    finally:
+        ws.close()
+
+def print_results(key_data: Dict):
+    print("\n=== Quantum Key Distribution Results ===")
+    print("Alice's bases:", key_data.get("alice_bases", "N/A"))
+    print("Bob's bases:  ", key_data.get("bob_bases", "N/A"))
+    print("Measured bits:", key_data.get("measured_bits", "N/A"))
+    print("Sifted key:   ", key_data.get("sifted_key", "N/A"))
+    print("\nShared key (hex):", key_data.get("shared_key", "N/A"))
+
+def run_alice(session_id: str, new_session: bool = False):
+    if new_session:
+        session = safe_request(f"{SERVER_URL}/session", 'post')
+        if not session:
+            print("Failed to open a key exchange session")
+            return
+        session_id = session["session_id"]
+    print(f"Session id: {session_id} (run Bob with --session {session_id})")
 
-def run_alice():
     bits, bases = generate_bits_and_bases(N_BITS)
+    params = {"session_id": session_id}
     
     # Submit to server
-    response = safe_request(f"{SERVER_URL}/alice/submit", 'post', {"bits": bits, "bases": bases})
+    response = safe_request(f"{SERVER_URL}/alice/submit", 'post', {"bits": bits, "bases": bases}, params)
     if not response:
         print("Failed to submit Alice's data")
         return
@@ -51,39 +81,32 @@ def run_alice():
     print("Alice submission:", response)
     
     # Wait for Bob to submit
-    if not wait_for_bob_submission():
+    print("Waiting for Bob to submit his bases...")
+    if not wait_for_event(session_id, "key_ready"):
         print("Error: Bob did not submit data in time")
         return
     
     # Get final key
-    key_data = safe_request(f"{SERVER_URL}/generate_key")
+    key_data = safe_request(f"{SERVER_URL}/generate_key", params=params)
     if not key_data:
         print("Failed to generate key")
         return
     
-    print("\n=== Quantum Key Distribution Results ===")
-    print("Alice's bases:", key_data.get("alice_bases", "N/A"))
-    print("Bob's bases:  ", key_data.get("bob_bases", "N/A"))
-    print("Measured bits:", key_data.get("measured_bits", "N/A"))
-    print("Sifted key:   ", key_data.get("sifted_key", "N/A"))
-    print("\nShared key (hex):", key_data.get("shared_key", "N/A"))
+    print_results(key_data)
 
-def run_bob():
-    # Check if Alice has submitted data
-    for attempt in range(MAX_RETRIES):
-        check_data = safe_request(f"{SERVER_URL}/check_alice")
-        if check_data and check_data.get("alice_ready"):
-            break
-        time.sleep(RETRY_DELAY)
-        print(f"Attempt {attempt + 1}/{MAX_RETRIES}: Alice not ready yet...")
-    else:
+def run_bob(session_id: str):
+    params = {"session_id": session_id}
+
+    # Wait until Alice has submitted data
+    print("Waiting for Alice to submit her photons...")
+    if not wait_for_event(session_id, "alice_submitted"):
         print("Error: Alice didn't submit data in time")
         return
 
     bases = generate_bases(N_BITS)
     
     # Submit to server
-    response = safe_request(f"{SERVER_URL}/bob/submit", 'post', {"bases": bases})
+    response = safe_request(f"{SERVER_URL}/bob/submit", 'post', {"bases": bases}, params)
     if not response:
         print("Failed to submit Bob's data")
         return
@@ -91,31 +114,30 @@ def run_bob():
     print("Bob submission:", response)
     
     # Get final key
-    key_data = safe_request(f"{SERVER_URL}/generate_key")
+    key_data = safe_request(f"{SERVER_URL}/generate_key", params=params)
     if not key_data:
         print("Failed to generate key")
         return
     
-    print("\n=== Quantum Key Distribution Results ===")
-    print("Alice's bases:", key_data.get("alice_bases", "N/A"))
-    print("Bob's bases:  ", key_data.get("bob_bases", "N/A"))
-    print("Measured bits:", key_data.get("measured_bits", "N/A"))
-    print("Sifted key:   ", key_data.get("sifted_key", "N/A"))
-    print("\nShared key (hex):", key_data.get("shared_key", "N/A"))
+    print_results(key_data)
 
 def main():
     parser = argparse.ArgumentParser(description="Quantum Key Distribution Client")
     parser.add_argument('role', choices=['alice', 'bob'], 
                       help="Run as Alice (initiator) or Bob (receiver)")
+    parser.add_argument('--session', default="default",
+                      help="Key exchange session id (both sides use 'default' if omitted)")
+    parser.add_argument('--new-session', action='store_true',
+                      help="Alice only: open a fresh session and print its id for Bob")
     
     args = parser.parse_args()
     
     if args.role == 'alice':
         print("Running as Alice (Initiator)")
-        run_alice()
+        run_alice(args.session, args.new_session)
     else:
         print("Running as Bob (Receiver)")
-        run_bob()
+        run_bob(args.session)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,48 @@
+"""
+Shared fixtures: the app with its database and drive in a temporary
+directory, and accounts to call it with.
+"""
+
+import os
+import sys
+import tempfile
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC)
+
+import pytest
+import config
+
+
+@pytest.fixture(scope="session")
+def client():
+    root = tempfile.mkdtemp(prefix="safeq-test")
+    for name in ("db", "drive", "thumbs"):
+        os.makedirs(os.path.join(root, name))
+    config.database_location = os.path.join(root, "db")
+    config.drive_location = os.path.join(root, "drive")
+    config.drive_thumbnails = os.path.join(root, "thumbs")
+
+    cwd = os.getcwd()
+    os.chdir(SRC)
+    try:
+        from fastapi.testclient import TestClient
+        import main
+        with TestClient(main.app) as test_client:
+            yield test_client
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.fixture(scope="session")
+def auth_headers(client):
+    """
+    Registers an account and returns its Authorization header.
+    """
+    def login(username: str) -> dict:
+        account = {"username": username, "email": f"{username}@example.com", "password": f"pw-{username}"}
+        assert client.post("/auth/register", json=account).status_code == 200
+        response = client.post("/auth/login", json={"email": account["email"], "password": account["password"]})
+        assert response.status_code == 200
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+    return login
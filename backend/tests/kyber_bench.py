@@ -0,0 +1,58 @@
+"""
+Benchmarks ML-KEM 512 encapsulation/decapsulation: the stock kyber_py calls
+versus the cached contexts in src/kyber.py, and checks both agree.
+
+Usage: python tests/kyber_bench.py [-n 200]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from kyber_py.ml_kem import ML_KEM_512
+import kyber
+
+
+def per_op_ms(func, n: int, repeat: int = 5) -> float:
+    # Best of `repeat` runs, so scheduler noise does not swamp small differences
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best / n * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=200, help="Operations per measurement")
+    parser.add_argument("-r", type=int, default=5, help="Repeats; the best one is reported")
+    args = parser.parse_args()
+    n = args.n
+
+    pk, sk = ML_KEM_512.keygen()
+
+    baseline_encaps = per_op_ms(lambda: [ML_KEM_512.encaps(pk) for _ in range(n)], n, args.r)
+    cached_encaps = per_op_ms(lambda: kyber.encaps_many([pk] * n), n, args.r)
+
+    pairs = kyber.encaps_many([pk] * n)
+    ciphertexts = [c for _, c in pairs]
+    baseline_decaps = per_op_ms(lambda: [ML_KEM_512.decaps(sk, c) for c in ciphertexts], n, args.r)
+    cached_decaps = per_op_ms(lambda: kyber.decaps_many(sk, ciphertexts), n, args.r)
+
+    # Cached paths must be interchangeable with the library
+    assert all(ML_KEM_512.decaps(sk, c) == K for K, c in pairs)
+    K, c = ML_KEM_512.encaps(pk)
+    assert kyber.decaps_many(sk, [c]) == [K]
+    tampered = bytes([c[0] ^ 1]) + c[1:]
+    assert kyber.decaps_many(sk, [tampered]) == [ML_KEM_512.decaps(sk, tampered)]
+
+    print(f"{'operation':<10}{'ML_KEM_512 (ms)':>18}{'cached (ms)':>14}{'speedup':>10}")
+    for name, before, after in (
+        ("encaps", baseline_encaps, cached_encaps),
+        ("decaps", baseline_decaps, cached_decaps),
+    ):
+        print(f"{name:<10}{before:>18.3f}{after:>14.3f}{before / after:>9.2f}x")
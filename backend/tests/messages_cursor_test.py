@@ -0,0 +1,39 @@
+"""
+Malformed message history cursors are rejected with 400 instead of failing
+with a 500 once their values reach the query.
+
+Usage: python -m pytest tests/messages_cursor_test.py
+"""
+
+import base64
+import json
+import pytest
+
+
+def _cursor(*values) -> str:
+    # Well-formed envelope (base64url JSON list), arbitrary values
+    return base64.urlsafe_b64encode(json.dumps(list(values)).encode()).decode().rstrip("=")
+
+
+@pytest.fixture(scope="module")
+def headers(auth_headers):
+    return auth_headers("cursor")
+
+
+@pytest.mark.parametrize("cursor", [
+    _cursor("nope", 1),  # not an ISO timestamp
+    _cursor(5, 1),  # timestamp of the wrong type
+    _cursor("2026-01-01T00:00:00+00:00", "1"),  # id that is not an integer
+    "not-a-cursor",
+])
+def test_malformed_cursor_is_rejected(client, headers, cursor):
+    response = client.get("/messages/get_messages", params={"cursor": cursor}, headers=headers)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+def test_valid_cursor_is_accepted(client, headers):
+    cursor = _cursor("2026-01-01T00:00:00+00:00", 1)
+    response = client.get("/messages/get_messages", params={"cursor": cursor}, headers=headers)
+    assert response.status_code == 200
+    assert response.json() == []
@@ -0,0 +1,124 @@
+"""
+Upgrades a database created by the original schema (file and folder tables
+without folder_path / parent_path) to the current models, the way a deployed
+server is started: register_tortoise's generate_schemas() first, then init_db().
+
+Usage: python -m pytest tests/schema_upgrade_test.py
+"""
+
+import asyncio
+import os
+import sqlite3
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from tortoise import Tortoise
+
+BASELINE_SCHEMA = """
+CREATE TABLE "account" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "username" VARCHAR(50) NOT NULL UNIQUE,
+    "email" VARCHAR(100) NOT NULL UNIQUE,
+    "password_hash" VARCHAR(128) NOT NULL,
+    "kyber_public_key" BLOB,
+    "kyber_private_key_enc" BLOB,
+    "kyber_salt" BLOB,
+    "dilithium_public_key" BLOB,
+    "dilithium_private_key_enc" BLOB
+);
+CREATE TABLE "file" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "name" VARCHAR(255) NOT NULL,
+    "path" VARCHAR(1024) NOT NULL,
+    "size" INT NOT NULL DEFAULT 0,
+    "created_at" TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "updated_at" TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "is_starred" INT NOT NULL DEFAULT 0,
+    "is_shared" INT NOT NULL DEFAULT 0,
+    "mime_type" VARCHAR(100) NOT NULL DEFAULT '',
+    "version" INT NOT NULL DEFAULT 1,
+    "encryption_status" VARCHAR(20) NOT NULL DEFAULT 'unencrypted',
+    "quantum_key_id" VARCHAR(36),
+    "ai_suggestions" JSON NOT NULL,
+    "share_links" JSON NOT NULL,
+    "encryption_key_ciphertext" BLOB,
+    "nonce" BLOB,
+    "tag" BLOB,
+    "content_signature" BLOB,
+    "metadata_signature" BLOB,
+    "content_hash" VARCHAR(64),
+    "owner_id" INT NOT NULL REFERENCES "account" ("id") ON DELETE CASCADE
+);
+CREATE TABLE "folder" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "name" VARCHAR(255) NOT NULL,
+    "path" VARCHAR(1024) NOT NULL,
+    "created_at" TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "owner_id" INT NOT NULL REFERENCES "account" ("id") ON DELETE CASCADE
+);
+CREATE TABLE "message" (
+    "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+    "content" TEXT NOT NULL,
+    "created_at" TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "receiver_id_id" INT NOT NULL REFERENCES "account" ("id") ON DELETE CASCADE,
+    "sender_id_id" INT NOT NULL REFERENCES "account" ("id") ON DELETE CASCADE
+);
+INSERT INTO "account" (username, email, password_hash) VALUES ('alice', 'alice@example.com', 'x');
+INSERT INTO "file" (name, path, ai_suggestions, share_links, owner_id) VALUES ('a.txt', '/tmp/a', '[]', '[]', 1);
+"""
+
+
+def _column_indexes(db_path: str, table: str, column: str) -> list:
+    # Indexes that really cover `column` (an index on a string literal has cid -2)
+    with sqlite3.connect(db_path) as conn:
+        names = [row[1] for row in conn.execute(f'PRAGMA index_list("{table}")')]
+        return [
+            name for name in names
+            if column in (row[2] for row in conn.execute(f'PRAGMA index_info("{name}")'))
+        ]
+
+
+async def _start(db_url: str):
+    from db import init_db  # imported late: db builds its default URL from config at import
+    # register_tortoise(generate_schemas=True) runs before the app lifespan
+    await Tortoise.init(db_url=db_url, modules={"models": ["models"]})
+    await Tortoise.generate_schemas()
+    await init_db(db_url)
+
+
+async def _upgrade(db_path: str):
+    from models import File, Folder
+    db_url = f"sqlite://{db_path}"
+    await _start(db_url)
+    try:
+        assert await File.filter(owner_id=1, folder_path="/").values_list("name", flat=True) == ["a.txt"]
+        await Folder.create(owner_id=1, name="docs", path="/docs", parent_path="/")
+        assert await Folder.filter(owner_id=1, parent_path="/").count() == 1
+    finally:
+        await Tortoise.close_connections()
+
+    # A second start finds nothing left to upgrade
+    await _start(db_url)
+    await Tortoise.close_connections()
+
+
+def test_upgrade_baseline_database(tmp_path):
+    db_path = str(tmp_path / "baseline.sqlite3")
+    with sqlite3.connect(db_path) as conn:
+        conn.executescript(BASELINE_SCHEMA)
+
+    # In a child process: Tortoise is process-global and the app fixture owns it here
+    result = subprocess.run([sys.executable, __file__, db_path], capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+
+    assert _column_indexes(db_path, "file", "folder_path")
+    assert _column_indexes(db_path, "folder", "parent_path")
+    with sqlite3.connect(db_path) as conn:
+        unique = [row for row in conn.execute('PRAGMA index_list("folder")') if row[2]]
+    assert len(unique) == 1
+
+
+if __name__ == "__main__":
+    asyncio.run(_upgrade(sys.argv[1]))
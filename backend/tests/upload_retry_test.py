@@ -0,0 +1,73 @@
+"""
+Resending a resumable-upload chunk whose seal failed part way: the same body
+is resealed (identical ciphertext under the same nonces), a different body
+is refused so no segment nonce is ever used for two plaintexts.
+
+Usage: python -m pytest tests/upload_retry_test.py
+"""
+
+import os
+import pytest
+import config
+
+
+@pytest.fixture(scope="module")
+def headers(auth_headers):
+    return auth_headers("retry")
+
+
+@pytest.fixture
+def failing_seal(monkeypatch):
+    """
+    Makes the next chunk seal write its first segment, then fail.
+    """
+    from routes import files_route
+    seal = files_route._seal_chunk
+
+    def seal_first_segment(path, file_key, header, segment_size, first_segment, last_segment, data):
+        monkeypatch.setattr(files_route, "_seal_chunk", seal)
+        seal(path, file_key, header, segment_size, first_segment, last_segment, data[:segment_size])
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(files_route, "_seal_chunk", seal_first_segment)
+
+
+def _start_upload(client, headers, monkeypatch, name: str, body: bytes) -> tuple[str, int]:
+    monkeypatch.setattr(config, "upload_chunk_segments", 2)
+    response = client.post("/drive/uploads", json={"filename": name, "size": len(body)}, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()["upload_id"], response.json()["chunk_size"]
+
+
+def test_failed_chunk_is_resealed_with_the_same_body(client, headers, monkeypatch, failing_seal):
+    body = os.urandom(config.drive_segment_size * 3 + 100)
+    upload_id, chunk_size = _start_upload(client, headers, monkeypatch, "retry.bin", body)
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+
+    with pytest.raises(OSError):
+        client.put(f"/drive/uploads/{upload_id}/chunks/0", content=chunks[0], headers=headers)
+    status = client.get(f"/drive/uploads/{upload_id}", headers=headers).json()
+    assert status["missing"] == [0, 1]
+
+    for index, chunk in enumerate(chunks):
+        response = client.put(f"/drive/uploads/{upload_id}/chunks/{index}", content=chunk, headers=headers)
+        assert response.status_code == 200, response.text
+        assert response.json()["status"] == "stored"
+
+    response = client.post(f"/drive/uploads/{upload_id}/commit", headers=headers)
+    assert response.status_code == 200, response.text
+    file_id = response.json()["newFiles"][0]["id"]
+    assert client.get(f"/drive/download_encrypted/{file_id}", headers=headers).content == body
+
+
+def test_failed_chunk_refuses_a_different_body(client, headers, monkeypatch, failing_seal):
+    body = os.urandom(config.drive_segment_size * 3)
+    upload_id, chunk_size = _start_upload(client, headers, monkeypatch, "other.bin", body)
+
+    with pytest.raises(OSError):
+        client.put(f"/drive/uploads/{upload_id}/chunks/0", content=body[:chunk_size], headers=headers)
+
+    other = os.urandom(chunk_size)
+    response = client.put(f"/drive/uploads/{upload_id}/chunks/0", content=other, headers=headers)
+    assert response.status_code == 409
+    assert client.get(f"/drive/uploads/{upload_id}", headers=headers).json()["missing"] == [0, 1]